@@ -12,43 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from six.moves import tkinter as tk
-from grakn.client import GraknClient
-import datetime
+from background_jobs import BackgroundJobs
+from centrality import CentralityCache
+from map_scene import MapScene
+from network_model import NetworkModel
+from path_tables import PathTables
+from query_profiler import PROFILER
+from routing import Router
+from spatial_index import GridIndex
+import threading
+import time
 import random
-import geopy.distance
 import sys
 
 
-def transform_to_range(val, old_min, old_max, new_min, new_max):
-    """
-    Transform a value from an old range to a new range
-    :return: scaled value
-    """
-    old_range = (old_max - old_min)
-    new_range = (new_max - new_min)
-    new_val = (((val - old_min) * new_range) / old_range) + new_min
-    return new_val
-
-
-def transform_coords(lon, lat, min_lon, max_lon, min_lat, max_lat, new_width, new_height):
-    """
-    Transforms grid coordinates to a coordinate system that can be easily rendered.
-    :param lon: longitude of the coordinates to scale
-    :param lat: latitude of the coordinates to scale
-    :param min_lon: the minimum longitude, which will be mapped to x = 0
-    :param max_lon: the maximum longitude, which will be mapped to x = new_width
-    :param min_lat: the minimum latitude, which will be mapped to y = 0
-    :param max_lat: the minimum latitude, which will be mapped to y = new_height
-    :param new_width: the maximum height of the coordinates to map to
-    :param new_height: the maximum width of the coordinates to map to
-    :return:
-    """
-    lon = transform_to_range(lon, min_lon, max_lon, 0, new_width)
-    lat = new_height - transform_to_range(lat, min_lat, max_lat, 0, new_height)
-    return lon, lat
-
-
 def _create_circle(self, x, y, r, **kwargs):
     """
     Helper function for easily drawing circles with tkinter, rather than ovals
@@ -61,15 +38,55 @@ def _create_circle(self, x, y, r, **kwargs):
     return self.create_oval(x-r, y-r, x+r, y+r, **kwargs)
 
 
-def execute_and_log(query, transaction):
-    # print("\n" + ";\n".join(query.split(";")).replace("match", "match\n"))
-    response = transaction.query(query)
-    # print("... query complete.")
-    return response
+# Tkinter is only imported once a window is opened, so that importing this module needs neither Tk nor a display
+tk = None
 
 
-# Attach the circle helper function to tkinter so that we can use it more naturally
-tk.Canvas.create_circle = _create_circle
+def _load_tk():
+    global tk
+    if tk is None:
+        from six.moves import tkinter
+        # Attach the circle helper function to tkinter so that we can use it more naturally
+        tkinter.Canvas.create_circle = _create_circle
+        tk = tkinter
+    return tk
+
+
+def find_shortest_path(network, ids, weight="distance", routing_mode="shortest", router=None, path_tables=None,
+                       path_tables_lock=None):
+    """
+    Find the path between two stations without querying Grakn, and without Tk nor a window. In the "shortest" routing
+    mode the path is walked through the precomputed path tables, otherwise it comes from a transfer-aware itinerary
+    whose legs are printed.
+    :param network: network_model.NetworkModel
+    :param ids: Grakn ids of the origin and destination stations
+    :param weight: "distance" or "hops"
+    :param routing_mode: one of TubeGui.ROUTING_MODES
+    :param router: routing.Router of the network, created if None
+    :param path_tables: dictionary weight -> PathTables, the tables of the weight are loaded or built into it if missing
+    :param path_tables_lock: lock held while filling path_tables, when it is shared between threads
+    :return: a routing.Path, or None if there is no path
+    """
+    start = time.perf_counter()
+    origin = network.station(ids[0]).index
+    destination = network.station(ids[1]).index
+    if routing_mode == "shortest":
+        path_tables = path_tables if path_tables is not None else {}
+        with path_tables_lock or threading.Lock():
+            if weight not in path_tables:
+                path_tables[weight] = PathTables.load_or_build(network, weight)
+        path = path_tables[weight].path(origin, destination)
+    else:
+        itinerary = (router or Router(network)).itinerary(origin, destination, weight, routing_mode)
+        path = None if itinerary is None else itinerary.path()
+    print("Path computed in " + "%.3f" % ((time.perf_counter() - start) * 1000) + " ms (" + routing_mode + ")")
+    if path is None:
+        print("CHEMIN NON TROUVÉ / NON DISPONIBLE")
+    elif routing_mode != "shortest":
+        print("Itinerary with " + str(itinerary.transfers) + " changes :")
+        for instruction in itinerary.describe():
+            print("  " + instruction)
+    return path
 
 
 class TubeGui:
@@ -78,53 +95,72 @@ class TubeGui:
     ZOOM_IN_SCALE = 2
     ZOOM_OUT_SCALE = 1/ZOOM_IN_SCALE
 
-    # Size attributes
-    SEINE_WIDTH = 10
-    STATION_FONT_SIZE = 5
-    STATION_CIRCLE_RADIUS = 3
-    STATION_K_CORE_MAX_RADIUS = 15
+    # Size attributes, the drawing rules shared with the headless renderer live in map_scene.MapScene
+    SEINE_WIDTH = MapScene.SEINE_WIDTH
+    STATION_FONT_SIZE = MapScene.STATION_FONT_SIZE
+    STATION_CIRCLE_RADIUS = MapScene.STATION_CIRCLE_RADIUS
+    STATION_K_CORE_MAX_RADIUS = MapScene.STATION_K_CORE_MAX_RADIUS
 
-    STATION_DEGREE_MAX_RADIUS = 17
+    STATION_DEGREE_MAX_RADIUS = MapScene.STATION_DEGREE_MAX_RADIUS
     ROUTES_DEGREE_MAX_RADIUS = 8
-    TUNNEL_SHORTEST_PATH_WIDTH = 20
+    TUNNEL_SHORTEST_PATH_WIDTH = MapScene.TUNNEL_SHORTEST_PATH_WIDTH
     # Station connections
-    LINE_WIDTH = 2
-    LINE_SPACING = 0.5
+    LINE_WIDTH = MapScene.LINE_WIDTH
+
+    # Only the map items within the window plus this margin (in pixels) are kept on the canvas
+    VIEWPORT_MARGIN = 200
+    # A shift-click selects the nearest station within this distance, in pixels on the screen
+    STATION_PICK_RADIUS = 8
+    # Side of the cells of the spatial index of the stations, in map coordinates
+    STATION_GRID_CELL_SIZE = 20
+    # Canvas tags, from the lowest to the highest in the stacking order (the Seine stays below all of them)
+    STACKING_ORDER = ["path_background", "segment", "overlay", "path", "station", "label"]
 
     # Color attributes
-    SEINE_COLOR = "#def"
-    STATION_K_CORE_COLOUR = "#AAF"
-    STATION_DEGREE_COLOUR = "#FF4821"
-    TUNNEL_SHORTEST_PATH_COLOUR = "#DDD"
+    SEINE_COLOR = MapScene.SEINE_COLOR
+    STATION_K_CORE_COLOUR = MapScene.STATION_K_CORE_COLOUR
+    STATION_DEGREE_COLOUR = MapScene.STATION_DEGREE_COLOUR
+    TUNNEL_SHORTEST_PATH_COLOUR = MapScene.TUNNEL_SHORTEST_PATH_COLOUR
+    TUBE_LINE_COLOURS = MapScene.TUBE_LINE_COLOURS
 
     # Hotkeys
     STATION_K_CORE_KEY = "k"
     STATION_ROUTE_KEY = "r"
     CLEAR_SHORTEST_PATH_KEY = "q"
     CLEAR_ALL_KEY = "c"
-
-    # Used in calculating aspect ratio
-    COMPUTE_MIN_LAT = "compute min of lat, in station;"
-    COMPUTE_MAX_LAT = "compute max of lat, in station;"
-    COMPUTE_MIN_LON = "compute min of lon, in station;"
-    COMPUTE_MAX_LON = "compute max of lon, in station;"
-
-    COMPUTE_CENTRALITY_TUNNEL_KCORE = "compute centrality of station, using k-core;"
-    COMPUTE_CENTRALITY_ROUTE_KCORE = "compute centrality of station, in [station, route], using k-core;"
-    ANALYTICAL_QUERIES = [COMPUTE_CENTRALITY_TUNNEL_KCORE,
-        COMPUTE_CENTRALITY_ROUTE_KCORE]
-
-    def __init__(self, session, root=tk.Tk()):
+    ROUTING_MODE_KEY = "t"
+    QUERY_PROFILE_KEY = "p"
+
+    # Routing modes, cycled with ROUTING_MODE_KEY: shortest distance, distance plus a penalty per change of line,
+    # fewest changes of line
+    ROUTING_MODES = ["shortest", "penalty", "fewest_transfers"]
+
+    # Centrality measures of the overlays, and the lowest score drawn
+    CENTRALITY_K_CORE = MapScene.CENTRALITY_K_CORE
+    CENTRALITY_DEGREE = MapScene.CENTRALITY_DEGREE
+    CENTRALITY_MINIMUM_SCORES = MapScene.CENTRALITY_MINIMUM_SCORES
+
+    # Kinds of background jobs, a new job of a kind cancels the one still in flight
+    PATH_JOB = "path"
+    CENTRALITY_JOB = "centrality"
+    PATH_TABLES_JOB = "path_tables"
+    # Progress indicator, in the bottom left corner of the window while background jobs are running
+    STATUS_COLOUR = "#333"
+    STATUS_BACKGROUND_COLOUR = "#FFD"
+
+    def __init__(self, connection=None, root=None):
         """
             Main visualisation class. Builds an interactive map of the Paris tube.
-            :param root:
-            :param client:
+            :param connection: grakn_connection.GraknConnection to the keyspace, opened on first use if None
+            :param root: Tk root window, created if None
         """
 
-        start_time = datetime.datetime.now()
+        start_time = time.perf_counter()
 
-        self._root = root
-        self._session = session
+        _load_tk()
+        self._root = root if root is not None else tk.Tk()
+        self._connection = connection
+        self._owns_connection = False
         self.w, self.h = self._root.winfo_screenwidth(), self._root.winfo_screenheight()
         self._root.geometry("%dx%d+0+0" % (self.w, self.h))
         self._root.focus_set()
@@ -135,200 +171,125 @@ class TubeGui:
         self._canvas.bind("<ButtonPress-1>", self._scan_start)
         self._canvas.bind("<ButtonRelease-1>", self._scan_stop)
         self._canvas.bind("<B1-Motion>", self._scan_move)
+        # One handler for the whole canvas selects stations, with the spatial index built in _build_scene
+        self._canvas.bind("<Shift-ButtonPress-1>", self._on_canvas_click)
         # Stretch canvas to root window size.
         self._canvas.pack(fill=tk.BOTH, expand=1)
+        self._status = tk.Label(self._root, fg=self.STATUS_COLOUR, bg=self.STATUS_BACKGROUND_COLOUR, padx=6, pady=2)
 
-        # We want to scale the longitude and lonitude to fit the image
-        # To do this we need the minimum and maximum of the longitude and latitude,
-        # we can query for this easily in Grakn!
-        with session.transaction().read() as transaction:
-            self.min_lat = list(execute_and_log(
-                self.COMPUTE_MIN_LAT, transaction))[0].number()
-            print("Compute min of lat")
-            print("Result :")
-            print(self.min_lat)
-
-            self.max_lat = list(execute_and_log(
-                self.COMPUTE_MAX_LAT, transaction))[0].number()
-            print("Compute max of lat")
-            print("Result :")
-            print(self.max_lat)
-
-            self.min_lon = list(execute_and_log(
-                self.COMPUTE_MIN_LON, transaction))[0].number()
-            print("Compute min of lon")
-            print("Result :")
-            print(self.min_lon)
-
-            self.max_lon = list(execute_and_log(
-                self.COMPUTE_MAX_LON, transaction))[0].number()
-            print("Compute max of lon")
-            print("Result :")
-            print(self.max_lon)
-
-        # aspect ratio as width over height, which is longitude over latitude
-        aspect_ratio = (self.max_lon - self.min_lon) / \
-                        (self.max_lat - self.min_lat)
-        self.new_width = self.w
-        self.new_height = self.new_width / aspect_ratio
+        # Path searches and centrality overlays run on a thread pool, their results come back through root.after
+        self._jobs = BackgroundJobs(self._root, on_busy=self._show_progress)
+
+        # The whole network is loaded once, every station and route lookup is then answered from memory. It comes from
+        # the local cache while the keyspace has not been loaded again, without even connecting to Grakn.
+        if connection is not None:
+            self._network = NetworkModel.load_cached(self.get_connection, connection.uri, connection.keyspace)
+        else:
+            self._network = NetworkModel.load_cached(self.get_connection)
+        # Shortest paths are computed locally over the routes of the network model
+        self._router = Router(self._network)
+        # All-pairs shortest paths of each weight, loaded from disk or rebuilt when the data changed. Rebuilding them is
+        # slow: the distance tables are prepared in the background from the start, and the tables of another weight
+        # by the first path search that needs them, only once
+        self._path_tables = {}
+        self._path_tables_lock = threading.Lock()
+        self._jobs.submit(self.PATH_TABLES_JOB, "Preparing the path tables",
+                          lambda: self._prepare_path_tables("distance"), lambda tables: None)
+        # Degree and k-core of every station, computed locally and cached for this version of the network
+        self._centrality = CentralityCache(self._network)
+
+        # Map coordinates of the Seine, the tunnels and the stations, scaled to fit the width of the screen
+        print("\nProjecting stations and tunnels ...")
+        self._scene = MapScene(self._network, self.w)
+        self.min_lat, self.max_lat, self.min_lon, self.max_lon = \
+            self._scene.min_lat, self._scene.max_lat, self._scene.min_lon, self._scene.max_lon
+        print("Bounds: lat " + str(self.min_lat) + " -> " + str(self.max_lat) +
+              ", lon " + str(self.min_lon) + " -> " + str(self.max_lon))
+        self.new_width = self._scene.new_width
+        self.new_height = self._scene.new_height
 
         # We need to associate the id of the station entity in Grakn to the rendered dot on the screen, so that we can
         # find the Grakn id of a station that is clicked on
         self._station_point_ids = dict()
         # Also store the station coords so that we don't have to query Grakn for them again
         self._station_canvas_coords = dict()
-        self._station_centrality_points = dict()
-
-        self._draw()
+        # Canvas elements of every centrality overlay already drawn, hidden rather than deleted so that it can come back
+        self._centrality_overlays = dict()
 
-        # self._draw_stations()
+        # Map items currently on the canvas, created and deleted as the viewport and the zoom change
+        self._segment_items = dict()
+        self._station_items = dict()
+        self._label_items = dict()
+        self._render_pending = False
 
         # ===== Event state variables =====
-        self._displaying_centrality = False
+        self._displaying_centrality = None
         self._scale = 1
         self._shortest_path_stations = []
         self._shortest_path_elements = []
+        self._routing_mode = self.ROUTING_MODES[0]
         self._scan_delta = (0, 0)
         self._x_pos = 0
         self._y_pos = 0
         self._scanning = False
 
-        end_time = datetime.datetime.now()
-        print("- - - - - -\nTime taken: " + str(end_time - start_time))
+        self._draw()
 
-    @staticmethod
-    def get_visualisation_data(session):
+        # Process the pending geometry and redraw events, so that the first frame is on the screen
+        self._root.update_idletasks()
+        print("- - - - - -\nTime to first frame: " + "%.2f" % (time.perf_counter() - start_time) + " s")
 
+    def _prepare_path_tables(self, weight):
         """
-        Retrieve the data required for visualising the tube network
-        :return: coordinates of all stations and their names
+        Load or build the path tables of a weight if they are not there yet, on a background thread
         """
+        with self._path_tables_lock:
+            if weight not in self._path_tables:
+                self._path_tables[weight] = PathTables.load_or_build(self._network, weight)
+            return self._path_tables[weight]
 
-        with session.transaction().read() as transaction:
-            print("\nRetriving coordinates to draw stations and tunnels ...")
-            coordinates = {}
-            id = 0
-
-            #This request is used to get all pairs of stations that are connected by a route
-            #We match all route in the db and get the line and the two connected stations
-            answers_iterator = execute_and_log(
-                ' match $route ($sta1, $sta2) isa route, has station_ligne $ligne; get $sta1, $sta2, $ligne ;', transaction
-            )
-
-            for answer in answers_iterator:
-                tube_line_name = answer.get('ligne').value()
-                station1 = answer.get('sta1').id
-                station2 = answer.get('sta2').id
-
-                #Now we match and get all the information from the two connected stations (thanks to their ids)
-                origin_iterator = execute_and_log(
-                    'match $station1 id ' + station1+', has name $origin ,has station_id $id_beginning, has lat $lat1, has lon $lon1; get $id_beginning,$origin, $lat1, $lon1;', transaction)
-                end_iterator = execute_and_log(
-                    'match $station2 id '+station2+', has name $destination, has station_id $id_end, has lat $lat2, has lon $lon2; get $id_end,$destination, $lat2, $lon2;', transaction)
-                id = id + 1
-
-
-                for origin1 in origin_iterator:
-                    origin = origin1.get('origin').value()
-                    lon1, lat1 = origin1.get(
-                        'lon1').value(), origin1.get('lat1').value()
-                    id_beginning = origin1.get("id_beginning").value()
-
-                for end1 in end_iterator:
-                    destination = end1.get('destination').value()
-                    lon2, lat2 = end1.get(
-                        'lon2').value(), end1.get('lat2').value()
-                    id_end = end1.get("id_end").value()
-
-                #And we append the results in the dict with all the others
-                coordinates[id] = {
-                    "station_ligne": [tube_line_name],
-                    "from": {
-                        "lon": lon1,
-                        "lat": lat1,
-                        "station_name": origin,
-                        "station_id": id_beginning
-
-                    },
-                    "to": {
-                        "lon": lon2,
-                        "lat": lat2,
-                        "station_name": destination,
-                        "station_id": id_end
-                    }
-                }
-        return coordinates
+    def get_connection(self):
+        """
+        :return: the connection to Grakn, opened and grakn_connection imported on first use
+        """
+        if self._connection is None:
+            from grakn_connection import get_connection
+            self._connection = get_connection()
+            self._owns_connection = True
+        return self._connection
 
-    @staticmethod
-    def find_shortest_path(session, ids):
-
-        with session.transaction().read() as transaction:
-
-            query = 'compute path from ' + ids[0] + ', to ' + ids[1] + ';'
-            try:
-                shortest_path_concept_list = list(
-                    execute_and_log(query, transaction))[0]
-
-                # The response contains the different permutations for each path through stations. We are interested only in
-                # which stations the path passes through
-                shortest_path_ids = []
-                for shortest_path_node_id in shortest_path_concept_list.list():
-                    concepts_list = list(transaction.query(
-                        "match $sta id " + shortest_path_node_id + "; $sta has name $nam; get;"))
-                    if len(concepts_list) > 0:
-                        concept = concepts_list[0]
-                        if concept.map().get("sta").type().label() == 'station':
-                            shortest_path_ids.append(shortest_path_node_id)
-                return shortest_path_ids
-            except:
-                print("CHEMIN NON TROUVÉ / NON DISPONIBLE")
+    def close(self):
+        """
+        Stop the background jobs, and close the connection to Grakn if it was opened by the map
+        """
+        self._jobs.shutdown()
+        if self._owns_connection:
+            self._connection.close()
 
     @staticmethod
-    def compute_centrality(session, query):
-        centrality_details = {
-            "centrality_set": [],
-            "max_score": 0
-        }
-
-        with session.transaction().read() as transaction:
-            centralities = list(execute_and_log(query, transaction))
-            # Find the max centrality value, that way we can scale the visualisation up to a maximum radius
-            centrality_details["max_score"] = max(
-                [int(centrality.measurement()) for centrality in centralities])
+    def get_visualisation_data(connection):
 
-            for centrality in centralities:
-                centrality_set = {
-                    "measurement": centrality.measurement(),
-                    "concept_ids": []
-                }
-
-                for concept_id in centrality.set():
-                    centrality_set["concept_ids"].append(concept_id)
-
-                centrality_details["centrality_set"].append(centrality_set)
-
-        print(centrality_details)
+        """
+        Retrieve the data required for visualising the tube network
+        :return: coordinates of all stations and their names
+        """
 
-        return centrality_details
+        print("\nRetriving coordinates to draw stations and tunnels ...")
+        return NetworkModel.load(connection).visualisation_data()
 
+    def find_shortest_path(self, ids, weight="distance", routing_mode=None):
+        """
+        Find the path between two stations with the router and the path tables of the map, see find_shortest_path.
+        Does not touch the canvas, so that it can run on a background thread.
+        :param routing_mode: one of ROUTING_MODES, the current routing mode of the map by default
+        """
+        return find_shortest_path(self._network, ids, weight, routing_mode or self._routing_mode, self._router,
+                                  self._path_tables, self._path_tables_lock)
 
     def Draw_seine(self):
 
-        # Grid coordinates of a path along the centre-line of La Seine in Paris
-        SEINE_waypoint = ((48.772773, 2.411356),(48.776891, 2.414646),(48.780865, 2.417483),(48.789266, 2.422638),(48.796402, 2.420453),(48.803774, 2.411313),(48.810861, 2.409492),(48.817982, 2.405901),(48.822129, 2.395588),(48.827270, 2.387981),(48.833969, 2.379891),(48.839630, 2.373289),(48.841611, 2.370717),(48.844485, 2.366576),
-            (48.846830, 2.363550),(48.850086, 2.357603),(48.852350, 2.352977),(48.854405, 2.347717),(48.856159, 2.343282),(48.858270, 2.3384868),(48.859230, 2.334001),(48.860105, 2.330278),
-            (48.862279, 2.323819),(48.863648, 2.318809),(48.863739, 2.313971),(48.863626, 2.310742),(48.863668, 2.308489),(48.863569, 2.303575),(48.863421, 2.300507),(48.861685, 2.294263),
-            (48.859483, 2.291173),(48.857351, 2.288748),(48.855614, 2.286731),(48.854124, 2.285014),(48.852540, 2.282690),(48.850782, 2.280297),(48.849389, 2.278434),(48.847447, 2.276385),
-            (48.845534, 2.274261),(48.842688, 2.271418),(48.838428, 2.267431),(48.834586, 2.263558),(48.830250, 2.258462),(48.824797, 2.249568),(48.823117, 2.237919),(48.830194, 2.226450),
-            (48.839076, 2.222887),(48.849427, 2.225365),(48.862338, 2.226384),(48.872883, 2.237832),(48.885122, 2.253422),(48.885122, 2.253422),(48.902401, 2.283997),(48.908843, 2.298647),(48.916216, 2.320786),(48.929868, 2.337285),(48.943158, 2.336514),(48.950066, 2.305815),(48.947636, 2.272512),)
-
-        scaled_thames_coords = []
-        for lat, lon in SEINE_waypoint:
-            lon, lat = self._transform_coords(lon, lat)
-            scaled_thames_coords.append((lon, lat))
-
         self._canvas.create_line(
-            *scaled_thames_coords,
+            *self._scene.seine.ravel().tolist(),
             width=self.SEINE_WIDTH,
             fill=self.SEINE_COLOR,
             joinstyle=tk.ROUND
@@ -337,17 +298,14 @@ class TubeGui:
     def _transform_coords(self, lon, lat):
 
         """
-        Transfrom grid coordinates to canvas coordinates
+        Transfrom grid coordinates to canvas coordinates, for single values or whole NumPy arrays at once
         :param lon: grid coordinate longitude
         :param lat: grid coordinate latitude
         :return: transformed coordination
         """
 
-        return transform_coords(
-            lon, lat, self.min_lon, self.max_lon, self.min_lat, self.max_lat, self.new_width, self.new_height
-        )
+        return self._scene.transform(lon, lat)
 
-    
     def _draw(self):
 
         """
@@ -356,121 +314,130 @@ class TubeGui:
 
         print("\nDrawing ...")
         self.Draw_seine()
-        coordinates = self.get_visualisation_data(self._session)
+        self._build_scene()
+        self._render()
+        print("\nDone! you can now interact with the visualiser.")
 
-        drawn_station_name = []
-        
-        for  tube_id,details in coordinates.items():
-
-            TUBE_LINE_COLOURS = {
-                "M1": "#FFCD00",
-                "M2": "#003CA6",
-                "M3": "#837902",
-                "M4": "#CF009E",
-                "M5": "#FF7E2E",
-                "M6": "#6ECA97",
-                "M7": "#FA9ABA",
-                "M7 bis": "#6ECA97",
-                "M7b": "#6ECA97",
-                "M8": "#E19BDF",
-                "M9": "#B6BD00",
-                "M10": "#C9910D",
-                "M11": "#704B1C",
-                "M12": "#007852",
-                "M13": "#6EC4E8",
-                "M14": "#62259D",
-                "3 bis": "#6EC4E8",
-                "M3 bis": "#6EC4E8",
-                "M3b": "#6EC4E8",
-            }
-
-            print("Drawing tunnels..")
-
-            # Draw tunnels
-            for i, tube_line_name in enumerate(details["station_ligne"]):
-
-                print(i,tube_line_name)
-                # Trigonometry to draw parallel lines with consistent distance between them
-                from_lon, from_lat = self._transform_coords(float(details["from"]["lon"]), float(details["from"]["lat"]))
-                to_lon, to_lat = self._transform_coords(float(details["to"]["lon"]), float(details["to"]["lat"]))
-
-                x = to_lon - from_lon
-                y = to_lat - from_lat
-                coords_1 = (float(details["from"]["lat"]),float(details["from"]["lon"]))
-                coords_2 = (float(details["to"]["lat"]),float(details["to"]["lon"]))
-                z = self.LINE_SPACING  # desired orthogonal displacement of parallel lines
-                    
-                grad = y / x  # gradient of the connection to draw
-
-
-                # The change in coordinates needed to achieve this
-                y = ((grad ** 2 + 1) ** -0.5) * z
-                x = grad * y
-
-                self._canvas.create_line(
-                    from_lon - (i * x),
-                    from_lat + (i * y),
-                    to_lon - (i * x),
-                    to_lat + (i * y),
-                    fill=TUBE_LINE_COLOURS[tube_line_name],
-                    width=self.LINE_WIDTH
-                )
-            
-            print("All tunnels drawn..")
-
-            
-            
-            print("Drawing stations on the map..")
-        
+    def _build_scene(self):
+
+        """
+        Takes the map coordinates (the canvas coordinates at scale 1) of every tunnel and station from the scene, and
+        indexes the stations for the clicks. Nothing is drawn here, _render creates the canvas items of the ones that
+        are visible.
+        """
+
+        scene = self._scene
+        self._projection = scene.projection
+        self._segments = scene.segments
+        self._segment_colours = scene.segment_colours
+        self._station_points = scene.station_points
+        self._station_canvas_coords = scene.station_coords
+        self._station_xy = scene.station_xy
+        self._station_major = scene.station_major
+
+        self._station_grid = GridIndex(self._station_xy.tolist(), self.STATION_GRID_CELL_SIZE)
+
+        print(str(len(self._segments)) + " tunnels and " + str(len(self._station_points)) + " stations to draw..")
+
+    def _visible_area(self):
+        """
+        :return: left, top, right, bottom of the window plus VIEWPORT_MARGIN, in map coordinates
+        """
+        width = self._canvas.winfo_width()
+        height = self._canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            # The window is not mapped yet
+            width, height = self.w, self.h
+        left = self._canvas.canvasx(0) - self.VIEWPORT_MARGIN
+        top = self._canvas.canvasy(0) - self.VIEWPORT_MARGIN
+        right = self._canvas.canvasx(width) + self.VIEWPORT_MARGIN
+        bottom = self._canvas.canvasy(height) + self.VIEWPORT_MARGIN
+        return left / self._scale, top / self._scale, right / self._scale, bottom / self._scale
+
+    def _schedule_render(self):
+        """
+        Render once the pending events are processed, so that a fast pan renders only once per burst of motion events
+        """
+        if not self._render_pending:
+            self._render_pending = True
+            self._root.after_idle(self._render)
+
+    def _render(self):
+
+        """
+        Level-of-detail rendering: creates the canvas items of the tunnels and stations within the visible area, and
+        deletes those that left it. Labels and minor stations are only drawn once the map is zoomed in enough.
+        """
+
+        self._render_pending = False
+        left, top, right, bottom = self._visible_area()
+        scale = self._scale
+        # The circles and labels already drawn were resized by canvas.scale when zooming, new ones must match them
+        radius = self._transform_to_current_scale(self.STATION_CIRCLE_RADIUS)
+        created = 0
+
+        # Draw tunnels
+        segments = self._segments
+        visible = set(self._scene.visible_segments(left, top, right, bottom).tolist())
+        for i in self._segment_items.keys() - visible:
+            self._canvas.delete(self._segment_items.pop(i))
+        for i in visible - self._segment_items.keys():
+            x1, y1, x2, y2 = (segments[i] * scale).tolist()
+            self._segment_items[i] = self._canvas.create_line(
+                x1, y1, x2, y2, fill=self._segment_colours[i], width=self.LINE_WIDTH, tags=("segment",)
+            )
+            created += 1
 
         # Draw stations
-        # We request all the stations one by one and get their informations.
-
-        with GraknClient(uri="localhost:48555") as client:
-            with client.session(keyspace = "paris_subway") as session:
-                with session.transaction().read() as transaction:
-                    answer_iterator = execute_and_log('match $x isa station, has name $name,has lat $lat, has lon $lon ,has station_id $station_id;get $x, $lat,$lon, $name,$station_id;',transaction)
-
-                    for i in answer_iterator :
-                        station_id = i.get("station_id").value()
-                        station_name = i.get("name").value()
-                        ids = i.get("x")
-                        ids = ids.id
-                        if station_name not in drawn_station_name: # draw each station only once
-                            lon, lat = self._transform_coords(float(i.get("lon").value()), float(i.get("lat").value()))
-
-                            # Write label
-                            station_label_tag = self._canvas.create_text(
-                                lon + self.STATION_CIRCLE_RADIUS,
-                                lat + self.STATION_CIRCLE_RADIUS,
-                                text=station_name,
-                                anchor=tk.NW,
-                                font=('Johnston', self.STATION_FONT_SIZE, 'bold'),
-                                fill="#666"
-                            )
-
-                            # Draw circle
-                            station_tag = self._canvas.create_circle(
-                                lon,
-                                lat,
-                                self.STATION_CIRCLE_RADIUS,
-                                fill="white",
-                                outline="black"
-                            )
-
-                            self._station_canvas_coords[station_name] = (lon, lat)
-                            self._station_point_ids[ids] = station_tag
-
-                            # station selection event handlers
-                            def callback_wrapper(event, id=ids): return self._on_station_select(ids)
-                            event_sequence = "<Shift-ButtonPress-1>"
-                            self._canvas.tag_bind(station_tag, event_sequence, callback_wrapper)
-                            self._canvas.tag_bind(station_label_tag, event_sequence, callback_wrapper)
-
-                            drawn_station_name.append(station_name)
-            
-        print("All stations drawn..")
-        print("\nDone! you can now interact with the visualiser.")
+        points = self._station_xy
+        visible = set(self._scene.visible_stations(left, top, right, bottom, scale).tolist())
+        labelled = visible if self._scene.shows_labels(scale) else set()
+
+        for i in self._station_items.keys() - visible:
+            self._canvas.delete(self._station_items.pop(i))
+            del self._station_point_ids[self._station_points[i].concept_id]
+        for i in self._label_items.keys() - labelled:
+            self._canvas.delete(self._label_items.pop(i))
+
+        for i in visible - self._station_items.keys():
+            station = self._station_points[i]
+            lon, lat = (points[i] * scale).tolist()
+            # Draw circle
+            station_tag = self._canvas.create_circle(
+                lon,
+                lat,
+                radius,
+                fill=MapScene.STATION_COLOUR,
+                outline=MapScene.STATION_OUTLINE_COLOUR,
+                tags=("station",)
+            )
+            self._station_items[i] = station_tag
+            self._station_point_ids[station.concept_id] = station_tag
+            created += 1
+
+        for i in labelled - self._label_items.keys():
+            lon, lat = (points[i] * scale).tolist()
+            # Write label
+            self._label_items[i] = self._canvas.create_text(
+                lon + radius,
+                lat + radius,
+                text=self._station_points[i].name,
+                anchor=tk.NW,
+                font=('Johnston', self.STATION_FONT_SIZE, 'bold'),
+                fill=MapScene.LABEL_COLOUR,
+                tags=("label",)
+            )
+            created += 1
+
+        if created:
+            self._restack()
+
+    def _restack(self):
+        """
+        New items are created on top of the others: put every kind of item back in STACKING_ORDER
+        """
+        for tag in self.STACKING_ORDER:
+            self._canvas.tag_raise(tag)
 
 
     def _scan_start(self, event):
@@ -489,6 +456,7 @@ class TubeGui:
         """
         self._canvas.scan_dragto(event.x, event.y, gain=1)
         self._scan_delta = event.x - self._scan_start_pos[0], event.y - self._scan_start_pos[1]
+        self._schedule_render()
 
     def _scan_stop(self, event):
         """
@@ -499,6 +467,19 @@ class TubeGui:
         self._y_pos += self._scan_delta[1]
         self._scan_delta = (0, 0)
         self._scanning = False
+        self._schedule_render()
+
+    def _on_canvas_click(self, event):
+        """
+            Select the station nearest to a shift-click, if one is drawn within STATION_PICK_RADIUS pixels of it
+            :param event: event instance, with the position of the click in the window
+        """
+        # Window -> canvas coordinates takes the pan into account, canvas -> map coordinates the zoom
+        x = self._canvas.canvasx(event.x) / self._scale
+        y = self._canvas.canvasy(event.y) / self._scale
+        index = self._station_grid.nearest(x, y, self.STATION_PICK_RADIUS / self._scale, lambda index: index in self._station_items)
+        if index is not None:
+            self._on_station_select(self._station_points[index].concept_id)
 
     def _key_handler(self, event):
         """
@@ -511,13 +492,10 @@ class TubeGui:
         if event.char == "-" or event.char == "_":
             self.zoom("out")
 
-        if not self._displaying_centrality:
-
-
-            if event.char == self.STATION_K_CORE_KEY:
-                self.display_centrality(self.COMPUTE_CENTRALITY_TUNNEL_KCORE, self.STATION_K_CORE_MAX_RADIUS, self.STATION_K_CORE_COLOUR)
-            if event.char == self.STATION_ROUTE_KEY:
-                self.display_centrality(self.COMPUTE_CENTRALITY_ROUTE_KCORE, self.STATION_DEGREE_MAX_RADIUS, self.STATION_DEGREE_COLOUR)
+        if event.char == self.STATION_K_CORE_KEY:
+            self.toggle_centrality(self.CENTRALITY_K_CORE, self.STATION_K_CORE_MAX_RADIUS, self.STATION_K_CORE_COLOUR)
+        if event.char == self.STATION_ROUTE_KEY:
+            self.toggle_centrality(self.CENTRALITY_DEGREE, self.STATION_DEGREE_MAX_RADIUS, self.STATION_DEGREE_COLOUR)
 
         if event.char == self.CLEAR_SHORTEST_PATH_KEY:
                 self.clear_shortest_path()
@@ -525,6 +503,13 @@ class TubeGui:
         if event.char == self.CLEAR_ALL_KEY:
             self.clear_all()
 
+        if event.char == self.ROUTING_MODE_KEY:
+            self._routing_mode = self.ROUTING_MODES[(self.ROUTING_MODES.index(self._routing_mode) + 1) % len(self.ROUTING_MODES)]
+            print("Routing mode : " + self._routing_mode)
+
+        if event.char == self.QUERY_PROFILE_KEY:
+            PROFILER.dump()
+
     def _on_station_select(self, station_id):
         
         """
@@ -538,8 +523,8 @@ class TubeGui:
 
         x, y = self._get_station_point_coords(station_id)
         r = self._transform_to_current_scale(2 * self.STATION_CIRCLE_RADIUS)
-        c = self._canvas.create_circle(x, y, r, fill=self.TUNNEL_SHORTEST_PATH_COLOUR, outline="")
-        self._canvas.tag_lower(c, 1)
+        c = self._canvas.create_circle(x, y, r, fill=self.TUNNEL_SHORTEST_PATH_COLOUR, outline="", tags=("path_background",))
+        self._restack()
 
         self._shortest_path_elements.append(c)
         print("IDs station départ -> station arrivée")
@@ -547,31 +532,42 @@ class TubeGui:
         print("Veuillez patienter pendant que je recherche un itinéraire..")
 
         if len(self._shortest_path_stations) > 1:
-            shortest_path_ids = self.find_shortest_path(self._session, [self._shortest_path_stations[-2], self._shortest_path_stations[-1]])
+            # The search runs in the background, a new selection cancels the one still in flight
+            ids = [self._shortest_path_stations[-2], self._shortest_path_stations[-1]]
+            routing_mode = self._routing_mode
+            self._jobs.submit(
+                self.PATH_JOB,
+                "Searching a path (" + routing_mode + ") ...",
+                lambda: self.find_shortest_path(ids, routing_mode=routing_mode),
+                self._on_path_found
+            )
+
+    def _on_path_found(self, path):
+        """
+        Print and draw the result of a path search, on the Tk thread
+        :param path: routing.Path, or None if there is no path
+        """
+        if path is not None:
+            shortest_path_ids = path.concept_ids()
             print(" ")
             print("********************RESULTS******************************")
             print(" ")
             print("IDs of the passage station : " )
             print(shortest_path_ids)
+            print("Length : " + "%.2f" % path.cost + " km")
             print("--------------------------------------")
-            for station_id in shortest_path_ids:
-                with GraknClient(uri="localhost:48555") as client:
-                    with client.session(keyspace = "paris_subway") as session:
-                        with session.transaction().read() as transaction:
-
-                            # Add a point on the path for every station on the path
-                            answers_iterator = execute_and_log('match $station id '+station_id+',has station_ligne $station_ligne,has name $station_name,has station_id $station_id, has lat $lat, has lon $lon;get $station_id, $lat, $lon,$station_name,$station_ligne;' ,transaction)
-                            for i in answers_iterator :
-                                name = i.get('station_name').value()
-                                station_ligne = i.get('station_ligne').value()
-                                print("    |")
-                                print("    |")
-                                print(" ")
-                                sys.stdout.write(name)
-                                sys.stdout.write(" ")
-                                sys.stdout.write(station_ligne)
-                                print(" ")
-                                
+            station_ligne = ""
+            for i, station in enumerate(path.stations):
+                # The line is the one taken to reach the next station, the last station keeps the previous one
+                if i < len(path.lines):
+                    station_ligne = path.lines[i]
+                print("    |")
+                print("    |")
+                print(" ")
+                sys.stdout.write(station.name)
+                sys.stdout.write(" ")
+                sys.stdout.write(station_ligne)
+                print(" ")
 
             self.display_shortest_path(shortest_path_ids)
 
@@ -582,52 +578,31 @@ class TubeGui:
         """
 
         path_points = []
-        coord_liste = []
         for station_id in shortest_path_ids:
-            with GraknClient(uri="localhost:48555") as client:
-                with client.session(keyspace = "paris_subway") as session:
-                    with session.transaction().read() as transaction:
-                        # Add a point on the path for every station on the path
-                        answers_iterator = execute_and_log('match $station id '+station_id+',has name $station_name,has station_id $station_id, has lat $lat, has lon $lon;get $station_id, $lat, $lon,$station_name;' ,transaction)
-                        for i in answers_iterator :
-                            # id_d = i.get('station_id').value()
-                            lat = i.get('lat').value()
-                            lon = i.get('lon').value()
-                            name = i.get('station_name').value()
-                            print(name)
-                            coord_liste.append(lon)
-                            coord_liste.append(lat)
-                            
-        j = 0
-        while(j < len(coord_liste)-3) :
-
-            lon1, lat1 = self._transform_coords(coord_liste[j], coord_liste[j+2])
-            lon2, lat2 = self._transform_coords(coord_liste[j+1], coord_liste[j+3])
-            
-            x = lon2 - lon1
-            y = lat2 - lat1
-            grad = y / x  # gradient of the connection to draw
-            # The change in coordinates needed to achieve this
-            z = self.LINE_SPACING
-            y = ((grad ** 2 + 1) ** -0.5) * z
-            x = grad * y
+            # Add a point on the path for every station on the path
+            station = self._network.station(station_id)
+            print(station.name)
+            lon, lat = self._station_canvas_coords[station.name]
+            path_points.append((self._transform_to_current_scale(lon), self._transform_to_current_scale(lat)))
+
+        for (lon1, lat1), (lon2, lat2) in zip(path_points, path_points[1:]):
             self._canvas.create_line(
                 lon1,
                 lat1,
                 lon2,
                 lat2,
-                fill="#E22901",width=self.LINE_WIDTH)
-            j += 2
+                fill=MapScene.SHORTEST_PATH_COLOUR,width=self.LINE_WIDTH, tags=("path",))
             print("Route drawn..")
 
+        if len(path_points) < 2:
+            return
 
-
-        path = self._canvas.create_line(path_points, width=self.TUNNEL_SHORTEST_PATH_WIDTH, fill=self.TUNNEL_SHORTEST_PATH_COLOUR, joinstyle=tk.ROUND, dash=(3, 3))
+        path = self._canvas.create_line(path_points, width=self.TUNNEL_SHORTEST_PATH_WIDTH, fill=self.TUNNEL_SHORTEST_PATH_COLOUR, joinstyle=tk.ROUND, dash=(3, 3), tags=("path_background",))
         self._shortest_path_elements.append(path)
 
 
         # Put the path behind the other visual elements on the map
-        self._canvas.tag_lower(path, 1)
+        self._restack()
 
     def _get_station_point_coords(self, station_id):
         """
@@ -635,14 +610,15 @@ class TubeGui:
         :param station_id: the ID of the desired station
         :return: the centre-point coordinates of the circle used to represent the station
         """
-        x0, y0, x1, y1 = self._canvas.coords(self._station_point_ids[station_id])
-        point = (x0 + x1) / 2, (y0 + y1) / 2
-        return point
+        # Computed from the map coordinates, the station circle may not be on the canvas at this zoom level
+        lon, lat = self._station_canvas_coords[self._network.station(station_id).name]
+        return self._transform_to_current_scale(lon), self._transform_to_current_scale(lat)
 
     def clear_shortest_path(self):
         """
-        Delete from the canvas the elements being used to display shortest paths
+        Delete from the canvas the elements being used to display shortest paths, and cancel the search in flight
         """
+        self._jobs.cancel(self.PATH_JOB)
         self._canvas.delete(*self._shortest_path_elements)
         self._shortest_path_stations = []
 
@@ -689,6 +665,9 @@ class TubeGui:
             # The canvas is being scaled about its origin, so we only need to drag the delta to centre the scaling
             self._canvas.scan_dragto(dx, dy, gain=1)
 
+            # Show or hide the details for the new zoom level, and materialise what came into view
+            self._schedule_render()
+
     def _transform_to_current_scale(self, val):
         """
         Take a value, e.g. a coordinate, and scale it according to the current scaling of the canvas. This is mostly
@@ -698,66 +677,87 @@ class TubeGui:
         """
         return val * self._scale
 
-    def display_centrality(self, query, upper_radius, colour):
+    def toggle_centrality(self, measure, upper_radius, colour):
+        """
+            Show the overlay of a centrality measure, or hide it if it is already shown
+        """
+        displayed = self._displaying_centrality
+        self.hide_centrality()
+        if displayed != measure:
+            self.display_centrality(measure, upper_radius, colour)
+
+    def display_centrality(self, measure, upper_radius, colour):
         """
             Show an infographic-style visualisation of centrality, where the radius of the circles plotted corresponds to
-            the centrality score
-            :param query: graql centrality query as a string
+            the centrality score. The scores come from the local centrality cache, and are computed in the background
+            the first time. An overlay drawn once is only shown again afterwards.
+            :param measure: "k-core" or "degree"
             :param upper_radius:
             :param colour:
             :return:
         """
-        with GraknClient(uri="localhost:48555") as client:
-            with client.session(keyspace = "paris_subway") as session:
-                with session.transaction().read() as transaction:
-
-                    centrality_details = self.compute_centrality(self._session, query)
-
-                    for centrality_set in centrality_details["centrality_set"]:
-                        radius = self._transform_to_current_scale(
-                            (int(int(centrality_set["measurement"])) / centrality_details["max_score"]) * upper_radius
-                        )
-
-                         
-
-                        for concept_id in centrality_set["concept_ids"]:
-                            print(concept_id, centrality_set["measurement"], centrality_details["max_score"])
-
-                            answers_iterator = execute_and_log(' match $x id '+concept_id+', has station_id $station_id, has name $station_name; get $station_id, $station_name;',transaction)
-                            for i in answers_iterator :
-                                id_d = i.get('station_id').value()
-                                station_name = i.get('station_name').value()
-                            station_element_id = id_d
-                            print(station_name)
-                            print(id_d)
-
-                            lon, lat = self._station_canvas_coords[station_name]
-                            lon = self._transform_to_current_scale(lon)
-                            lat = self._transform_to_current_scale(lat)
+        self._displaying_centrality = measure
+        if measure not in self._centrality_overlays:
+            minimum = self.CENTRALITY_MINIMUM_SCORES[measure]
+            self._jobs.submit(
+                self.CENTRALITY_JOB,
+                "Computing the " + measure + " centrality ...",
+                lambda: self._scene.centrality_circles(self._centrality.centrality_sets(measure, minimum), upper_radius),
+                lambda circles: self._draw_centrality(measure, circles, colour)
+            )
+        else:
+            for element in self._centrality_overlays[measure]:
+                self._canvas.itemconfigure(element, state=tk.NORMAL)
 
-                            centrality_element_id = self._canvas.create_circle(lon, lat, radius, fill=colour, outline="")
+    def _draw_centrality(self, measure, circles, colour):
+        """
+        Draw the overlay of a centrality measure, on the Tk thread
+        :param circles: x, y, radius of every circle, in map coordinates
+        """
+        elements = []
+        for lon, lat, radius in circles:
+            lon = self._transform_to_current_scale(lon)
+            lat = self._transform_to_current_scale(lat)
+            radius = self._transform_to_current_scale(radius)
 
-                            self._station_centrality_points[concept_id] = centrality_element_id
+            centrality_element_id = self._canvas.create_circle(lon, lat, radius, fill=colour, outline="", tags=("overlay",))
+            elements.append(centrality_element_id)
 
-                            # Send the drawn elements to behind the station point
-                            self._canvas.tag_lower(centrality_element_id, station_element_id)
-                    print(self._station_centrality_points)
-                    self._displaying_centrality = True
+        # Send the drawn elements to behind the station points
+        self._restack()
+        self._centrality_overlays[measure] = elements
+        print("Centrality (" + measure + ") drawn for " + str(len(elements)) + " stations")
 
     def hide_centrality(self):
         if self._displaying_centrality:
-            for concept_id, point_id in self._station_centrality_points.items():
-                self._canvas.delete(point_id)
-            self._displaying_centrality = False
+            # The overlay may still be computed, in which case there is nothing to hide yet
+            self._jobs.cancel(self.CENTRALITY_JOB)
+            for element in self._centrality_overlays.get(self._displaying_centrality, []):
+                self._canvas.itemconfigure(element, state=tk.HIDDEN)
+            self._displaying_centrality = None
+
+    def _show_progress(self, descriptions):
+        """
+        Show what the background jobs are doing, or hide the indicator once they are all done
+        :param descriptions: description of every running job
+        """
+        if descriptions:
+            self._status.configure(text="  ".join(descriptions))
+            self._status.place(relx=0, rely=1, x=8, y=-8, anchor=tk.SW)
+            self._canvas.configure(cursor="watch")
+        else:
+            self._status.place_forget()
+            self._canvas.configure(cursor="")
 
 
 def init(shouldHalt):
-    root = tk.Tk() # Build the Tkinter application
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace="paris_subway") as session:
-            tube_gui = TubeGui(session, root)
-            if shouldHalt:
-                root.mainloop()
+    root = _load_tk().Tk() # Build the Tkinter application
+    tube_gui = TubeGui(root=root)
+    try:
+        if shouldHalt:
+            root.mainloop()
+    finally:
+        tube_gui.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+import traceback
+
+
+class Job:
+    """
+    A function running on the executor, and what to do with its result once it is back on the Tk thread
+    """
+
+    def __init__(self, kind, description, future, on_done, on_error):
+        self.kind = kind
+        self.description = description
+        self.future = future
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        The function is not started if it is still queued. Once it is running it cannot be stopped, but its result is
+        thrown away.
+        """
+        self.cancelled = True
+        self.future.cancel()
+
+
+class BackgroundJobs:
+    """
+    Runs the slow work of the map on a thread pool, so that the Tk event loop keeps handling the events. Tk must only be
+    touched from its own thread: the results are collected by polling the jobs with root.after, and the callbacks are
+    run from there. There is at most one job of each kind, a new job cancels the one it supersedes.
+    """
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, root, max_workers=2, on_busy=None):
+        """
+        :param root: Tk root window, whose event loop runs the callbacks
+        :param on_busy: optional function of the list of the descriptions of the running jobs, called every time it
+        changes, an empty list once every job is done
+        """
+        self._root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._on_busy = on_busy
+        self._jobs = {}
+        self._polling = False
+
+    def submit(self, kind, description, function, on_done, on_error=None):
+        """
+        Run function() on the executor, then on_done(result) on the Tk thread, or on_error(exception) if it raised
+        :param kind: the job of the same kind still in flight, if any, is cancelled
+        :return: the Job
+        """
+        self.cancel(kind)
+        job = Job(kind, description, self._executor.submit(function), on_done, on_error)
+        self._jobs[kind] = job
+        self._busy_changed()
+        if not self._polling:
+            self._polling = True
+            self._root.after(self.POLL_INTERVAL_MS, self._poll)
+        return job
+
+    def cancel(self, kind):
+        job = self._jobs.pop(kind, None)
+        if job is not None:
+            job.cancel()
+            self._busy_changed()
+
+    def pending(self, kind):
+        return kind in self._jobs
+
+    def _poll(self):
+        for kind, job in list(self._jobs.items()):
+            if not job.future.done():
+                continue
+            del self._jobs[kind]
+            self._busy_changed()
+            if job.cancelled or job.future.cancelled():
+                continue
+            error = job.future.exception()
+            if error is None:
+                job.on_done(job.future.result())
+            elif job.on_error is not None:
+                job.on_error(error)
+            else:
+                traceback.print_exception(type(error), error, error.__traceback__)
+
+        if self._jobs:
+            self._root.after(self.POLL_INTERVAL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _busy_changed(self):
+        if self._on_busy is not None:
+            self._on_busy([job.description for job in self._jobs.values()])
+
+    def shutdown(self):
+        for kind in list(self._jobs):
+            self.cancel(kind)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,334 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+# The benchmarks time the queries and the computations themselves: unless asked otherwise, the query cache and the
+# query profiler are off. Both read their setting when they are imported, so before anything else.
+os.environ.setdefault("QUERY_CACHE", "0")
+os.environ.setdefault("QUERY_PROFILE", "0")
+
+from centrality import degree_centrality, k_core_centrality
+from contextlib import redirect_stdout
+from grakn_connection import GraknConnection
+from map_renderer import MAP_WIDTH
+from map_scene import MapScene
+from memory_grakn import MEMORY_URI_PREFIX
+from network_model import NetworkModel
+from path_tables import PathTables
+from routing import Router
+import argparse
+import io
+import json
+import random
+import sys
+import time
+
+# The loader and its csv files live in data/, the migration is run from there
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+sys.path.append(DATA_DIR)
+from loader_metrics import LoaderMetrics
+from migration_state import record_load
+import migration_subway
+
+# Every scenario runs against the in-memory stand-in of memory_grakn.py, no Grakn server is needed
+BENCHMARK_URI = MEMORY_URI_PREFIX + "benchmarks"
+BENCHMARK_KEYSPACE = "paris_subway_benchmark"
+
+BASELINE_FILE = "./benchmarks_baseline.json"
+REPORT_FILE = "./benchmarks_report.json"
+
+# Timed runs of the whole sequence of scenarios, after the untimed warm-up runs
+REPEAT = 5
+WARMUP = 1
+# A scenario regresses when its median is more than THRESHOLD slower than its baseline, and by at least
+# MIN_REGRESSION_SECONDS so that the shortest scenarios do not fail on noise. A scenario of the baseline file can
+# set its own "threshold".
+THRESHOLD = 0.25
+MIN_REGRESSION_SECONDS = 0.005
+
+# Station pairs of the path scenario, drawn with a fixed seed so that every run searches the same paths, and how many
+# of them also go through Graql compute path
+PATH_PAIRS = 200
+GRAQL_PATH_PAIRS = 20
+SEED = 2020
+
+
+#######################################################################################################################################
+#
+#                                                       SCENARIOS
+#
+#######################################################################################################################################
+
+# Each scenario gets the state left by the previous ones and returns a few counts, printed and kept in the report so
+# that a faster run that does less work is noticed.
+
+def load_scenario(state):
+    """
+    Full migration of the csv files of data/ into a recreated keyspace, then the counts of the reconciliation report
+    """
+    migration_subway.GRAKN_URI = BENCHMARK_URI
+    migration_subway.metrics = LoaderMetrics(quiet=True)
+    cwd = os.getcwd()
+    os.chdir(DATA_DIR)
+    try:
+        migration_subway.reset_keyspace(BENCHMARK_KEYSPACE)
+        rejected = migration_subway.build_vente_graph(migration_subway.inputs, migration_subway.BATCH_SIZE, BENCHMARK_KEYSPACE)
+        # New concept ids: with QUERY_CACHE=1, the answers cached for the previous load must not be served
+        record_load(BENCHMARK_URI, BENCHMARK_KEYSPACE)
+    finally:
+        os.chdir(cwd)
+
+    # The keyspace was recreated, the sessions of the previous run belong to the old one
+    state["connection"] = GraknConnection(BENCHMARK_URI, BENCHMARK_KEYSPACE)
+    with state["connection"].read() as transaction:
+        stations = list(transaction.query("compute count in station;"))[0].number()
+        routes = list(transaction.query("compute count in route;"))[0].number()
+    return {"stations": stations, "routes": routes, "rejected": len(rejected)}
+
+
+def visualisation_scenario(state):
+    """
+    What the map is drawn from: the network model loaded with its bulk queries, and the projected scene
+    """
+    network = NetworkModel.load(state["connection"])
+    scene = MapScene(network, MAP_WIDTH)
+    state["network"] = network
+    return {"stations": len(network.stations), "routes": len(network.edges), "tunnels": len(scene.segments)}
+
+
+def path_scenario(state):
+    """
+    Shortest paths and itineraries between the same station pairs, with A*, with the all-pairs tables, and with
+    Graql compute path for the first pairs
+    """
+    network = state["network"]
+    generator = random.Random(SEED)
+    pairs = [tuple(generator.sample(range(len(network.stations)), 2)) for i in range(PATH_PAIRS)]
+
+    router = Router(network)
+    found = 0
+    for origin, destination in pairs:
+        if router.shortest_path(origin, destination) is not None:
+            found += 1
+        router.itinerary(origin, destination)
+
+    tables = PathTables.build(network, "distance")
+    for origin, destination in pairs:
+        tables.path(origin, destination)
+
+    graql_hops = 0
+    with state["connection"].read() as transaction:
+        for origin, destination in pairs[:GRAQL_PATH_PAIRS]:
+            query = ("compute path from " + network.stations[origin].concept_id + ", to " +
+                     network.stations[destination].concept_id + ", in [station, route];")
+            for answer in transaction.query(query):
+                # Stations and routes alternate along the path
+                graql_hops += len(answer.list()) // 2
+                break
+    return {"pairs": len(pairs), "found": found, "graql_hops": graql_hops}
+
+
+def centrality_scenario(state):
+    """
+    Degree and k-core of every station computed locally, then with Graql compute centrality, whose k-cores must be
+    the same
+    """
+    network = state["network"]
+    degrees = degree_centrality(network)
+    cores = k_core_centrality(network)
+
+    graql_cores = {}
+    with state["connection"].read() as transaction:
+        list(transaction.query("compute centrality in [station, route], using degree;"))
+        for answer in transaction.query("compute centrality in [station, route], using k-core;"):
+            for concept_id in answer.set():
+                graql_cores[network.station(concept_id).index] = answer.measurement()
+
+    expected = { index: core for index, core in enumerate(cores) if core >= 2 }
+    if graql_cores != expected:
+        raise RuntimeError("compute centrality using k-core does not agree with centrality.k_core_centrality")
+    return {"max_degree": max(degrees), "max_core": max(cores), "cored_stations": len(expected)}
+
+
+def questions_scenario(state):
+    """
+    The questions of statistics.py that are answered by Graql queries
+    """
+    import statistics as questions
+    with state["connection"].read() as transaction:
+        count = questions.query_station_count("How many stations do exist?", transaction)
+        lat, names = questions.query_northernmost_station("Which is the northernmost station in Paris?", transaction)
+    return {"stations": count, "northernmost": len(names)}
+
+
+# In the order they run: each scenario needs the state of the previous ones
+SCENARIOS = [
+    ("load", load_scenario),
+    ("visualisation", visualisation_scenario),
+    ("path", path_scenario),
+    ("centrality", centrality_scenario),
+    ("questions", questions_scenario),
+]
+
+
+#######################################################################################################################################
+#
+#                                                   RUNS AND BASELINES
+#
+#######################################################################################################################################
+
+def run_scenarios(names, repeat=REPEAT, warmup=WARMUP, verbose=False):
+    """
+    Run the whole sequence of scenarios warmup + repeat times, each time from a new keyspace. The scenarios that are
+    not asked for still run when a later one needs their state, but are not timed.
+    :param names: names of the scenarios to time
+    :return: name -> {"runs": seconds of each timed run, "details": counts of the last run} or {"skipped": reason}
+    """
+    last = max(i for i, (name, scenario) in enumerate(SCENARIOS) if name in names)
+    results = { name: {"runs": []} for name in names }
+    for run in range(warmup + repeat):
+        state = {}
+        for name, scenario in SCENARIOS[:last + 1]:
+            if "skipped" in results.get(name, {}):
+                continue
+            output = sys.stdout if verbose else io.StringIO()
+            start = time.perf_counter()
+            try:
+                with redirect_stdout(output):
+                    details = scenario(state)
+            except ImportError as error:
+                # ex: statistics.py needs fuzzywuzzy, the other scenarios can still run
+                if name in results:
+                    results[name] = {"skipped": str(error)}
+                continue
+            seconds = time.perf_counter() - start
+            if name in results and run >= warmup:
+                results[name]["runs"].append(seconds)
+                results[name]["details"] = details
+        if "connection" in state:
+            state["connection"].close()
+
+    for result in results.values():
+        if "runs" in result:
+            runs = sorted(result["runs"])
+            result["min_seconds"] = runs[0]
+            result["median_seconds"] = runs[len(runs) // 2]
+            result["max_seconds"] = runs[-1]
+    return results
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Check the median of every scenario against its baseline
+    :return: the names of the scenarios that regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = (baseline or {}).get("scenarios", {}).get(name)
+        if "median_seconds" not in result or reference is None:
+            continue
+        limit = reference["median_seconds"] * (1 + reference.get("threshold", threshold))
+        result["baseline_seconds"] = reference["median_seconds"]
+        result["change"] = result["median_seconds"] / reference["median_seconds"] - 1 if reference["median_seconds"] else 0.0
+        result["regressed"] = (result["median_seconds"] > limit and
+                               result["median_seconds"] - reference["median_seconds"] >= MIN_REGRESSION_SECONDS)
+        if result["regressed"]:
+            regressions.append(name)
+    return regressions
+
+
+def write_json(content, path):
+    with open(path + ".tmp", "w") as json_file:
+        json.dump(content, json_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def update_baseline(results, baseline, path=BASELINE_FILE):
+    """
+    Record the medians of this run as the new baseline, keeping the thresholds set by hand
+    """
+    scenarios = dict((baseline or {}).get("scenarios", {}))
+    for name, result in results.items():
+        if "median_seconds" in result:
+            reference = dict(scenarios.get(name, {}))
+            reference["median_seconds"] = result["median_seconds"]
+            scenarios[name] = reference
+    write_json({
+        "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "scenarios": scenarios,
+    }, path)
+    print("Baseline written to " + path)
+
+
+def print_results(results):
+    print("%-14s %10s %10s %10s %10s %8s" % ("scenario", "median s", "min s", "max s", "baseline s", "change"))
+    for name, result in results.items():
+        if "skipped" in result:
+            print("%-14s skipped : %s" % (name, result["skipped"]))
+            continue
+        line = "%-14s %10.4f %10.4f %10.4f" % (name, result["median_seconds"], result["min_seconds"], result["max_seconds"])
+        if "baseline_seconds" in result:
+            line += " %10.4f %+7.0f%%" % (result["baseline_seconds"], result["change"] * 100)
+            if result["regressed"]:
+                line += "   <- REGRESSION"
+        print(line + "   " + ", ".join(key + " " + str(value) for key, value in result["details"].items()))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Time the load, visualisation data, path and centrality scenarios against the in-memory Grakn, "
+                    "and compare them with the baseline")
+    parser.add_argument("scenarios", nargs="*",
+                        help="scenarios to time among " + ", ".join(name for name, scenario in SCENARIOS) + ", all of them by default")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs, the median of each scenario is kept")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="untimed runs before the timed ones")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file of the baseline medians")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="slowdown over the baseline that counts as a regression, 0.25 = 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="record this run as the new baseline")
+    parser.add_argument("--report", default=REPORT_FILE, help="JSON file where to write the timings of every run")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the scenarios")
+    args = parser.parse_args()
+
+    names = args.scenarios or [name for name, scenario in SCENARIOS]
+    for name in names:
+        if name not in dict(SCENARIOS):
+            parser.error("unknown scenario " + name)
+    print("Benchmark : " + ", ".join(names) + ", " + str(args.repeat) + " runs after " + str(args.warmup) + " warm-up ...")
+    results = run_scenarios(names, args.repeat, args.warmup, args.verbose)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold)
+    print_results(results)
+    if args.report:
+        write_json({"repeat": args.repeat, "threshold": args.threshold, "scenarios": results}, args.report)
+
+    if args.update_baseline:
+        update_baseline(results, baseline, args.baseline)
+    elif baseline is None:
+        print("No baseline in " + args.baseline + ", record one with --update-baseline")
+    elif regressions:
+        print("Regression of " + ", ".join(regressions) + " over the baseline of " + baseline.get("recorded", "?"))
+        sys.exit(1)
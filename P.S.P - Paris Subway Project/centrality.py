@@ -0,0 +1,131 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+CENTRALITY_FILE = "./centrality.json"
+
+MEASURES = ["degree", "k-core"]
+
+
+def undirected_neighbours(network):
+    """
+    :return: for each station index, the set of the stations it shares a route with, whatever the direction of the route
+    """
+    neighbours = [set() for station in network.stations]
+    for edge in network.edges:
+        if edge.beginning != edge.end:
+            neighbours[edge.beginning].add(edge.end)
+            neighbours[edge.end].add(edge.beginning)
+    return neighbours
+
+
+def degree_centrality(network):
+    """
+    :return: for each station index, the number of stations it is directly connected to
+    """
+    return [len(neighbours) for neighbours in undirected_neighbours(network)]
+
+
+def k_core_centrality(network):
+    """
+    Core number of every station (Batagelj and Zaversnik): the largest k such that the station belongs to a subgraph
+    where every station has at least k neighbours. Stations are peeled in order of their remaining degree, which is
+    kept in buckets so that the whole computation is linear in the number of routes.
+    :return: for each station index, its core number
+    """
+    neighbours = undirected_neighbours(network)
+    degrees = [len(station_neighbours) for station_neighbours in neighbours]
+    buckets = [set() for i in range(max(degrees, default=0) + 1)]
+    for index, degree in enumerate(degrees):
+        buckets[degree].add(index)
+
+    cores = list(degrees)
+    removed = [False] * len(degrees)
+    k = 0
+    for i in range(len(degrees)):
+        while not buckets[k]:
+            k += 1
+        index = buckets[k].pop()
+        removed[index] = True
+        cores[index] = k
+        for neighbour in neighbours[index]:
+            if not removed[neighbour] and degrees[neighbour] > k:
+                buckets[degrees[neighbour]].discard(neighbour)
+                degrees[neighbour] -= 1
+                buckets[degrees[neighbour]].add(neighbour)
+        # Removing a station can only lower its neighbours down to k
+        k = max(k - 1, 0)
+    return cores
+
+
+MEASURE_FUNCTIONS = {
+    "degree": degree_centrality,
+    "k-core": k_core_centrality
+}
+
+
+class CentralityCache:
+    """
+    Centrality scores of the stations, computed once per version of the network. The scores are kept in memory and in
+    CENTRALITY_FILE, keyed by station name, and are thrown away as soon as the network version changes.
+    """
+
+    def __init__(self, network, path=CENTRALITY_FILE):
+        self._network = network
+        self._path = path
+        self._scores = {}
+        try:
+            with open(path) as centrality_file:
+                cached = json.load(centrality_file)
+            if cached.get("dataset_version") == network.version():
+                for measure, scores in cached["measures"].items():
+                    self._scores[measure] = [scores[station.name] for station in network.stations]
+        except (OSError, ValueError, KeyError):
+            self._scores = {}
+
+    def scores(self, measure):
+        """
+        :param measure: "degree" or "k-core"
+        :return: for each station index, its score
+        """
+        if measure not in MEASURE_FUNCTIONS:
+            raise ValueError("Unknown centrality " + str(measure) + ", expected one of " + ", ".join(MEASURES))
+        if measure not in self._scores:
+            self._scores[measure] = MEASURE_FUNCTIONS[measure](self._network)
+            self._save()
+        return self._scores[measure]
+
+    def centrality_sets(self, measure, minimum=1):
+        """
+        :param minimum: stations with a lower score are left out, like Grakn leaves out the 1-core
+        :return: dict of score -> list of station indices with that score
+        """
+        sets = {}
+        for index, score in enumerate(self.scores(measure)):
+            if score >= minimum:
+                sets.setdefault(score, []).append(index)
+        return sets
+
+    def _save(self):
+        measures = {}
+        for measure, scores in self._scores.items():
+            measures[measure] = { station.name: scores[station.index] for station in self._network.stations }
+        try:
+            with open(self._path + ".tmp", "w") as centrality_file:
+                json.dump({"dataset_version": self._network.version(), "measures": measures}, centrality_file)
+            os.replace(self._path + ".tmp", self._path)
+        except OSError as error:
+            print("Could not save the centrality cache: " + str(error))
@@ -0,0 +1,107 @@
+import csv
+import glob
+import unicodedata
+
+
+#######################################################################################################################################
+#
+#                                           TABLE CANONIQUE DES STATIONS
+#
+#######################################################################################################################################
+
+# Fichier produit par cette étape et consommé par migration_subway.py
+CANONICAL_FILE = "./stations_canonical"
+
+# Ecart en degrés au-delà duquel les coordonnées de deux lignes sont considérées comme différentes
+COORDINATE_TOLERANCE = 1e-9
+
+
+def normalise_nom(name):
+    """
+    Clé de déduplication d'une station : sans accents, sans tirets, en minuscules et avec un seul espace entre les mots
+    Ex: "Esplanade de La Défense" et "Esplanade de la Defense" donnent la même clé
+    :param name: nom de la station tel qu'il apparaît dans un csv
+    :return: nom normalisé
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = name.replace("-", " ")
+    return " ".join(name.casefold().split())
+
+
+def station_files(data_dir="."):
+    """
+    Liste les csv de stations (data_metro_{ligne}.csv), sans les fichiers de routes MARKII
+    """
+    files = glob.glob(data_dir + "/data_metro_*.csv")
+    return sorted(file for file in files if "MARKII" not in file)
+
+
+def build_canonical_stations(files):
+    """
+    Fusionne les stations de toutes les lignes en une seule entrée par nom normalisé.
+    Le résultat ne dépend pas de l'ordre des fichiers : la station retenue est celle qui a le plus petit station_id,
+    et le nom retenu est l'orthographe la plus fréquente.
+    :param files: liste des csv de stations
+    :return: dictionnaire clé normalisée -> station canonique
+    """
+    grouped = {}
+    for file in files:
+        with open(file) as data:
+            for row in csv.DictReader(data, skipinitialspace = True):
+                grouped.setdefault(normalise_nom(row["name"]), []).append(row)
+
+    stations = {}
+    for key, rows in grouped.items():
+        rows = sorted(rows, key=lambda row: (int(row["station_id"]), row["station_ligne"]))
+        reference = rows[0]
+
+        spellings = {}
+        for row in rows:
+            spellings[row["name"].strip()] = spellings.get(row["name"].strip(), 0) + 1
+        name = min(spellings, key=lambda spelling: (-spellings[spelling], spelling))
+
+        lines = sorted(set(row["station_ligne"] for row in rows))
+
+        # Coordonnées des autres lignes qui ne correspondent pas à celles retenues
+        conflicts = []
+        for row in rows[1:]:
+            if abs(float(row["lat"]) - float(reference["lat"])) > COORDINATE_TOLERANCE or \
+                    abs(float(row["lon"]) - float(reference["lon"])) > COORDINATE_TOLERANCE:
+                conflicts.append(row["station_ligne"] + "@" + row["lat"] + ";" + row["lon"])
+
+        stations[key] = {
+            "station_id": reference["station_id"],
+            "name": name,
+            "lat": reference["lat"],
+            "lon": reference["lon"],
+            "station_lignes": "|".join(lines),
+            "conflicts": "|".join(conflicts)
+        }
+    return stations
+
+
+def write_canonical_stations(stations, data_path=CANONICAL_FILE):
+    """
+    Ecrit la table canonique dans un seul csv, trié par nom normalisé
+    """
+    with open(data_path + ".csv", "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["station_id", "name", "lat", "lon", "station_lignes", "conflicts"])
+        writer.writeheader()
+        for key in sorted(stations):
+            writer.writerow(stations[key])
+
+
+def canonicalise(data_dir=".", data_path=CANONICAL_FILE):
+    files = station_files(data_dir)
+    stations = build_canonical_stations(files)
+    write_canonical_stations(stations, data_path)
+
+    conflicts = sum(1 for station in stations.values() if station["conflicts"])
+    print("Merged " + str(len(files)) + " files into " + str(len(stations)) +
+          " stations (" + str(conflicts) + " with conflicting coordinates) -> " + data_path + ".csv")
+    return stations
+
+
+if __name__ == "__main__":
+    canonicalise()
@@ -1,12 +1,66 @@
+import argparse
+import collections
 import csv
 import os
-import geopy.distance
 
 # ===============================================================================================
 
 
+# Table de traduction calculée une seule fois : chaque caractère accentué est remplacé par sa lettre sans accent
+ACCENTS = { 'a': ['à', 'ã', 'á', 'â'],
+            'e': ['é', 'è', 'ê', 'ë'],
+            'E': ['É'],
+            'i': ['î', 'ï'],
+            'u': ['ù', 'ü', 'û'],
+            'o': ['ô', 'ö'] ,
+            ' ': ['-']
+            }
+ACCENTS_TABLE = str.maketrans({ accented_char: char for char, accented_chars in ACCENTS.items() for accented_char in accented_chars })
+
+STATION_HEADER = ['station_id', 'name', 'station_ligne', 'lat', 'lon']
+TUNNEL_HEADER = ['station_ligne', 'origin', 'destination']
+
+# Les csv de data/ ont été corrigés à la main : le découpage écrit par défaut dans un dossier à part
+OUTPUT_DIR = "./downloaded"
+
+
+class CsvWriterCache:
+    """
+    Garde un seul fichier ouvert par csv de sortie pendant tout le découpage, au lieu de rouvrir le fichier
+    (et de tester s'il est vide) pour chaque ligne écrite. L'en-tête est écrit à l'ouverture du fichier.
+    Sans force, un fichier qui existe déjà n'est jamais écrasé : FileExistsError est levée.
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, force=False):
+        self._output_dir = output_dir
+        self._mode = 'w' if force else 'x'
+        self._files = {}
+        self._writers = {}
+
+    def writer(self, file_name, header):
+        if file_name not in self._writers:
+            csvfile = open(os.path.join(self._output_dir, file_name), self._mode, newline='')
+            spamwriter = csv.writer(csvfile)
+            spamwriter.writerow(header)
+            self._files[file_name] = csvfile
+            self._writers[file_name] = spamwriter
+        return self._writers[file_name]
+
+    def close(self):
+        for csvfile in self._files.values():
+            csvfile.close()
+        self._files = {}
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 # write in a new csv file the data that matters to us (cad les stations de metro)
-def write_interesseting_data(csvname_all_data):
+def write_interesseting_data(csvname_all_data, writers, summary):
 
     with open(csvname_all_data) as csvfile:
 
@@ -20,85 +74,76 @@ def write_interesseting_data(csvname_all_data):
 
                 # Ex : data_metro_1.csv -> data du metro ligne 1
                 file_name="data_metro_{}.csv".format(row[26])
+                spamwriter = writers.writer(file_name, STATION_HEADER)
 
-                with open(file_name, 'a') as csvfile2:
-
-
-                    spamwriter=csv.writer(csvfile2)
-
-                    # if the file is empty, we add this in the top of it :
-                    if os.stat(file_name).st_size == 0:
-                        spamwriter.writerow(
-                            ['station_id', 'name', 'station_ligne', 'lat', 'lon'])
-
-
-                    # id, nom, ligne, coordonees
-                    list=(row[0].split(","))
-                    name = supprime_accent(row[5]) #suppressions des accents -> faire correspondre les noms entre les fichiers de data
-                    sep = '('
-                    name = name.split(sep,1)[0]
-                    print(f"From {row[5]} to {name}")
-                    spamwriter.writerow(
-                        (row[4], name, row[26], list[0], list[1]))
-
-    print("Finishing creation of all lines data and creation of csv's")
+                # id, nom, ligne, coordonees
+                list=(row[0].split(","))
+                name = supprime_accent(row[5]) #suppressions des accents -> faire correspondre les noms entre les fichiers de data
+                sep = '('
+                name = name.split(sep,1)[0]
+                spamwriter.writerow(
+                    (row[4], name, row[26], list[0], list[1]))
+                summary[file_name] += 1
 
 
 
 def supprime_accent(ligne):
         """ supprime les accents du texte source """
-        accents = { 'a': ['à', 'ã', 'á', 'â'],
-                    'e': ['é', 'è', 'ê', 'ë'],
-                    'E': ['É'],
-                    'i': ['î', 'ï'],
-                    'u': ['ù', 'ü', 'û'],
-                    'o': ['ô', 'ö'] ,
-                    ' ': ['-']
-                    }
-        for (char, accented_chars) in accents.items():
-            for accented_char in accented_chars:
-                ligne = ligne.replace(accented_char, char)
-        return ligne
+        return ligne.translate(ACCENTS_TABLE)
 
 
 
 #Ecris les csv MARKII permettant la création des relations entre nos stations.
-def just_tunnel(csv_file_name) :
-    print("Openning "+ csv_file_name+" file...")
+def just_tunnel(csv_file_name, writers, summary) :
     with open(csv_file_name) as csvfile :
-        
+
         spamreader = csv.reader(csvfile, delimiter=";")
 
-        for row in spamreader : 
+        for row in spamreader :
 
-             
-            print(row)
             name = row[0]
             file_name="data_metro_MARKII_{}.csv".format(name[1:])
-            with open(file_name, 'a') as csvfile2:
-                spamwriter=csv.writer(csvfile2)
+            spamwriter = writers.writer(file_name, TUNNEL_HEADER)
 
-                # if the file is empty, we add this in the top of it :
-                if os.stat(file_name).st_size == 0:
-                    spamwriter.writerow(['station_ligne', 'origin', 'destination'])
+            # ligne, origine, destination
+            spamwriter.writerow((row[0], row[1], row[2]))
+            summary[file_name] += 1
 
-                # id, nom, ligne, coordonees
-                spamwriter.writerow((row[0], row[1], row[2]))
-        print("Finishing collecting data for line "+ row[0])
 
+def split_sources(csvname_all_data, tunnel_file_name, output_dir=OUTPUT_DIR, force=False):
+    """
+    Découpe les deux sources en une seule passe chacune : les stations de metro vers les data_metro_{ligne}.csv et les
+    tunnels vers les data_metro_MARKII_{ligne}.csv. Les fichiers de sortie existants ne sont réécrits qu'avec force.
+    :return: le nombre de lignes écrites dans chaque fichier de sortie
+    """
+    summary = collections.Counter()
+    os.makedirs(output_dir, exist_ok=True)
+    with CsvWriterCache(output_dir, force) as writers:
+        write_interesseting_data(csvname_all_data, writers, summary)
+        just_tunnel(tunnel_file_name, writers, summary)
 
+    for file_name in sorted(summary):
+        print(file_name + " : " + str(summary[file_name]) + " rows")
+    print("Finishing creation of " + str(len(summary)) + " csv's from " + csvname_all_data + " and " + tunnel_file_name)
+    return summary
 
 
 
-# ============================================EXECUTION================================================================
-
-csvname_all_data="emplacement-des-gares-idf.csv"
-
 
-#Création des fichiers des stations de metro par ligne (Ex: data_metro_3.csv)
-write_interesseting_data(csvname_all_data)
-
-
-#création des fichiers des tunnels de metro par ligne sans les coordonées géographiques (Ex: data_metro_MARKII_3.csv)
-just_tunnel('tunnel_file.csv')
+# ============================================EXECUTION================================================================
 
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Découpe les données RATP en un csv de stations et un csv de tunnels par ligne")
+    parser.add_argument("--stations", default="emplacement-des-gares-idf.csv", help="export des gares d'Ile-de-France")
+    parser.add_argument("--tunnels", default="tunnel_file.csv", help="liste des tunnels (ligne;origine;destination;distance)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="dossier où écrire les csv par ligne")
+    parser.add_argument("--force", action="store_true", help="écrase les csv qui existent déjà dans le dossier")
+    args = parser.parse_args()
+
+    #Création des fichiers des stations de metro par ligne (Ex: data_metro_3.csv)
+    #et des fichiers des tunnels de metro par ligne sans les coordonées géographiques (Ex: data_metro_MARKII_3.csv)
+    try:
+        split_sources(args.stations, args.tunnels, args.output_dir, args.force)
+    except FileExistsError as error:
+        parser.error(error.filename + " already exists, use --force to overwrite it")
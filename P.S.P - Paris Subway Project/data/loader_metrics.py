@@ -0,0 +1,147 @@
+import json
+import sys
+import time
+
+
+#######################################################################################################################################
+#
+#                                           MESURES DU CHARGEMENT
+#
+#######################################################################################################################################
+
+class LoaderMetrics:
+    """
+    Collecte les mesures d'un chargement : débit par fichier, latence de chaque transaction, répartition du temps entre
+    l'envoi des requêtes et le commit, nombre de nouvelles tentatives. Gère aussi l'affichage console : les messages
+    habituels, les requêtes Graql en mode verbose, ou une simple barre de progression en mode quiet.
+    """
+
+    # Bornes supérieures (en ms) des classes de l'histogramme de latence des transactions
+    HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+    PROGRESS_BAR_WIDTH = 40
+
+    def __init__(self, quiet=False, verbose=False):
+        self.quiet = quiet
+        self.verbose = verbose
+        self.started = time.perf_counter()
+        self.files = {}
+        self.histogram = [0] * (len(self.HISTOGRAM_BOUNDS_MS) + 1)
+        self.transactions = 0
+        self.query_seconds = 0.0
+        self.commit_seconds = 0.0
+        self.retries = 0
+        self.bisections = 0
+        self.total_rows = None
+        self.rows_done = 0
+        self._file_started = {}
+
+    # ===== Console =====
+
+    def log(self, message):
+        if not self.quiet:
+            print(message)
+
+    def log_query(self, query):
+        if self.verbose and not self.quiet:
+            print("Executing Graql Query: " + query)
+
+    def progress(self, rows):
+        """
+        Avance la barre de progression de rows lignes. La barre n'est affichée qu'en mode quiet, et seulement si le
+        nombre total de lignes a été renseigné (ce n'est pas le cas dans les processus du chargement parallèle).
+        """
+        self.rows_done += rows
+        if not self.quiet or not self.total_rows:
+            return
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows_done / elapsed if elapsed > 0 else 0
+        done = min(self.rows_done / self.total_rows, 1)
+        bar = "#" * int(done * self.PROGRESS_BAR_WIDTH)
+        sys.stdout.write("\r[" + bar.ljust(self.PROGRESS_BAR_WIDTH) + "] " + str(self.rows_done) + "/" +
+                         str(self.total_rows) + " rows, " + str(int(rate)) + " rows/s")
+        sys.stdout.flush()
+
+    # ===== Mesures =====
+
+    def start_file(self, data_path):
+        self._file_started[data_path] = time.perf_counter()
+
+    def end_file(self, data_path, inserted, rejected):
+        seconds = time.perf_counter() - self._file_started.pop(data_path)
+        rows = inserted + rejected
+        self.files[data_path] = {
+            "rows": rows,
+            "inserted": inserted,
+            "rejected": rejected,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds > 0 else None
+        }
+
+    def record_transaction(self, query_seconds, commit_seconds):
+        """
+        Enregistre une transaction d'écriture, qu'elle ait été commitée ou non
+        :param query_seconds: temps passé à ouvrir la transaction et à envoyer les requêtes
+        :param commit_seconds: temps passé dans le commit
+        """
+        self.transactions += 1
+        self.query_seconds += query_seconds
+        self.commit_seconds += commit_seconds
+        latency_ms = (query_seconds + commit_seconds) * 1000
+        for i, bound in enumerate(self.HISTOGRAM_BOUNDS_MS):
+            if latency_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def record_retry(self):
+        self.retries += 1
+
+    def record_bisection(self):
+        self.bisections += 1
+
+    def merge(self, other):
+        """
+        Ajoute les mesures d'un autre chargement (ex: celles d'un processus du chargement parallèle)
+        """
+        self.files.update(other.files)
+        self.histogram = [mine + theirs for mine, theirs in zip(self.histogram, other.histogram)]
+        self.transactions += other.transactions
+        self.query_seconds += other.query_seconds
+        self.commit_seconds += other.commit_seconds
+        self.retries += other.retries
+        self.bisections += other.bisections
+
+    # ===== Rapport =====
+
+    def report(self):
+        seconds = time.perf_counter() - self.started
+        rows = sum(file["rows"] for file in self.files.values())
+        labels = ["<=" + str(bound) + "ms" for bound in self.HISTOGRAM_BOUNDS_MS] + [">" + str(self.HISTOGRAM_BOUNDS_MS[-1]) + "ms"]
+        return {
+            "seconds": seconds,
+            "rows": rows,
+            "rows_per_second": rows / seconds if seconds > 0 else None,
+            "transactions": self.transactions,
+            "query_seconds": self.query_seconds,
+            "commit_seconds": self.commit_seconds,
+            "retries": self.retries,
+            "bisections": self.bisections,
+            "transaction_latency_histogram": dict(zip(labels, self.histogram)),
+            "files": self.files
+        }
+
+    def write_report(self, path):
+        report = self.report()
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        return report
+
+    def print_summary(self):
+        report = self.report()
+        if self.quiet:
+            print("")
+        print("Loaded " + str(report["rows"]) + " rows in " + "%.2f" % report["seconds"] + " s (" +
+              str(int(report["rows_per_second"] or 0)) + " rows/s), " + str(report["transactions"]) + " transactions, " +
+              "query " + "%.2f" % report["query_seconds"] + " s / commit " + "%.2f" % report["commit_seconds"] + " s, " +
+              str(report["retries"]) + " retries")
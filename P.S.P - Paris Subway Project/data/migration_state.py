@@ -0,0 +1,163 @@
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+
+
+#######################################################################################################################################
+#
+#                                       ETAT DU DERNIER CHARGEMENT REUSSI
+#
+#######################################################################################################################################
+
+# Pour chaque keyspace de chaque serveur : empreintes des fichiers chargés lors de sa dernière migration réussie, et
+# identifiant de son dernier chargement
+STATE_FILE = "./migration_state.json"
+
+
+def file_hash(data_path):
+    """
+    Empreinte sha256 du contenu d'un csv
+    :param data_path: chemin du fichier sans l'extension .csv
+    """
+    sha = hashlib.sha256()
+    with open(data_path + ".csv", "rb") as data:
+        for chunk in iter(lambda: data.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def row_fingerprint(row, fields):
+    """
+    Empreinte d'une ligne de csv, calculée uniquement sur les colonnes chargées dans Grakn
+    :param row: ligne du csv sous forme de dictionnaire
+    :param fields: colonnes prises en compte
+    """
+    content = "\x1f".join(row[field].strip() for field in fields)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def file_fingerprints(data_path, fields):
+    """
+    Calcule l'empreinte du fichier et celle de chacune de ses lignes
+    :return: {"hash": ..., "rows": {empreinte: {"row": ligne, "count": nombre d'occurrences}}}
+    """
+    rows = {}
+    with open(data_path + ".csv") as data:
+        for row in csv.DictReader(data, skipinitialspace = True):
+            row = { field: row[field].strip() for field in fields }
+            fingerprint = row_fingerprint(row, fields)
+            if fingerprint in rows:
+                rows[fingerprint]["count"] += 1
+            else:
+                rows[fingerprint] = {"row": row, "count": 1}
+    return {"hash": file_hash(data_path), "rows": rows}
+
+
+def diff_rows(previous_rows, current_rows):
+    """
+    Compare les lignes du dernier chargement avec celles du fichier actuel
+    :return: la liste des lignes à supprimer et la liste des lignes à insérer (une entrée par occurrence). Une ligne
+    dont le nombre d'occurrences a baissé est supprimée puis réinsérée autant de fois que nécessaire.
+    """
+    removed = []
+    added = []
+    for fingerprint, previous in previous_rows.items():
+        current = current_rows.get(fingerprint)
+        if current is None:
+            removed.append(previous["row"])
+        elif current["count"] < previous["count"]:
+            removed.append(previous["row"])
+            added.extend([current["row"]] * current["count"])
+    for fingerprint, current in current_rows.items():
+        previous = previous_rows.get(fingerprint)
+        if previous is None:
+            added.extend([current["row"]] * current["count"])
+        elif current["count"] > previous["count"]:
+            added.extend([current["row"]] * (current["count"] - previous["count"]))
+    return removed, added
+
+
+def dataset_version(files):
+    """
+    Version du jeu de données chargé : empreinte de l'ensemble des empreintes de fichiers
+    :param files: dictionnaire data_path -> {"hash": ...}
+    """
+    sha = hashlib.sha256()
+    for data_path in sorted(files):
+        sha.update((data_path + ":" + str(files[data_path]["hash"]) + "\n").encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _read_state(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+
+def load_state(uri, keyspace, state_path=STATE_FILE):
+    """
+    :return: l'état de la dernière migration réussie du keyspace, {"dataset_version": ..., "files": ...}, ou None si
+    aucune n'est enregistrée ou si le keyspace a été rechargé depuis autrement (restauration d'un snapshot)
+    """
+    return _read_state(state_path).get("databases", {}).get(database_key(uri, keyspace))
+
+
+def _write_state(state, state_path):
+    #L'écriture passe par un fichier temporaire pour ne jamais laisser un état à moitié écrit si la migration est interrompue
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(tmp_path, state_path)
+
+
+def save_state(files, uri, keyspace, state_path=STATE_FILE):
+    """
+    Enregistre les empreintes du chargement du keyspace qui vient de réussir, sans toucher à celles des autres keyspaces
+    :return: l'état enregistré pour le keyspace
+    """
+    state = _read_state(state_path)
+    #Ancien format : une seule empreinte, sans savoir de quel keyspace
+    state.pop("dataset_version", None)
+    state.pop("files", None)
+    database_state = {
+        "dataset_version": dataset_version(files),
+        "files": files
+    }
+    state.setdefault("databases", {})[database_key(uri, keyspace)] = database_state
+    _write_state(state, state_path)
+    return database_state
+
+
+def drop_state(uri, keyspace, state_path=STATE_FILE):
+    """
+    Oublie les empreintes du keyspace quand il est rechargé sans la migration (restauration d'un snapshot) : elles ne
+    décrivent plus son contenu, le prochain chargement incrémental demandera une migration complète
+    """
+    state = _read_state(state_path)
+    if state.get("databases", {}).pop(database_key(uri, keyspace), None) is not None:
+        _write_state(state, state_path)
+
+
+def database_key(uri, keyspace):
+    """
+    Clé d'un keyspace d'un serveur dans "databases" et "loads", au même format que migration_marker.database_key
+    """
+    return uri + "/" + keyspace
+
+
+def record_load(uri, keyspace, state_path=STATE_FILE):
+    """
+    Enregistre un nouvel identifiant de chargement pour le keyspace, après une migration, une restauration ou tout
+    autre rechargement. Les ids Grakn changent d'un chargement à l'autre même si les csv sont identiques : les caches
+    des réponses et du réseau sont gardés par cet identifiant et non par la version du jeu de données.
+    :return: l'identifiant du chargement
+    """
+    state = _read_state(state_path)
+    load_id = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+    state.setdefault("loads", {})[database_key(uri, keyspace)] = load_id
+    _write_state(state, state_path)
+    return load_id
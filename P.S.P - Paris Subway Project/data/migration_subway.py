@@ -1,7 +1,41 @@
 
 
-from grakn.client import GraknClient
+from canonical_stations import canonicalise, normalise_nom, CANONICAL_FILE
+from migration_state import file_fingerprints, diff_rows, load_state, record_load, row_fingerprint, save_state
+from loader_metrics import LoaderMetrics
+from route_distances import add_route_distances
+import argparse
 import csv
+import json
+import multiprocessing
+import os
+import time
+
+try:
+    from grakn.client import GraknClient
+except ImportError:
+    #Sans le client, seul le Grakn en mémoire de memory_grakn.py peut servir (GRAKN_URI=memory:)
+    GraknClient = None
+
+
+# Nombre de requêtes envoyées dans une même transaction avant le commit
+BATCH_SIZE = 50
+# Nombre de nouvelles tentatives pour un lot avant de le couper en deux
+MAX_RETRIES = 1
+# Nombre de processus utilisés pour charger les fichiers de routes (1 = chargement séquentiel)
+WORKERS = 1
+
+# Serveur Grakn, ou GRAKN_URI=memory: pour le Grakn en mémoire utilisé par benchmarks.py
+GRAKN_URI = os.environ.get("GRAKN_URI", "localhost:48555")
+KEYSPACE = "paris_subway"
+# Keyspace vidé et rechargé à chaque passage du mode --benchmark
+BENCHMARK_KEYSPACE = "paris_subway_benchmark"
+SCHEMA_FILE = "../schema/schema_subway.gql"
+# Rapport JSON des mesures du chargement
+REPORT_FILE = "./loader_report.json"
+
+# Mesures du chargement en cours, et affichage console associé
+metrics = LoaderMetrics()
 
 
 #######################################################################################################################################
@@ -10,66 +44,547 @@ import csv
 #                                                      
 #######################################################################################################################################
 
-def build_vente_graph(inputs):
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace = "paris_subway") as session:
-            liste_station = []
+def grakn_client():
+    """
+    Client du serveur GRAKN_URI. Une uri memory: ouvre le Grakn en mémoire de memory_grakn.py, qui se trouve dans le
+    dossier du projet : celui-ci doit être dans le sys.path, comme le fait benchmarks.py. Les keyspaces en mémoire ne
+    vivent que le temps du processus, et ne sont pas partagés avec les processus du chargement parallèle.
+    """
+    if GRAKN_URI.startswith("memory:"):
+        import memory_grakn
+        return memory_grakn.GraknClient(GRAKN_URI)
+    return GraknClient(uri=GRAKN_URI)
+
+
+def build_vente_graph(inputs, batch_size=BATCH_SIZE, keyspace=KEYSPACE):
+    rejected = []
+    with grakn_client() as client:
+        with client.session(keyspace = keyspace) as session:
+            liste_station = set()
+            station_ids = None
             for input in inputs:
-                print("Loading from [" + input["data_path"] + "] into Grakn ...")
+                metrics.log("Loading from [" + input["data_path"] + "] into Grakn ...")
 
                 #On veut faire en sorte d'append qu'une seule fois la station dans la db Grakn 
-                #Du coup on doit prévoir le cas où la station a été ajoutée avant.
-                #Ex: Si Chatelet a été append via le fichier de la ligne 7, la station en sera pas append dans la db par le fichier de la ligne 14.
-                
-                liste_fichier = ["./data_metro_14","./data_metro_13","./data_metro_12","./data_metro_11","./data_metro_10","./data_metro_9","./data_metro_8","./data_metro_7","./data_metro_6","./data_metro_5","./data_metro_4","./data_metro_3","./data_metro_2","./data_metro_1","./data_metro_7b","./data_metro_M3bis"]
-                if input["data_path"]  in liste_fichier : 
-                    load_data_into_grakn(input, session,liste_station)
+                #Les stations sont déjà fusionnées par canonical_stations.py, l'ensemble liste_station ne sert plus
+                #que de garde-fou si plusieurs fichiers de stations sont chargés.
+                if input["template"] is station_template : 
+                    inserted, input_rejected = load_data_into_grakn(input, session, liste_station, batch_size)
                 else : 
-                    load_data_into_grakn2(input, session)
+                    #Les stations sont toutes chargées : on récupère leurs ids Grakn une seule fois
+                    if station_ids is None:
+                        station_ids = resolve_station_ids(session)
+                        route_inputs = [input for input in inputs if input["template"] is relation_route]
+                        report_unresolved_routes(
+                            { input["data_path"]: parse_data_to_dictionaries(input) for input in route_inputs }, station_ids)
+                    inserted, input_rejected = load_data_into_grakn2(input, session, batch_size, station_ids)
+                rejected.extend(input_rejected)
+    return rejected
 
 
-def load_data_into_grakn(input, session,liste_station):
-    items = parse_data_to_dictionaries(input)
-    for item in items:
-        with session.transaction().write() as transaction:
+def load_data_into_grakn(input, session, liste_station, batch_size=BATCH_SIZE):
+
+    metrics.start_file(input["data_path"])
+
+    def station_queries():
+        for item in parse_data_to_dictionaries(input):
             graql_insert_query = input["template"](item)
             name = graql_insert_query[1]
             if name not in liste_station:
-                liste_station.append(name)
-                print("Executing Graql Query: " + graql_insert_query[0])
-                    
-                transaction.query(graql_insert_query[0])
-                transaction.commit()
+                liste_station.add(name)
+                metrics.log_query(graql_insert_query[0])
+                yield graql_insert_query[0], [(item, False)]
+
+    inserted, rejected = load_rows_in_batches(input, station_queries(), session, batch_size)
+
+    metrics.end_file(input["data_path"], inserted, len(rejected))
+    metrics.log("\nInserted " + str(inserted) + " items from [ " + input["data_path"] + "] into Grakn.\n")
+    return inserted, rejected
+
+
+
+
+def load_data_into_grakn2(input, session, batch_size=BATCH_SIZE, station_ids=None):
+
+    metrics.start_file(input["data_path"])
+    inserted, rejected = load_route_rows(input, parse_data_to_dictionaries(input), session, batch_size, station_ids)
+
+    metrics.end_file(input["data_path"], inserted, len(rejected))
+    metrics.log("\nInserted " + str(inserted) + " items from [ " + input["data_path"] + "] into Grakn.\n")
+    return inserted, rejected
+
+
+def load_route_rows(input, tunnels, session, batch_size=BATCH_SIZE, station_ids=None):
+    """
+    Insère des routes par lots. Si station_ids est fourni, les routes sont insérées à partir des ids Grakn des
+    stations plutôt qu'en cherchant les deux stations par leur nom à chaque requête, et les routes dont une extrémité
+    n'existe pas sont écartées au lieu d'être envoyées pour ne rien insérer.
+    :param input: le fichier MARKII des routes
+    :param tunnels: itérable de lignes de ce fichier
+    :param station_ids: dictionnaire nom de station -> id Grakn, renvoyé par resolve_station_ids
+    :return: le nombre de routes commitées et la liste des routes rejetées ou non résolues (voir rejected_row)
+    """
+    unresolved = []
+
+    def route_queries():
+        for tunnel in tunnels:
+            if station_ids is None:
+                graql_insert_query = relation_route(tunnel)
+            elif tunnel["origin"] in station_ids and tunnel["destination"] in station_ids:
+                graql_insert_query = relation_route_by_id(tunnel, station_ids)
+            else:
+                unresolved.append(rejected_row(input, tunnel, relation_route(tunnel)))
+                metrics.progress(1)
+                continue
+            metrics.log_query(graql_insert_query)
+            yield graql_insert_query, [(tunnel, False)]
+
+    inserted, rejected = load_rows_in_batches(input, route_queries(), session, batch_size)
+    return inserted, rejected + unresolved
+
+
+def resolve_station_ids(session):
+    """
+    Récupère en une seule requête l'id Grakn de chaque station
+    :return: dictionnaire nom de station -> id Grakn
+    """
+    station_ids = {}
+    with session.transaction().read() as transaction:
+        for answer in transaction.query('match $station isa station, has name $name; get $station, $name;'):
+            station_ids[answer.get("name").value()] = answer.get("station").id
+    metrics.log("Resolved " + str(len(station_ids)) + " station ids.")
+    return station_ids
+
+
+def report_unresolved_routes(tunnels_by_path, station_ids):
+    """
+    Liste, avant d'insérer la moindre route, les noms de stations des fichiers MARKII qui ne correspondent à aucune
+    station de la db. Quand le nom ne diffère que par la casse ou les accents, la station la plus proche est proposée.
+    :param tunnels_by_path: dictionnaire data_path -> itérable de lignes de routes
+    :param station_ids: dictionnaire nom de station -> id Grakn
+    :return: le nombre de routes qui ne seront pas insérées
+    """
+    known = { normalise_nom(name): name for name in station_ids }
+    unresolved = 0
+    for data_path, tunnels in tunnels_by_path.items():
+        for tunnel in tunnels:
+            missing = [name for name in (tunnel["origin"], tunnel["destination"]) if name not in station_ids]
+            if not missing:
+                continue
+            unresolved += 1
+            for name in missing:
+                message = "Unresolved station [" + name + "] in " + data_path + " (" + tunnel["station_ligne"] + ", " + \
+                          tunnel["origin"] + " -> " + tunnel["destination"] + ")"
+                suggestion = known.get(normalise_nom(name))
+                if suggestion is not None:
+                    message += ", did you mean [" + suggestion + "] ?"
+                metrics.log(message)
+    if unresolved:
+        metrics.log(str(unresolved) + " routes will not be inserted because one of their stations does not exist.\n")
+    return unresolved
 
 
-    print("\nInserted " + str(len(items)) + " items from [ " + input["data_path"] + "] into Grakn.\n")
+#######################################################################################################################################
+# 
+#                                               CHARGEMENT PARALLELE DES ROUTES
+#                                                      
+#######################################################################################################################################
 
+def build_vente_graph_parallel(inputs, workers=WORKERS, batch_size=BATCH_SIZE, keyspace=KEYSPACE):
+    """
+    Charge d'abord toutes les stations sur une seule session, puis répartit les fichiers MARKII entre plusieurs
+    processus. Chaque ligne est indépendante des autres une fois les stations présentes dans la db.
+    :param inputs: la liste des fichiers à charger avec leur template
+    :param workers: nombre de processus pour les routes
+    :param batch_size: nombre de requêtes par transaction
+    :return: la liste des requêtes rejetées
+    """
+    station_inputs = [input for input in inputs if input["template"] is station_template]
+    route_inputs = [input for input in inputs if input["template"] is relation_route]
+
+    rejected = build_vente_graph(station_inputs, batch_size, keyspace)
+
+    with grakn_client() as client:
+        with client.session(keyspace = keyspace) as session:
+            station_ids = resolve_station_ids(session)
+    report_unresolved_routes({ input["data_path"]: parse_data_to_dictionaries(input) for input in route_inputs }, station_ids)
+
+    metrics.log("Loading " + str(len(route_inputs)) + " route files with " + str(workers) + " workers ...")
+    report = []
+    with multiprocessing.Pool(workers) as pool:
+        jobs = [(input, batch_size, station_ids, keyspace, metrics.quiet, metrics.verbose) for input in route_inputs]
+        for result in pool.imap_unordered(load_route_file, jobs):
+            report.append(result)
+            metrics.merge(result["metrics"])
+            metrics.progress(result["rows"])
+            metrics.log("[" + result["worker"] + "] " + result["data_path"] + " : " + str(result["inserted"]) + "/" +
+                  str(result["rows"]) + " routes inserted (" + str(len(report)) + "/" + str(len(jobs)) + " files done)")
+
+    print_reconciliation_report(report, keyspace)
+    for result in report:
+        rejected.extend(result["rejected"])
+    return rejected
+
+
+def load_route_file(job):
+    """
+    Tâche exécutée par un processus du pool : ouvre son propre client et sa propre session puis charge un fichier MARKII
+    :param job: tuple (input, batch_size, station_ids, keyspace, quiet, verbose)
+    :return: dictionnaire décrivant le résultat du chargement du fichier, avec les mesures du processus
+    """
+    global metrics
+    input, batch_size, station_ids, keyspace, quiet, verbose = job
+    metrics = LoaderMetrics(quiet, verbose)
+    worker = multiprocessing.current_process().name
+    metrics.log("[" + worker + "] Loading from [" + input["data_path"] + "] into Grakn ...")
+    with grakn_client() as client:
+        with client.session(keyspace = keyspace) as session:
+            inserted, rejected = load_data_into_grakn2(input, session, batch_size, station_ids)
+    return {
+        "worker": worker,
+        "data_path": input["data_path"],
+        "rows": inserted + len(rejected),
+        "inserted": inserted,
+        "rejected": rejected,
+        "metrics": metrics
+    }
+
+
+def print_reconciliation_report(report, keyspace=KEYSPACE):
+    """
+    Compare le nombre de lignes lues, insérées et rejetées par fichier avec le nombre de routes présentes dans la db
+    :param report: liste des résultats renvoyés par load_route_file
+    """
+    print("\n********************RECONCILIATION******************************\n")
+    for result in sorted(report, key=lambda result: result["data_path"]):
+        print(result["data_path"] + " : " + str(result["rows"]) + " rows, " + str(result["inserted"]) +
+              " inserted, " + str(len(result["rejected"])) + " rejected")
+        for row in result["rejected"]:
+            print("    " + row["query"])
+
+    rows = sum(result["rows"] for result in report)
+    inserted = sum(result["inserted"] for result in report)
+    print("\nTotal : " + str(rows) + " rows, " + str(inserted) + " inserted, " + str(rows - inserted) + " rejected")
+
+    with grakn_client() as client:
+        with client.session(keyspace = keyspace) as session:
+            with session.transaction().read() as transaction:
+                route_count = list(transaction.query("compute count in route;"))[0].number()
+    print("Routes in the keyspace : " + str(route_count))
+    if route_count != inserted:
+        print("WARNING : " + str(inserted) + " routes committed but " + str(route_count) + " found in the keyspace")
 
 
+#######################################################################################################################################
+# 
+#                                                   ECRITURE PAR LOTS
+#                                                      
+#######################################################################################################################################
 
-def load_data_into_grakn2(input, session):
-    items = parse_data_to_dictionaries(input)
-    for item in items:
-        with session.transaction().write() as transaction:
-            graql_insert_query = input["template"](item)
-            print("Executing Graql Query: " + graql_insert_query)
-                    
-            transaction.query(graql_insert_query)
-            transaction.commit()
+def batched(queries, batch_size):
+    """
+    Regroupe les requêtes d'un itérable en listes d'au plus batch_size éléments
+    :param queries: itérable de requêtes Graql
+    :param batch_size: taille maximale d'un lot
+    :return: générateur de lots
+    """
+    batch = []
+    for query in queries:
+        batch.append(query)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_queries_in_batches(queries, session, batch_size=BATCH_SIZE):
+    """
+    Envoie les requêtes par lots, avec un seul commit par lot
+    :param queries: itérable de requêtes Graql d'insertion
+    :param session: session Grakn ouverte sur le keyspace
+    :param batch_size: nombre de requêtes par transaction
+    :return: le nombre de requêtes commitées et la liste des requêtes rejetées
+    """
+    inserted = 0
+    rejected = []
+    for batch in batched(queries, batch_size):
+        batch_inserted, batch_rejected = commit_batch(batch, session)
+        inserted += batch_inserted
+        rejected.extend(batch_rejected)
+        metrics.progress(len(batch))
+    return inserted, rejected
+
+
+def rejected_row(input, row, query, removed=False):
+    """
+    Ligne d'un fichier dont une requête a été rejetée. Elle est repérée par son empreinte, pour que record_state sache
+    que la db ne correspond pas au fichier pour cette ligne.
+    :param removed: True si la requête devait retirer la ligne de la db (suppression, ancienne valeur d'une mise à jour),
+    False si elle devait l'y ajouter
+    """
+    fields = FINGERPRINT_FIELDS[input["template"]]
+    row = { field: row[field].strip() for field in fields }
+    return {
+        "data_path": input["data_path"],
+        "fingerprint": row_fingerprint(row, fields),
+        "row": row,
+        "removed": removed,
+        "query": query
+    }
+
+
+def load_rows_in_batches(input, row_queries, session, batch_size=BATCH_SIZE):
+    """
+    Envoie par lots les requêtes des lignes d'un fichier
+    :param row_queries: itérable de (requête, liste de (ligne, removed)) : les lignes concernées par chaque requête, une
+    mise à jour concernant à la fois l'ancienne et la nouvelle ligne
+    :return: le nombre de requêtes commitées et la liste des lignes rejetées (voir rejected_row)
+    """
+    rows_by_query = {}
+
+    def queries():
+        for query, rows in row_queries:
+            rows_by_query[query] = rows
+            yield query
+
+    inserted, rejected = load_queries_in_batches(queries(), session, batch_size)
+    return inserted, [rejected_row(input, row, query, removed) for query in rejected for row, removed in rows_by_query[query]]
+
+
+def commit_batch(batch, session, max_retries=MAX_RETRIES):
+    """
+    Exécute un lot de requêtes dans une seule transaction d'écriture.
+    Si le commit échoue après max_retries nouvelles tentatives, le lot est coupé en deux et chaque moitié est
+    rejouée, jusqu'à isoler la ou les requêtes fautives sans perdre le reste du lot.
+    :param batch: liste de requêtes Graql
+    :param session: session Grakn ouverte sur le keyspace
+    :param max_retries: nombre de nouvelles tentatives avant la bissection
+    :return: le nombre de requêtes commitées et la liste des requêtes rejetées
+    """
+    error = None
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            metrics.record_retry()
+        start = time.perf_counter()
+        committing = None
+        try:
+            with session.transaction().write() as transaction:
+                for query in batch:
+                    transaction.query(query)
+                committing = time.perf_counter()
+                transaction.commit()
+            metrics.record_transaction(committing - start, time.perf_counter() - committing)
+            return len(batch), []
+        except Exception as e:
+            error = e
+            if committing is None:
+                metrics.record_transaction(time.perf_counter() - start, 0.0)
+            else:
+                metrics.record_transaction(committing - start, time.perf_counter() - committing)
+
+    if len(batch) == 1:
+        metrics.log("Rejected Graql Query: " + batch[0] + "\n" + str(error))
+        return 0, batch
+
+    metrics.record_bisection()
+    middle = len(batch) // 2
+    left_inserted, left_rejected = commit_batch(batch[:middle], session, max_retries)
+    right_inserted, right_rejected = commit_batch(batch[middle:], session, max_retries)
+    return left_inserted + right_inserted, left_rejected + right_rejected
 
 
-    print("\nInserted " + str(len(items)) + " items from [ " + input["data_path"] + "] into Grakn.\n")
+#######################################################################################################################################
+# 
+#                                               MIGRATION INCREMENTALE
+#                                                      
+#######################################################################################################################################
 
+def build_vente_graph_incremental(inputs, batch_size=BATCH_SIZE, keyspace=KEYSPACE):
+    """
+    Compare chaque csv avec son empreinte lors du dernier chargement réussi et n'envoie que les suppressions et les
+    insertions des lignes qui ont changé. Les fichiers dont le contenu n'a pas bougé ne sont même pas relus ligne
+    à ligne par Grakn.
+    :param inputs: la liste des fichiers à charger avec leur template
+    :param batch_size: nombre de requêtes par transaction
+    :return: la liste des requêtes rejetées, ou None si aucun chargement précédent n'est enregistré
+    """
+    state = load_state(GRAKN_URI, keyspace)
+    if state is None:
+        metrics.log("No previous load of " + keyspace + " recorded in migration_state.json, run a full migration first.")
+        return None
+
+    #Les différences sont calculées pour tous les fichiers avant d'envoyer quoi que ce soit à Grakn, celles des stations
+    #en premier
+    diffs = []
+    deleted_stations = set()
+    for input in sorted(inputs, key=lambda input: input["template"] is not station_template):
+        fields = FINGERPRINT_FIELDS[input["template"]]
+        previous = state["files"].get(input["data_path"], {"hash": None, "rows": {}})
+        current = file_fingerprints(input["data_path"], fields)
+
+        if input["template"] is relation_route and deleted_stations:
+            #Supprimer une station supprime aussi ses routes dans Grakn : elles sont retirées du dernier chargement pour
+            #être réinsérées si elles sont toujours dans le csv, ou écartées comme non résolues tant que la station
+            #n'est pas revenue
+            rows = { fingerprint: entry for fingerprint, entry in previous["rows"].items()
+                     if entry["row"]["origin"] not in deleted_stations and entry["row"]["destination"] not in deleted_stations }
+            if len(rows) != len(previous["rows"]):
+                previous = {"hash": None, "rows": rows}
+
+        if previous["hash"] == current["hash"]:
+            continue
+
+        removed, added = diff_rows(previous["rows"], current["rows"])
+        metrics.log("[" + input["data_path"] + "] changed : " + str(len(removed)) + " rows removed, " +
+              str(len(added)) + " rows added")
+        diffs.append((input, removed, added))
+        if input["template"] is station_template:
+            deleted_stations |= set(station["name"] for station in removed) - set(station["name"] for station in added)
+
+    rejected = []
+    with grakn_client() as client:
+        with client.session(keyspace = keyspace) as session:
+            for input, removed, added in diffs:
+                if input["template"] is station_template:
+                    metrics.start_file(input["data_path"])
+                    inserted, input_rejected = load_rows_in_batches(input, diff_station_queries(removed, added), session, batch_size)
+                    metrics.end_file(input["data_path"], inserted, len(input_rejected))
+                    rejected.extend(input_rejected)
+
+            route_diffs = [diff for diff in diffs if diff[0]["template"] is relation_route]
+            if route_diffs:
+                station_ids = resolve_station_ids(session)
+                report_unresolved_routes({ input["data_path"]: added for input, removed, added in route_diffs }, station_ids)
+
+            for input, removed, added in route_diffs:
+                metrics.start_file(input["data_path"])
+                deleted, delete_rejected = load_rows_in_batches(
+                    input, ((delete_route_template(tunnel), [(tunnel, True)]) for tunnel in removed), session, batch_size)
+                inserted, insert_rejected = load_route_rows(input, added, session, batch_size, station_ids)
+                metrics.end_file(input["data_path"], deleted + inserted, len(delete_rejected) + len(insert_rejected))
+                rejected.extend(delete_rejected + insert_rejected)
+    return rejected
+
+
+def diff_station_queries(removed, added):
+    """
+    Traduit les stations supprimées et ajoutées d'un fichier en requêtes Graql, suppressions d'abord.
+    Une station dont seul le station_id ou les coordonnées ont changé est mise à jour sur place pour ne pas perdre
+    ses routes.
+    :return: générateur de (requête, liste de (ligne, removed)), voir load_rows_in_batches
+    """
+    removed_by_name = { station["name"]: station for station in removed }
+    added_by_name = { station["name"]: station for station in added }
+    for name, station in removed_by_name.items():
+        if name in added_by_name:
+            for query in update_station_template(station, added_by_name[name]):
+                yield query, [(station, True), (added_by_name[name], False)]
+        else:
+            for query in delete_station_template(station):
+                yield query, [(station, True)]
+    for name, station in added_by_name.items():
+        if name not in removed_by_name:
+            yield station_template(station)[0], [(station, False)]
+
+
+def record_state(inputs, rejected, keyspace=KEYSPACE):
+    """
+    Enregistre les empreintes des fichiers après un chargement du keyspace. Une ligne dont l'ajout a été rejeté n'est
+    pas enregistrée, une ligne dont le retrait (suppression, ancienne valeur d'une mise à jour) a été rejeté reste
+    enregistrée : leur fichier garde une empreinte vide pour être rediffé au prochain chargement incrémental, qui
+    renverra ces requêtes.
+    :param rejected: liste des lignes rejetées, voir rejected_row
+    """
+    rejected_by_file = {}
+    for row in rejected:
+        rejected_by_file.setdefault(row["data_path"], []).append(row)
+
+    files = {}
+    for input in inputs:
+        fingerprints = file_fingerprints(input["data_path"], FINGERPRINT_FIELDS[input["template"]])
+        rows = fingerprints["rows"]
+        for row in rejected_by_file.get(input["data_path"], []):
+            if row["removed"]:
+                rows.setdefault(row["fingerprint"], {"row": row["row"], "count": 1})
+            else:
+                rows.pop(row["fingerprint"], None)
+            fingerprints["hash"] = None
+        files[input["data_path"]] = fingerprints
+
+    state = save_state(files, GRAKN_URI, keyspace)
+    metrics.log("Recorded dataset version " + state["dataset_version"])
+    return state
 
-#Ajout de la relation qui manque après l'importation de toutes les données entre les stations Argentine et Charles de Gaulle Etoile
-def ajout_relation() :
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace = "paris_subway") as session:
+
+#######################################################################################################################################
+# 
+#                                                   BENCHMARK
+#                                                      
+#######################################################################################################################################
+
+def count_rows(inputs):
+    """
+    Nombre total de lignes des csv à charger, pour la barre de progression
+    """
+    rows = 0
+    for input in inputs:
+        with open(input["data_path"] + ".csv") as data:
+            rows += sum(1 for line in data) - 1
+    return rows
+
+
+def reset_keyspace(keyspace):
+    """
+    Supprime le keyspace s'il existe puis le recrée avec le schéma du projet
+    """
+    with grakn_client() as client:
+        if keyspace in client.keyspaces().retrieve():
+            client.keyspaces().delete(keyspace)
+        with client.session(keyspace = keyspace) as session:
             with session.transaction().write() as transaction:
-                graql_insert_query = ' match $station1 isa station, has name "Argentine"; $station2 isa station, has name "Charles De Gaulle Etoile"; insert $new-route (beginning : $station1, end : $station2 ) isa route, has station_ligne "M1";'
-                transaction.query(graql_insert_query)
+                with open(SCHEMA_FILE) as schema:
+                    transaction.query(schema.read())
                 transaction.commit()
 
+
+def run_benchmark(inputs, runs, workers=WORKERS, batch_size=BATCH_SIZE, keyspace=BENCHMARK_KEYSPACE, report_path=REPORT_FILE):
+    """
+    Lance runs fois la migration complète, chaque fois sur un keyspace recréé à vide, et écrit les mesures de chaque
+    passage ainsi que leur synthèse dans report_path
+    """
+    global metrics
+    reports = []
+    for run in range(runs):
+        print("Benchmark run " + str(run + 1) + "/" + str(runs) + " on keyspace " + keyspace + " ...")
+        reset_keyspace(keyspace)
+        metrics = LoaderMetrics(quiet=True)
+        metrics.total_rows = count_rows(inputs)
+        if workers > 1:
+            build_vente_graph_parallel(inputs, workers, batch_size, keyspace)
+        else:
+            build_vente_graph(inputs, batch_size, keyspace)
+        metrics.print_summary()
+        reports.append(metrics.report())
+        #Le keyspace a été rechargé avec de nouveaux ids Grakn
+        record_load(GRAKN_URI, keyspace)
+
+    seconds = sorted(report["seconds"] for report in reports)
+    summary = {
+        "runs": runs,
+        "workers": workers,
+        "batch_size": batch_size,
+        "min_seconds": seconds[0],
+        "median_seconds": seconds[len(seconds) // 2],
+        "max_seconds": seconds[-1],
+        "reports": reports
+    }
+    with open(report_path, "w") as report_file:
+        json.dump(summary, report_file, indent=2)
+    print("Benchmark : median " + "%.2f" % summary["median_seconds"] + " s over " + str(runs) + " runs -> " + report_path)
+    return summary
+
+
 #######################################################################################################################################
 # 
 #                                              QUERIES ASSIOCEES A SON ENTITE
@@ -101,10 +616,76 @@ def relation_route(tunnel) :
     end = tunnel["destination"]
 
     graql_insert_query = 'match $station1 isa station, has name "'+beginning+'"; $station2 isa station, has name "'+end+'";'
-    graql_insert_query += ' insert $new-route (beginning : $station1, end: $station2) isa route, has station_ligne "'+ tunnel["station_ligne"]+'";'
+    graql_insert_query += ' insert $new-route (beginning : $station1, end: $station2) isa route, has station_ligne "'+ tunnel["station_ligne"]+'"'
+    graql_insert_query += route_distance(tunnel) + ';'
 
     return graql_insert_query
 
+
+def relation_route_by_id(tunnel, station_ids) :
+
+    beginning = station_ids[tunnel["origin"]]
+    end = station_ids[tunnel["destination"]]
+
+    graql_insert_query = 'match $station1 id '+beginning+'; $station2 id '+end+';'
+    graql_insert_query += ' insert $new-route (beginning : $station1, end: $station2) isa route, has station_ligne "'+ tunnel["station_ligne"]+'"'
+    graql_insert_query += route_distance(tunnel) + ';'
+
+    return graql_insert_query
+
+
+def route_distance(tunnel):
+    #La distance est calculée par route_distances.py, elle est vide si une des deux stations est inconnue
+    if tunnel.get("distance"):
+        return ', has distance ' + tunnel["distance"]
+    return ''
+
+
+def update_station_template(old_station, station):
+
+    name = station["name"]
+
+    graql_delete_query = 'match $station isa station, has name "' + name + '", has station_id $station_id, has lat $lat, has lon $lon;'
+    graql_delete_query += ' delete $station has station_id $station_id; $station has lat $lat; $station has lon $lon;'
+
+    graql_insert_query = 'match $station isa station, has name "' + name + '";'
+    graql_insert_query += ' insert $station has station_id "' + station["station_id"] + '"'
+    graql_insert_query += ', has lat ' + station["lat"]
+    graql_insert_query += ', has lon ' + station["lon"]
+    graql_insert_query += ";"
+
+    return graql_delete_query, graql_insert_query
+
+
+def delete_station_template(station):
+
+    name = station["name"]
+
+    #Les routes qui partent ou arrivent à la station sont supprimées avant la station elle-même
+    graql_delete_routes = 'match $station isa station, has name "' + name + '"; $route ($station) isa route; delete $route isa route;'
+    graql_delete_query = 'match $station isa station, has name "' + name + '"; delete $station isa station;'
+
+    return graql_delete_routes, graql_delete_query
+
+
+def delete_route_template(tunnel):
+
+    beginning = tunnel["origin"]
+    end = tunnel["destination"]
+
+    graql_delete_query = 'match $station1 isa station, has name "'+beginning+'"; $station2 isa station, has name "'+end+'";'
+    graql_delete_query += ' $route (beginning : $station1, end: $station2) isa route, has station_ligne "'+ tunnel["station_ligne"]+'";'
+    graql_delete_query += ' delete $route isa route;'
+
+    return graql_delete_query
+
+
+# Colonnes chargées dans Grakn pour chaque type de fichier, utilisées pour calculer les empreintes de lignes
+FINGERPRINT_FIELDS = {
+    station_template: ["station_id", "name", "lat", "lon"],
+    relation_route: ["station_ligne", "origin", "destination", "distance"],
+}
+
     
 
 
@@ -117,12 +698,10 @@ def relation_route(tunnel) :
 
 
 def parse_data_to_dictionaries(input):
-    items = []
+    #Générateur : les lignes sont lues au fur et à mesure pour ne pas charger tout le fichier en mémoire
     with open(input["data_path"] + ".csv") as data:
         for row in csv.DictReader(data, skipinitialspace = True):
-            item = { key: value for key, value in row.items() }
-            items.append(item)
-    return items
+            yield { key: value for key, value in row.items() }
 
 
 
@@ -138,69 +717,9 @@ station_liste = []
 
 inputs = [
     {
-        "data_path": "./data_metro_1",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_2",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_3",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_4",
+        "data_path": CANONICAL_FILE,
         "template": station_template,
     },
-        {
-        "data_path": "./data_metro_5",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_6",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_7",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_7b",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_8",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_9",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_10",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_11",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_12",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_13",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_14",
-        "template": station_template,
-    },
-        {
-        "data_path": "./data_metro_M3bis",
-        "template": station_template,
-    },  
     {
         "data_path": "./data_metro_MARKII_1",
         "template": relation_route,
@@ -265,9 +784,54 @@ inputs = [
         "data_path": "./data_metro_MARKII_3 bis",
         "template": relation_route,
     },
+    #Corrections faites à la main après l'import (ex: la relation qui manque entre Argentine et Charles de Gaulle Etoile)
+    {
+        "data_path": "./corrections_routes",
+        "template": relation_route,
+    },
 ]
 
-build_vente_graph(inputs)
-
-#On ajoute la relation qui manque entre les stations Charles de Gaulle Etoile et Argentine
-ajout_relation()
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Charge les csv du metro parisien dans le keyspace paris_subway")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="nombre de requêtes par transaction (un commit par lot)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="nombre de processus pour charger les routes en parallèle (1 = séquentiel)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="n'envoie que les différences avec le dernier chargement réussi")
+    parser.add_argument("--keyspace", default=None,
+                        help="keyspace à charger (" + KEYSPACE + " par défaut, " + BENCHMARK_KEYSPACE + " avec --benchmark)")
+    parser.add_argument("--quiet", action="store_true", help="remplace les messages par une barre de progression")
+    parser.add_argument("--verbose", action="store_true", help="affiche chaque requête Graql envoyée")
+    parser.add_argument("--report", default=REPORT_FILE, help="fichier JSON où écrire les mesures du chargement")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N",
+                        help="lance N fois la migration complète sur un keyspace vidé à chaque fois")
+    args = parser.parse_args()
+
+    #Fusion hors ligne des data_metro_{ligne}.csv en une seule table de stations
+    canonicalise()
+    #Longueur de chaque route, écrite dans la colonne distance des fichiers MARKII
+    add_route_distances([input["data_path"] for input in inputs if input["template"] is relation_route])
+
+    if args.benchmark:
+        run_benchmark(inputs, args.benchmark, args.workers, args.batch_size, args.keyspace or BENCHMARK_KEYSPACE, args.report)
+    else:
+        keyspace = args.keyspace or KEYSPACE
+        metrics = LoaderMetrics(args.quiet, args.verbose)
+        metrics.total_rows = count_rows(inputs)
+
+        if args.incremental:
+            rejected = build_vente_graph_incremental(inputs, args.batch_size, keyspace)
+        elif args.workers > 1:
+            rejected = build_vente_graph_parallel(inputs, args.workers, args.batch_size, keyspace)
+        else:
+            rejected = build_vente_graph(inputs, args.batch_size, keyspace)
+
+        metrics.print_summary()
+        metrics.write_report(args.report)
+
+        if rejected is not None:
+            record_state(inputs, rejected, keyspace)
+            #Nouvel identifiant de chargement : les caches de l'application (réseau, réponses des requêtes) sont invalidés
+            metrics.log("Recorded load " + record_load(GRAKN_URI, keyspace) + " of " + keyspace)
@@ -0,0 +1,92 @@
+import csv
+import numpy as np
+from canonical_stations import CANONICAL_FILE
+
+
+#######################################################################################################################################
+#
+#                                           LONGUEUR DES ROUTES
+#
+#######################################################################################################################################
+
+# Rayon moyen de la Terre, le même que celui de geopy.distance.great_circle
+EARTH_RADIUS_KM = 6371.009
+
+TUNNEL_HEADER = ['station_ligne', 'origin', 'destination', 'distance']
+
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    """
+    Distance orthodromique (formule de haversine) entre deux tableaux de points, en une seule opération NumPy
+    :param lat1, lon1: coordonnées en degrés des points de départ
+    :param lat2, lon2: coordonnées en degrés des points d'arrivée
+    :return: tableau des distances en kilomètres
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def load_station_coordinates(stations_path=CANONICAL_FILE):
+    """
+    :return: dictionnaire nom -> index, tableau des latitudes, tableau des longitudes
+    """
+    index = {}
+    lats = []
+    lons = []
+    with open(stations_path + ".csv") as data:
+        for row in csv.DictReader(data, skipinitialspace = True):
+            index[row["name"]] = len(lats)
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+    return index, np.array(lats), np.array(lons)
+
+
+def add_route_distances(data_paths, stations_path=CANONICAL_FILE):
+    """
+    Calcule la longueur de toutes les routes des fichiers MARKII en une seule passe vectorisée, puis l'écrit dans une
+    colonne distance de chaque fichier. Un fichier n'est réécrit que si ses distances ont changé. Les routes dont une
+    station est inconnue gardent une distance vide.
+    :param data_paths: chemins des fichiers de routes, sans l'extension .csv
+    :return: le nombre de routes dont la distance a pu être calculée
+    """
+    index, lats, lons = load_station_coordinates(stations_path)
+
+    files = []
+    origins = []
+    destinations = []
+    for data_path in data_paths:
+        with open(data_path + ".csv") as data:
+            rows = list(csv.DictReader(data, skipinitialspace = True))
+        files.append((data_path, rows))
+        for row in rows:
+            origins.append(index.get(row["origin"], -1))
+            destinations.append(index.get(row["destination"], -1))
+
+    origins = np.array(origins, dtype=int)
+    destinations = np.array(destinations, dtype=int)
+    distances = great_circle_km(lats[origins], lons[origins], lats[destinations], lons[destinations])
+    distances[(origins < 0) | (destinations < 0)] = np.nan
+
+    position = 0
+    rewritten = 0
+    for data_path, rows in files:
+        changed = False
+        for row in rows:
+            distance = distances[position]
+            distance = "" if np.isnan(distance) else "%.3f" % distance
+            if row.get("distance") != distance:
+                row["distance"] = distance
+                changed = True
+            position += 1
+        if changed:
+            with open(data_path + ".csv", "w", newline="") as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=TUNNEL_HEADER)
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow({ field: row[field] for field in TUNNEL_HEADER })
+            rewritten += 1
+
+    computed = int(np.count_nonzero(~np.isnan(distances)))
+    print("Computed " + str(computed) + "/" + str(len(distances)) + " route distances, " + str(rewritten) + " files updated.")
+    return computed
@@ -0,0 +1,294 @@
+from migration_state import drop_state, load_state, record_load
+from migration_subway import grakn_client, GRAKN_URI, KEYSPACE, load_queries_in_batches, BATCH_SIZE
+import argparse
+import collections
+import math
+import struct
+import zlib
+
+
+#######################################################################################################################################
+#
+#                                       SNAPSHOT BINAIRE DU KEYSPACE
+#
+#######################################################################################################################################
+
+# Format d'un snapshot :
+#   en-tête  : MAGIC, version du format (B), longueur de la version du jeu de données (H) puis la version elle-même
+#   corps    : compressé avec zlib
+#       nombre de stations (I), puis pour chaque station : station_id et name (longueur H + utf-8), lat et lon (d)
+#       nombre de lignes (H), puis le nom de chaque ligne (longueur H + utf-8)
+#       nombre de routes (I), puis pour chaque route : index des stations de départ et d'arrivée (I), index de la ligne (H)
+#       et, depuis la version 2, la distance en km (d, NaN si la route n'a pas de distance)
+
+MAGIC = b"PSPSNAP"
+FORMAT_VERSION = 2
+ROUTE_FORMATS = {1: "<IIH", 2: "<IIHd"}
+SNAPSHOT_FILE = "./paris_subway.snap"
+
+# Nombre de stations ou de routes insérées par une même requête lors de la restauration
+ROWS_PER_QUERY = 25
+
+STATIONS_QUERY = 'match $station isa station, has station_id $station_id, has name $name, has lat $lat, has lon $lon; get;'
+ROUTES_QUERY = 'match $route (beginning : $station1, end : $station2) isa route, has station_ligne $ligne; get $route, $station1, $station2, $ligne;'
+DISTANCES_QUERY = 'match $route isa route, has distance $distance; get $route, $distance;'
+
+
+def _pack_string(value):
+    data = value.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_string(buffer, offset):
+    length, = struct.unpack_from("<H", buffer, offset)
+    offset += 2
+    return buffer[offset:offset + length].decode("utf-8"), offset + length
+
+
+def write_snapshot(snapshot, path=SNAPSHOT_FILE):
+    """
+    Ecrit un snapshot dans le format binaire décrit plus haut
+    :param snapshot: {"dataset_version": str, "stations": [(station_id, name, lat, lon)],
+                      "routes": [(index1, index2, ligne, distance ou None)]}
+    """
+    lines = sorted(set(route[2] for route in snapshot["routes"]))
+    line_index = { line: index for index, line in enumerate(lines) }
+
+    body = [struct.pack("<I", len(snapshot["stations"]))]
+    for station_id, name, lat, lon in snapshot["stations"]:
+        body.append(_pack_string(station_id) + _pack_string(name) + struct.pack("<dd", lat, lon))
+    body.append(struct.pack("<H", len(lines)))
+    for line in lines:
+        body.append(_pack_string(line))
+    body.append(struct.pack("<I", len(snapshot["routes"])))
+    for beginning, end, line, distance in snapshot["routes"]:
+        body.append(struct.pack(ROUTE_FORMATS[FORMAT_VERSION], beginning, end, line_index[line],
+                                math.nan if distance is None else distance))
+
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC + struct.pack("<B", FORMAT_VERSION) + _pack_string(snapshot["dataset_version"]))
+        snapshot_file.write(zlib.compress(b"".join(body), 9))
+
+
+def read_snapshot(path=SNAPSHOT_FILE):
+    """
+    Relit un snapshot écrit par write_snapshot
+    :return: le même dictionnaire que celui attendu par write_snapshot
+    """
+    with open(path, "rb") as snapshot_file:
+        data = snapshot_file.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError(path + " is not a P.S.P snapshot")
+    offset = len(MAGIC)
+    version, = struct.unpack_from("<B", data, offset)
+    if version not in ROUTE_FORMATS:
+        raise ValueError("Unsupported snapshot format version " + str(version) + " in " + path)
+    dataset_version, offset = _unpack_string(data, offset + 1)
+
+    body = zlib.decompress(data[offset:])
+    offset = 0
+    station_count, = struct.unpack_from("<I", body, offset)
+    offset += 4
+    stations = []
+    for i in range(station_count):
+        station_id, offset = _unpack_string(body, offset)
+        name, offset = _unpack_string(body, offset)
+        lat, lon = struct.unpack_from("<dd", body, offset)
+        offset += 16
+        stations.append((station_id, name, lat, lon))
+
+    line_count, = struct.unpack_from("<H", body, offset)
+    offset += 2
+    lines = []
+    for i in range(line_count):
+        line, offset = _unpack_string(body, offset)
+        lines.append(line)
+
+    route_count, = struct.unpack_from("<I", body, offset)
+    offset += 4
+    route_format = ROUTE_FORMATS[version]
+    route_size = struct.calcsize(route_format)
+    routes = []
+    for values in struct.iter_unpack(route_format, body[offset:offset + route_count * route_size]):
+        distance = values[3] if len(values) > 3 and not math.isnan(values[3]) else None
+        routes.append((values[0], values[1], lines[values[2]], distance))
+
+    return {"dataset_version": dataset_version, "stations": stations, "routes": routes}
+
+
+#######################################################################################################################################
+#
+#                                               EXPORT / RESTAURATION
+#
+#######################################################################################################################################
+
+def export_snapshot(session, keyspace=KEYSPACE):
+    """
+    Lit toutes les stations et toutes les routes du keyspace, ouvert par session
+    :return: un snapshot, avec les stations triées par station_id puis par nom
+    """
+    with session.transaction().read() as transaction:
+        stations_by_concept = {}
+        for answer in transaction.query(STATIONS_QUERY):
+            stations_by_concept[answer.get("station").id] = (
+                answer.get("station_id").value(),
+                answer.get("name").value(),
+                float(answer.get("lat").value()),
+                float(answer.get("lon").value())
+            )
+
+        concept_ids = sorted(stations_by_concept, key=lambda concept_id: stations_by_concept[concept_id][:2])
+        index = { concept_id: i for i, concept_id in enumerate(concept_ids) }
+
+        distances = {}
+        for answer in transaction.query(DISTANCES_QUERY):
+            distances[answer.get("route").id] = float(answer.get("distance").value())
+
+        routes = []
+        for answer in transaction.query(ROUTES_QUERY):
+            routes.append((index[answer.get("station1").id], index[answer.get("station2").id], answer.get("ligne").value(),
+                           distances.get(answer.get("route").id)))
+
+    state = load_state(GRAKN_URI, keyspace)
+    return {
+        "dataset_version": state["dataset_version"] if state else "",
+        "stations": [stations_by_concept[concept_id] for concept_id in concept_ids],
+        "routes": sorted(routes, key=lambda route: route[:3])
+    }
+
+
+def restore_snapshot(snapshot, session, batch_size=BATCH_SIZE):
+    """
+    Recharge un snapshot dans un keyspace vide. Chaque requête insère ROWS_PER_QUERY stations ou routes d'un coup,
+    et les routes sont rattachées aux stations par leur id Grakn. Les routes dont une station n'a pas pu être insérée
+    sont signalées et ignorées.
+    :return: la liste des requêtes rejetées
+    """
+    with session.transaction().read() as transaction:
+        station_count = list(transaction.query("compute count in station;"))[0].number()
+    if station_count:
+        raise ValueError("The keyspace already contains " + str(station_count) + " stations, restore needs an empty keyspace")
+
+    stations = snapshot["stations"]
+    queries = (station_insert_query(stations[i:i + ROWS_PER_QUERY]) for i in range(0, len(stations), ROWS_PER_QUERY))
+    inserted, rejected = load_queries_in_batches(queries, session, batch_size)
+    print("Restored " + str(len(stations)) + " stations in " + str(inserted) + " queries.")
+
+    # Les station_id ne sont pas uniques d'une ligne à l'autre dans les csv : les stations sont retrouvées par leur nom
+    station_ids = {}
+    with session.transaction().read() as transaction:
+        for answer in transaction.query('match $station isa station, has name $name; get $station, $name;'):
+            station_ids[answer.get("name").value()] = answer.get("station").id
+
+    #Une station d'un lot rejeté n'a pas d'id : ses routes ne sont pas restaurées, et sont signalées plutôt que de tout
+    #interrompre
+    routes = []
+    unresolved = 0
+    for beginning, end, line, distance in snapshot["routes"]:
+        missing = [stations[i][1] for i in (beginning, end) if stations[i][1] not in station_ids]
+        if missing:
+            unresolved += 1
+            print("Unresolved station [" + "], [".join(missing) + "] (" + line + ", " + stations[beginning][1] + " -> " +
+                  stations[end][1] + ")")
+            continue
+        routes.append((station_ids[stations[beginning][1]], station_ids[stations[end][1]], line, distance))
+    if unresolved:
+        print(str(unresolved) + " routes will not be restored because one of their stations does not exist.")
+    queries = (route_insert_query(routes[i:i + ROWS_PER_QUERY]) for i in range(0, len(routes), ROWS_PER_QUERY))
+    inserted, route_rejected = load_queries_in_batches(queries, session, batch_size)
+    print("Restored " + str(len(routes)) + " routes in " + str(inserted) + " queries.")
+
+    return rejected + route_rejected
+
+
+def station_insert_query(stations):
+
+    graql_insert_query = "insert"
+    for i, (station_id, name, lat, lon) in enumerate(stations):
+        graql_insert_query += ' $station' + str(i) + ' isa station, has station_id "' + station_id + '"'
+        graql_insert_query += ', has name "' + name + '"'
+        graql_insert_query += ', has lat ' + repr(lat)
+        graql_insert_query += ', has lon ' + repr(lon)
+        graql_insert_query += ";"
+
+    return graql_insert_query
+
+
+def route_insert_query(routes):
+
+    variables = {}
+    graql_match_query = "match"
+    graql_insert_query = " insert"
+    for i, (beginning, end, line, distance) in enumerate(routes):
+        for concept_id in (beginning, end):
+            if concept_id not in variables:
+                variables[concept_id] = "$station" + str(len(variables))
+                graql_match_query += " " + variables[concept_id] + " id " + concept_id + ";"
+        graql_insert_query += ' $route' + str(i) + ' (beginning : ' + variables[beginning] + ', end : ' + variables[end] + ')'
+        graql_insert_query += ' isa route, has station_ligne "' + line + '"'
+        if distance is not None:
+            graql_insert_query += ', has distance ' + repr(distance)
+        graql_insert_query += ';'
+
+    return graql_match_query + graql_insert_query
+
+
+def compare_snapshots(expected, actual):
+    """
+    Compare deux snapshots indépendamment des ids Grakn et de l'ordre des stations
+    :return: la liste des différences, vide si les deux snapshots correspondent
+    """
+    def content(snapshot):
+        stations = snapshot["stations"]
+        routes = collections.Counter(
+            (stations[beginning][:2], stations[end][:2], line, distance) for beginning, end, line, distance in snapshot["routes"])
+        return collections.Counter(stations), routes
+
+    expected_stations, expected_routes = content(expected)
+    actual_stations, actual_routes = content(actual)
+
+    differences = []
+    for station in (expected_stations - actual_stations):
+        differences.append("missing station " + str(station))
+    for station in (actual_stations - expected_stations):
+        differences.append("unexpected station " + str(station))
+    for route in (expected_routes - actual_routes):
+        differences.append("missing route " + str(route))
+    for route in (actual_routes - expected_routes):
+        differences.append("unexpected route " + str(route))
+    return differences
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Exporte ou restaure le keyspace paris_subway dans un snapshot binaire")
+    parser.add_argument("command", choices=["export", "restore", "verify"],
+                        help="export : keyspace -> snapshot, restore : snapshot -> keyspace vide, "
+                             "verify : compare le keyspace avec le snapshot")
+    parser.add_argument("path", nargs="?", default=SNAPSHOT_FILE, help="fichier du snapshot")
+    parser.add_argument("--keyspace", default="paris_subway")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="nombre de requêtes par transaction lors de la restauration")
+    args = parser.parse_args()
+
+    with grakn_client() as client:
+        with client.session(keyspace = args.keyspace) as session:
+            if args.command == "export":
+                snapshot = export_snapshot(session, args.keyspace)
+                write_snapshot(snapshot, args.path)
+                print("Exported " + str(len(snapshot["stations"])) + " stations and " + str(len(snapshot["routes"])) +
+                      " routes to " + args.path)
+            else:
+                snapshot = read_snapshot(args.path)
+                if args.command == "restore":
+                    restore_snapshot(snapshot, session, args.batch_size)
+                    #Les empreintes de la dernière migration ne décrivent plus le keyspace restauré
+                    drop_state(GRAKN_URI, args.keyspace)
+                    print("Recorded load " + record_load(GRAKN_URI, args.keyspace) + " of " + args.keyspace)
+
+                # Aller-retour : le keyspace est réexporté et comparé au snapshot
+                differences = compare_snapshots(snapshot, export_snapshot(session, args.keyspace))
+                for difference in differences:
+                    print(difference)
+                print("Snapshot and keyspace " + ("match." if not differences else "differ (" + str(len(differences)) + " differences)."))
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import unittest
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+#memory_grakn.py se trouve dans le dossier du projet
+sys.path.append(os.path.dirname(DATA_DIR))
+
+from loader_metrics import LoaderMetrics
+import migration_subway
+import snapshot
+
+
+#######################################################################################################################################
+#
+#                                   ALLER-RETOUR D'UN SNAPSHOT DANS LE GRAKN EN MEMOIRE
+#
+#######################################################################################################################################
+
+# Lancer depuis data/ : python -m unittest test_snapshot
+
+class SnapshotRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        #Les csv et le schéma sont lus relativement à data/, et les keyspaces vivent dans le Grakn en mémoire du processus
+        self._cwd = os.getcwd()
+        os.chdir(DATA_DIR)
+        self._uri = migration_subway.GRAKN_URI
+        self._metrics = migration_subway.metrics
+        migration_subway.GRAKN_URI = "memory:test_snapshot"
+        migration_subway.metrics = LoaderMetrics(quiet=True)
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._directory.cleanup()
+        migration_subway.GRAKN_URI = self._uri
+        migration_subway.metrics = self._metrics
+        os.chdir(self._cwd)
+
+    def test_round_trip(self):
+        """
+        Migration des csv, export, écriture et relecture du fichier, restauration dans un keyspace vide puis comparaison
+        """
+        migration_subway.reset_keyspace("source")
+        migration_subway.build_vente_graph(migration_subway.inputs, migration_subway.BATCH_SIZE, "source")
+        migration_subway.reset_keyspace("restored")
+        path = os.path.join(self._directory.name, "paris_subway.snap")
+
+        with migration_subway.grakn_client() as client:
+            with client.session(keyspace = "source") as session:
+                exported = snapshot.export_snapshot(session, "source")
+            snapshot.write_snapshot(exported, path)
+            read = snapshot.read_snapshot(path)
+            self.assertEqual(snapshot.compare_snapshots(exported, read), [])
+
+            with client.session(keyspace = "restored") as session:
+                self.assertEqual(snapshot.restore_snapshot(read, session), [])
+                restored = snapshot.export_snapshot(session, "restored")
+
+        self.assertTrue(exported["stations"] and exported["routes"])
+        self.assertEqual(snapshot.compare_snapshots(exported, restored), [])
+        self.assertEqual(restored["stations"], exported["stations"])
+        self.assertEqual(restored["routes"], exported["routes"])
+
+    def test_restore_with_rejected_stations(self):
+        """
+        Les routes d'une station rejetée sont signalées et ignorées, les autres sont restaurées
+        """
+        stations = [("1", "Nation", 48.848, 2.396), ("2", "Bastille", 48.852, 2.369), ("3", "Gare de \"Lyon\"", 48.844, 2.373)]
+        routes = [(0, 1, "1", 1.5), (1, 2, "1", 0.8)]
+        #Une station par requête, pour que seule la station au nom invalide soit rejetée
+        rows_per_query = snapshot.ROWS_PER_QUERY
+        snapshot.ROWS_PER_QUERY = 1
+        try:
+            migration_subway.reset_keyspace("rejected")
+            with migration_subway.grakn_client() as client:
+                with client.session(keyspace = "rejected") as session:
+                    rejected = snapshot.restore_snapshot({ "dataset_version": "", "stations": stations, "routes": routes },
+                                                         session)
+                    restored = snapshot.export_snapshot(session, "rejected")
+        finally:
+            snapshot.ROWS_PER_QUERY = rows_per_query
+
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(restored["stations"], stations[:2])
+        self.assertEqual(restored["routes"], [(0, 1, "1", 1.5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
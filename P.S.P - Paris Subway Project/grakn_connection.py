@@ -0,0 +1,255 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import contextmanager
+from migration_marker import GRAKN_URI, KEYSPACE, MEMORY_URI_PREFIX
+from query_cache import bind_transaction
+import queue
+import threading
+import time
+
+try:
+    from grakn.client import GraknClient
+    from grakn.exception.GraknError import GraknError
+    import grpc
+    # Errors after which the client and its sessions are thrown away and opened again
+    CONNECTION_ERRORS = (GraknError, grpc.RpcError)
+except ImportError:
+    # Without the client, only the in-memory stand-in of memory_grakn.py can be used, open_client adds its errors
+    GraknClient = None
+    CONNECTION_ERRORS = ()
+
+HEALTH_CHECK_QUERY = "match $x sub thing; get; limit 1;"
+
+
+def open_client(uri=GRAKN_URI):
+    """
+    :return: a client of the Grakn server at uri, or of the in-memory stand-in for a uri starting with memory:
+    """
+    global CONNECTION_ERRORS
+    if uri.startswith(MEMORY_URI_PREFIX):
+        # The stand-in is only imported when it is used
+        import memory_grakn
+        if GraknClient is None:
+            CONNECTION_ERRORS = (memory_grakn.GraknError,)
+        return memory_grakn.GraknClient(uri)
+    if GraknClient is None:
+        raise ImportError("grakn-client is not installed, only " + MEMORY_URI_PREFIX + " uris can be used")
+    return GraknClient(uri=uri)
+
+
+class GraknConnection:
+    """
+    One Grakn client per process, with a small pool of sessions on the keyspace that are reused by every read or write
+    transaction. Transactions stay short-lived: opening one on a pooled session is cheap, opening a client and a
+    session is not. A session that stayed idle longer than health_check_interval seconds is checked before being
+    reused, and the whole connection is opened again when the server cannot be reached.
+    """
+
+    def __init__(self, uri=GRAKN_URI, keyspace=KEYSPACE, pool_size=4, health_check_interval=30, max_reconnects=1):
+        self.uri = uri
+        self.keyspace = keyspace
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.max_reconnects = max_reconnects
+        self.reconnects = 0
+        self._client = None
+        self._lock = threading.Lock()
+        # Idle sessions, as (session, time it was last used), and every session opened since the last reconnection
+        self._idle = queue.LifoQueue()
+        self._live = set()
+
+    # ===== Client and sessions =====
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = open_client(self.uri)
+            return self._client
+
+    def _acquire(self):
+        """
+        :return: an idle session of the pool, a new one while the pool is not full, or the first one given back
+        """
+        with self._lock:
+            can_open = self._idle.empty() and len(self._live) < self.pool_size
+        if can_open:
+            session = self.client().session(keyspace=self.keyspace)
+            with self._lock:
+                self._live.add(session)
+            return session
+
+        session, last_used = self._idle.get()
+        if time.monotonic() - last_used > self.health_check_interval and not self._healthy(session):
+            self._discard(session)
+            return self._acquire()
+        return session
+
+    def _release(self, session):
+        with self._lock:
+            live = session in self._live
+        if live:
+            self._idle.put((session, time.monotonic()))
+        else:
+            # Borrowed before a reconnection, the session belongs to the old client
+            self._discard(session)
+
+    def _discard(self, session):
+        with self._lock:
+            self._live.discard(session)
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _healthy(session):
+        try:
+            with session.transaction().read() as transaction:
+                list(transaction.query(HEALTH_CHECK_QUERY))
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def session(self):
+        """
+        Borrow a session of the pool, for code that opens its own transactions
+        """
+        session = self._acquire()
+        broken = False
+        try:
+            yield session
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            if broken:
+                self._discard(session)
+            else:
+                self._release(session)
+
+    # ===== Transactions =====
+
+    def _open_transaction(self, write):
+        """
+        Open a transaction on a pooled session. If the server cannot be reached, reconnect and try again.
+        :return: session, transaction
+        """
+        attempts = 0
+        while True:
+            session = None
+            try:
+                session = self._acquire()
+                builder = session.transaction()
+                transaction = builder.write() if write else builder.read()
+                # The query cache keys the answers by the keyspace they come from
+                bind_transaction(transaction, self.uri, self.keyspace)
+                return session, transaction
+            except CONNECTION_ERRORS as error:
+                if session is not None:
+                    self._discard(session)
+                if attempts >= self.max_reconnects:
+                    raise
+                attempts += 1
+                print("Lost the connection to Grakn (" + str(error) + "), reconnecting ...")
+                self.reconnect()
+
+    @contextmanager
+    def _transaction(self, write):
+        session, transaction = self._open_transaction(write)
+        broken = False
+        try:
+            yield transaction
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            try:
+                transaction.close()
+            except Exception:
+                pass
+            if broken:
+                self._discard(session)
+            else:
+                self._release(session)
+
+    def read(self):
+        """
+        Short-lived read transaction: `with connection.read() as transaction:`
+        """
+        return self._transaction(write=False)
+
+    def write(self):
+        """
+        Short-lived write transaction, the caller still commits it
+        """
+        return self._transaction(write=True)
+
+    # ===== Maintenance =====
+
+    def health_check(self):
+        """
+        :return: True if a read query goes through
+        """
+        try:
+            with self.read() as transaction:
+                list(transaction.query(HEALTH_CHECK_QUERY))
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def reconnect(self):
+        """
+        Close every session and the client, the next transaction opens new ones
+        """
+        self.close()
+        self.reconnects += 1
+
+    def close(self):
+        with self._lock:
+            sessions = self._live
+            self._live = set()
+            client = self._client
+            self._client = None
+        while not self._idle.empty():
+            self._idle.get()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_connections = {}
+
+
+def get_connection(uri=GRAKN_URI, keyspace=KEYSPACE):
+    """
+    :return: the connection of this process to the given keyspace, created on first use
+    """
+    if (uri, keyspace) not in _connections:
+        _connections[(uri, keyspace)] = GraknConnection(uri, keyspace)
+    return _connections[(uri, keyspace)]
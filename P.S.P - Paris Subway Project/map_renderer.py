@@ -0,0 +1,426 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from map_scene import MapScene
+from network_model import NetworkModel
+from xml.sax.saxutils import escape, quoteattr
+import argparse
+import math
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+
+# Width of the whole map at zoom level 0, in pixels
+MAP_WIDTH = 1920
+
+# Tiles are written to TILES_DIR/<network version>/<layer>/<level>/<column>/<row>.<format>, the layer naming the width
+# of the map and what is drawn over it, ex: map-1920-k-core-path-54-311
+TILES_DIR = "./tiles"
+TILE_SIZE = 256
+
+# Tunnels and stations this far (in pixels) outside of the image are still drawn, as their width or label may reach it
+RENDER_MARGIN = 100
+
+COLOUR_NAMES = {"white": "#FFFFFF", "black": "#000000"}
+
+
+def parse_colour(colour):
+    """
+    :param colour: "#rgb", "#rrggbb" or one of COLOUR_NAMES, as given to tkinter
+    :return: the colour as 3 bytes
+    """
+    colour = COLOUR_NAMES.get(colour, colour).lstrip("#")
+    if len(colour) == 3:
+        colour = "".join(digit * 2 for digit in colour)
+    return bytes.fromhex(colour)
+
+
+class SvgSurface:
+    """
+    Collects the shapes of the map as SVG elements
+    """
+
+    def __init__(self, width, height, background="white"):
+        self.width = width
+        self.height = height
+        self._elements = ['<rect width="100%" height="100%" fill=' + quoteattr(background) + '/>']
+
+    @staticmethod
+    def _number(value):
+        return "%.2f" % value
+
+    def line(self, points, colour, width, dash=None):
+        """
+        :param points: list of x, y of the polyline, in pixels
+        :param dash: optional (on, off) lengths, in pixels
+        """
+        if len(points) < 2:
+            return
+        coords = " ".join(self._number(x) + "," + self._number(y) for x, y in points)
+        element = '<polyline points="' + coords + '" fill="none" stroke=' + quoteattr(colour) + \
+                  ' stroke-width="' + self._number(width) + '" stroke-linecap="round" stroke-linejoin="round"'
+        if dash:
+            element += ' stroke-dasharray="' + ",".join(str(length) for length in dash) + '"'
+        self._elements.append(element + '/>')
+
+    def circle(self, x, y, radius, fill, outline=None):
+        element = '<circle cx="' + self._number(x) + '" cy="' + self._number(y) + '" r="' + self._number(radius) + \
+                  '" fill=' + quoteattr(fill)
+        if outline:
+            element += ' stroke=' + quoteattr(outline) + ' stroke-width="1"'
+        self._elements.append(element + '/>')
+
+    def text(self, x, y, text, size, colour):
+        """
+        Text anchored by its top left corner, like the labels of the Tk map
+        """
+        self._elements.append(
+            '<text x="' + self._number(x) + '" y="' + self._number(y) + '" font-family="Johnston" font-size="' +
+            str(size) + 'pt" font-weight="bold" fill=' + quoteattr(colour) + ' dominant-baseline="hanging">' +
+            escape(text) + '</text>'
+        )
+
+    def to_bytes(self):
+        header = '<svg xmlns="http://www.w3.org/2000/svg" width="' + str(self.width) + '" height="' + \
+                 str(self.height) + '" viewBox="0 0 ' + str(self.width) + ' ' + str(self.height) + '">'
+        return "\n".join([header] + self._elements + ['</svg>\n']).encode("utf-8")
+
+    def save(self, path):
+        with open(path, "wb") as svg_file:
+            svg_file.write(self.to_bytes())
+
+
+class RasterSurface:
+    """
+    Pure-Python rasterizer into an RGB buffer: every shape is filled one row of pixels at a time, with a slice
+    assignment per row, and written out as a PNG. There is no anti-aliasing, and no text as there is no font to draw it
+    with, so the station names are only in the SVG output.
+    """
+
+    def __init__(self, width, height, background="white"):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(parse_colour(background) * (width * height))
+
+    def _span(self, y, first, last, rgb):
+        """
+        Fill the pixels first to last included of row y
+        """
+        first = max(first, 0)
+        last = min(last, self.width - 1)
+        if last >= first:
+            start = (y * self.width + first) * 3
+            self.pixels[start:start + (last - first + 1) * 3] = rgb * (last - first + 1)
+
+    def _rows(self, top, bottom):
+        """
+        :return: the rows of the image whose centre lies between top and bottom
+        """
+        return range(max(int(math.ceil(top - 0.5)), 0), min(int(math.floor(bottom - 0.5)), self.height - 1) + 1)
+
+    def _disc(self, x, y, radius, rgb):
+        for row in self._rows(y - radius, y + radius):
+            dy = row + 0.5 - y
+            half = math.sqrt(max(radius * radius - dy * dy, 0))
+            self._span(row, int(math.ceil(x - half - 0.5)), int(math.floor(x + half - 0.5)), rgb)
+
+    def _polygon(self, points, rgb):
+        """
+        Fill a convex polygon
+        """
+        ys = [y for x, y in points]
+        edges = list(zip(points, points[1:] + points[:1]))
+        for row in self._rows(min(ys), max(ys)):
+            centre = row + 0.5
+            crossings = []
+            for (x1, y1), (x2, y2) in edges:
+                if (y1 <= centre < y2) or (y2 <= centre < y1):
+                    crossings.append(x1 + (centre - y1) * (x2 - x1) / (y2 - y1))
+            if len(crossings) >= 2:
+                self._span(row, int(math.ceil(min(crossings) - 0.5)), int(math.floor(max(crossings) - 0.5)), rgb)
+
+    def _segment(self, x1, y1, x2, y2, width, rgb):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            return
+        # Rectangle around the segment, along its unit normal
+        nx = -(y2 - y1) / length * width / 2
+        ny = (x2 - x1) / length * width / 2
+        self._polygon([(x1 + nx, y1 + ny), (x2 + nx, y2 + ny), (x2 - nx, y2 - ny), (x1 - nx, y1 - ny)], rgb)
+
+    @staticmethod
+    def _dashes(points, dash):
+        """
+        Cut a polyline into the pieces drawn with the (on, off) dash pattern
+        :return: list of x1, y1, x2, y2
+        """
+        on, off = dash
+        pieces = []
+        position = 0
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            length = math.hypot(x2 - x1, y2 - y1)
+            start = 0
+            while start < length:
+                phase = position % (on + off)
+                stop = min(length, start + (on - phase if phase < on else on + off - phase))
+                if phase < on:
+                    pieces.append((x1 + (x2 - x1) * start / length, y1 + (y2 - y1) * start / length,
+                                   x1 + (x2 - x1) * stop / length, y1 + (y2 - y1) * stop / length))
+                position += stop - start
+                start = stop
+        return pieces
+
+    def line(self, points, colour, width, dash=None):
+        rgb = parse_colour(colour)
+        if dash:
+            pieces = self._dashes(points, dash)
+        else:
+            pieces = [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(points, points[1:])]
+        for x1, y1, x2, y2 in pieces:
+            self._segment(x1, y1, x2, y2, width, rgb)
+        if width > 2 and not dash:
+            # Round joins and caps
+            for x, y in points:
+                self._disc(x, y, width / 2, rgb)
+
+    def circle(self, x, y, radius, fill, outline=None):
+        if outline:
+            self._disc(x, y, radius, parse_colour(outline))
+            radius -= 1
+        if fill:
+            self._disc(x, y, radius, parse_colour(fill))
+
+    def text(self, x, y, text, size, colour):
+        pass
+
+    def to_bytes(self):
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+        stride = self.width * 3
+        # Filter type 0 (none) in front of every row
+        raw = b"".join(b"\x00" + bytes(self.pixels[row * stride:(row + 1) * stride]) for row in range(self.height))
+        return b"\x89PNG\r\n\x1a\n" + \
+               chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)) + \
+               chunk(b"IDAT", zlib.compress(raw, 6)) + \
+               chunk(b"IEND", b"")
+
+    def save(self, path):
+        with open(path, "wb") as png_file:
+            png_file.write(self.to_bytes())
+
+
+SURFACES = {"svg": SvgSurface, "png": RasterSurface}
+
+
+class MapRenderer:
+    """
+    Draws a MapScene on a surface with the rules of the Tk map, bottom to top: the Seine, the background of the path,
+    the tunnels, the centrality overlay, the path, the stations and their labels.
+    """
+
+    def __init__(self, scene, centrality=None, path=None):
+        """
+        :param centrality: optional (measure, centrality sets) of the overlay, see centrality.CentralityCache
+        :param path: optional network_model.Station of a path to draw, in order
+        """
+        self.scene = scene
+        # Everything that changes the drawing of a tile is in the name of its layer, so that stale tiles are never reused
+        self.layer = "map-" + str(int(scene.new_width))
+        self._overlay = []
+        self._overlay_colour = None
+        if centrality is not None:
+            measure, centrality_sets = centrality
+            upper_radius, self._overlay_colour = MapScene.CENTRALITY_STYLES[measure]
+            self._overlay = scene.centrality_circles(centrality_sets, upper_radius)
+            self.layer += "-" + measure
+        self._path = scene.path_points(path) if path else []
+        if path:
+            self.layer += "-path-" + str(path[0].station_id) + "-" + str(path[-1].station_id)
+
+    def render(self, surface, scale=1, left=0, top=0):
+        """
+        :param scale: zoom scale, 1 to fit the width of the scene
+        :param left: x of the left side of the surface on the map at this scale, in pixels
+        :param top: y of the top of the surface
+        """
+        scene = self.scene
+
+        def project(x, y):
+            return x * scale - left, y * scale - top
+
+        area = [(left - RENDER_MARGIN) / scale, (top - RENDER_MARGIN) / scale,
+                (left + surface.width + RENDER_MARGIN) / scale, (top + surface.height + RENDER_MARGIN) / scale]
+
+        surface.line([project(x, y) for x, y in scene.seine.tolist()], MapScene.SEINE_COLOR, MapScene.SEINE_WIDTH)
+
+        path = [project(x, y) for x, y in self._path]
+        if path:
+            surface.line(path, MapScene.TUNNEL_SHORTEST_PATH_COLOUR, MapScene.TUNNEL_SHORTEST_PATH_WIDTH, dash=(3, 3))
+            for x, y in (path[0], path[-1]):
+                surface.circle(x, y, 2 * MapScene.STATION_CIRCLE_RADIUS * scale, MapScene.TUNNEL_SHORTEST_PATH_COLOUR)
+
+        for i in scene.visible_segments(*area).tolist():
+            x1, y1, x2, y2 = scene.segments[i].tolist()
+            surface.line([project(x1, y1), project(x2, y2)], scene.segment_colours[i], MapScene.LINE_WIDTH)
+
+        for x, y, radius in self._overlay:
+            x, y = project(x, y)
+            surface.circle(x, y, radius * scale, self._overlay_colour)
+
+        if path:
+            surface.line(path, MapScene.SHORTEST_PATH_COLOUR, MapScene.LINE_WIDTH)
+
+        stations = scene.visible_stations(*(area + [scale])).tolist()
+        # Like on the Tk map, the station circles and the offset of their labels grow with the zoom
+        radius = MapScene.STATION_CIRCLE_RADIUS * scale
+        for i in stations:
+            x, y = project(*scene.station_xy[i].tolist())
+            surface.circle(x, y, radius, MapScene.STATION_COLOUR, MapScene.STATION_OUTLINE_COLOUR)
+        if scene.shows_labels(scale):
+            for i in stations:
+                x, y = project(*scene.station_xy[i].tolist())
+                surface.text(x + radius, y + radius, scene.station_points[i].name, MapScene.STATION_FONT_SIZE,
+                             MapScene.LABEL_COLOUR)
+        return surface
+
+    def image(self, file_format="svg", scale=1):
+        """
+        :return: a surface with the whole map at this zoom scale
+        """
+        width = int(math.ceil(self.scene.new_width * scale))
+        height = int(math.ceil(self.scene.new_height * scale))
+        return self.render(SURFACES[file_format](width, height), scale)
+
+    # ===== Tile pyramid =====
+
+    def tile_counts(self, level):
+        """
+        :return: number of columns and rows of tiles at a zoom level, whose scale is 2 ** level
+        """
+        scale = 2 ** level
+        return int(math.ceil(self.scene.new_width * scale / TILE_SIZE)), \
+               int(math.ceil(self.scene.new_height * scale / TILE_SIZE))
+
+    def tile(self, level, column, row, file_format="png"):
+        surface = SURFACES[file_format](TILE_SIZE, TILE_SIZE)
+        return self.render(surface, 2 ** level, column * TILE_SIZE, row * TILE_SIZE)
+
+    def tile_directory(self, output_dir=TILES_DIR):
+        # The tiles of another version of the network, width, overlay or path are never reused
+        return os.path.join(output_dir, self.scene.network.version(), self.layer)
+
+
+# Renderer of a worker process of generate_tiles, set once by _init_tile_worker rather than sent with every tile
+_tile_worker = None
+
+
+def _init_tile_worker(renderer, directory, file_format):
+    global _tile_worker
+    _tile_worker = (renderer, directory, file_format)
+
+
+def _write_tile(job):
+    renderer, directory, file_format = _tile_worker
+    level, column, row = job
+    path = os.path.join(directory, str(level), str(column), str(row) + "." + file_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    renderer.tile(level, column, row, file_format).save(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return job
+
+
+def generate_tiles(renderer, levels, file_format="png", output_dir=TILES_DIR, workers=None):
+    """
+    Render every tile of the given zoom levels in parallel processes. Tiles already on disk for this version of the
+    network and this layer are kept as they are.
+    :param workers: number of processes, one per CPU by default
+    :return: number of tiles written, number of tiles skipped
+    """
+    directory = renderer.tile_directory(output_dir)
+    jobs = []
+    skipped = 0
+    for level in levels:
+        columns, rows = renderer.tile_counts(level)
+        for column in range(columns):
+            for row in range(rows):
+                if os.path.exists(os.path.join(directory, str(level), str(column), str(row) + "." + file_format)):
+                    skipped += 1
+                else:
+                    jobs.append((level, column, row))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        _init_tile_worker(renderer, directory, file_format)
+        for job in jobs:
+            _write_tile(job)
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_tile_worker,
+                                  initargs=(renderer, directory, file_format)) as pool:
+            for i, job in enumerate(pool.imap_unordered(_write_tile, jobs, chunksize=8)):
+                if (i + 1) % 100 == 0:
+                    print(str(i + 1) + " / " + str(len(jobs)) + " tiles")
+    return len(jobs), skipped
+
+
+if __name__ == "__main__":
+
+    from centrality import CentralityCache
+    from grakn_connection import GraknConnection
+    from path_tables import PathTables
+
+    parser = argparse.ArgumentParser(description="Draw the map without a display, as SVG / PNG images or as tiles")
+    parser.add_argument("command", choices=["svg", "png", "tiles"],
+                        help="svg / png : one image of the whole map, tiles : a tile pyramid")
+    parser.add_argument("output", nargs="?", help="image file, or directory of the tiles (" + TILES_DIR + ")")
+    parser.add_argument("--keyspace", default="paris_subway")
+    parser.add_argument("--width", type=int, default=MAP_WIDTH, help="width of the map at scale 1, in pixels")
+    parser.add_argument("--scale", type=float, default=1, help="zoom scale of the image")
+    parser.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2], help="zoom levels of the tiles")
+    parser.add_argument("--format", choices=sorted(SURFACES), default="png", help="format of the tiles")
+    parser.add_argument("--workers", type=int, default=None, help="processes rendering the tiles, one per CPU by default")
+    parser.add_argument("--centrality", choices=[MapScene.CENTRALITY_K_CORE, MapScene.CENTRALITY_DEGREE],
+                        help="draw the overlay of a centrality measure")
+    parser.add_argument("--path", nargs=2, metavar=("ORIGIN", "DESTINATION"), help="draw the path between two stations")
+    args = parser.parse_args()
+
+    with GraknConnection(keyspace = args.keyspace) as connection:
+        network = NetworkModel.load(connection)
+
+    start = time.perf_counter()
+    centrality = None
+    if args.centrality:
+        centrality_sets = CentralityCache(network).centrality_sets(
+            args.centrality, MapScene.CENTRALITY_MINIMUM_SCORES[args.centrality]
+        )
+        centrality = (args.centrality, centrality_sets)
+    path = None
+    if args.path:
+        origin, destination = (network.station_named(name) for name in args.path)
+        if origin is None or destination is None:
+            parser.error("unknown station " + (args.path[0] if origin is None else args.path[1]))
+        path = PathTables.load_or_build(network, "distance").path(origin.index, destination.index)
+        path = path.stations if path is not None else None
+    renderer = MapRenderer(MapScene(network, args.width), centrality, path)
+
+    if args.command == "tiles":
+        written, skipped = generate_tiles(renderer, args.levels, args.format, args.output or TILES_DIR, args.workers)
+        print(str(written) + " tiles written and " + str(skipped) + " already up to date in " +
+              renderer.tile_directory(args.output or TILES_DIR) + ", in " + "%.2f" % (time.perf_counter() - start) + " s")
+    else:
+        output = args.output or "map." + args.command
+        renderer.image(args.command, args.scale).save(output)
+        print("Map written to " + output + " in " + "%.2f" % (time.perf_counter() - start) + " s")
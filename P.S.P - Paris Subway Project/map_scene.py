@@ -0,0 +1,245 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+# Grid coordinates of a path along the centre-line of La Seine in Paris
+SEINE_WAYPOINTS = ((48.772773, 2.411356),(48.776891, 2.414646),(48.780865, 2.417483),(48.789266, 2.422638),(48.796402, 2.420453),(48.803774, 2.411313),(48.810861, 2.409492),(48.817982, 2.405901),(48.822129, 2.395588),(48.827270, 2.387981),(48.833969, 2.379891),(48.839630, 2.373289),(48.841611, 2.370717),(48.844485, 2.366576),
+    (48.846830, 2.363550),(48.850086, 2.357603),(48.852350, 2.352977),(48.854405, 2.347717),(48.856159, 2.343282),(48.858270, 2.3384868),(48.859230, 2.334001),(48.860105, 2.330278),
+    (48.862279, 2.323819),(48.863648, 2.318809),(48.863739, 2.313971),(48.863626, 2.310742),(48.863668, 2.308489),(48.863569, 2.303575),(48.863421, 2.300507),(48.861685, 2.294263),
+    (48.859483, 2.291173),(48.857351, 2.288748),(48.855614, 2.286731),(48.854124, 2.285014),(48.852540, 2.282690),(48.850782, 2.280297),(48.849389, 2.278434),(48.847447, 2.276385),
+    (48.845534, 2.274261),(48.842688, 2.271418),(48.838428, 2.267431),(48.834586, 2.263558),(48.830250, 2.258462),(48.824797, 2.249568),(48.823117, 2.237919),(48.830194, 2.226450),
+    (48.839076, 2.222887),(48.849427, 2.225365),(48.862338, 2.226384),(48.872883, 2.237832),(48.885122, 2.253422),(48.885122, 2.253422),(48.902401, 2.283997),(48.908843, 2.298647),(48.916216, 2.320786),(48.929868, 2.337285),(48.943158, 2.336514),(48.950066, 2.305815),(48.947636, 2.272512),)
+
+
+def transform_to_range(val, old_min, old_max, new_min, new_max):
+    """
+    Transform a value from an old range to a new range
+    :return: scaled value
+    """
+    old_range = (old_max - old_min)
+    new_range = (new_max - new_min)
+    new_val = (((val - old_min) * new_range) / old_range) + new_min
+    return new_val
+
+
+def transform_coords(lon, lat, min_lon, max_lon, min_lat, max_lat, new_width, new_height):
+    """
+    Transforms grid coordinates to a coordinate system that can be easily rendered.
+    :param lon: longitude of the coordinates to scale
+    :param lat: latitude of the coordinates to scale
+    :param min_lon: the minimum longitude, which will be mapped to x = 0
+    :param max_lon: the maximum longitude, which will be mapped to x = new_width
+    :param min_lat: the minimum latitude, which will be mapped to y = 0
+    :param max_lat: the minimum latitude, which will be mapped to y = new_height
+    :param new_width: the maximum height of the coordinates to map to
+    :param new_height: the maximum width of the coordinates to map to
+    :return:
+    """
+    lon = transform_to_range(lon, min_lon, max_lon, 0, new_width)
+    lat = new_height - transform_to_range(lat, min_lat, max_lat, 0, new_height)
+    return lon, lat
+
+
+class MapScene:
+    """
+    Everything the map is drawn from, without any drawing: the map coordinates (the coordinates at zoom scale 1) of the
+    Seine, of every tunnel and of every station, and the rules that decide what is shown and how. The Tk map of app.py
+    and the headless renderer of map_renderer.py both draw from a MapScene, so that they always agree.
+    """
+
+    # Size attributes
+    SEINE_WIDTH = 10
+    STATION_FONT_SIZE = 5
+    STATION_CIRCLE_RADIUS = 3
+    STATION_K_CORE_MAX_RADIUS = 15
+    STATION_DEGREE_MAX_RADIUS = 17
+    TUNNEL_SHORTEST_PATH_WIDTH = 20
+    # Station connections
+    LINE_WIDTH = 2
+    LINE_SPACING = 0.5
+
+    # Level of detail: below these zoom scales, the labels and the stations served by a single line are not drawn
+    LABEL_MIN_SCALE = 2
+    MINOR_STATION_MIN_SCALE = 1
+
+    # Color attributes
+    SEINE_COLOR = "#def"
+    STATION_COLOUR = "white"
+    STATION_OUTLINE_COLOUR = "black"
+    LABEL_COLOUR = "#666"
+    STATION_K_CORE_COLOUR = "#AAF"
+    STATION_DEGREE_COLOUR = "#FF4821"
+    TUNNEL_SHORTEST_PATH_COLOUR = "#DDD"
+    SHORTEST_PATH_COLOUR = "#E22901"
+    TUBE_LINE_COLOURS = {
+        "M1": "#FFCD00",
+        "M2": "#003CA6",
+        "M3": "#837902",
+        "M4": "#CF009E",
+        "M5": "#FF7E2E",
+        "M6": "#6ECA97",
+        "M7": "#FA9ABA",
+        "M7 bis": "#6ECA97",
+        "M7b": "#6ECA97",
+        "M8": "#E19BDF",
+        "M9": "#B6BD00",
+        "M10": "#C9910D",
+        "M11": "#704B1C",
+        "M12": "#007852",
+        "M13": "#6EC4E8",
+        "M14": "#62259D",
+        "3 bis": "#6EC4E8",
+        "M3 bis": "#6EC4E8",
+        "M3b": "#6EC4E8",
+    }
+
+    # Centrality measures of the overlays, and the lowest score drawn (Grakn leaves the 1-core out of k-core results)
+    CENTRALITY_K_CORE = "k-core"
+    CENTRALITY_DEGREE = "degree"
+    CENTRALITY_MINIMUM_SCORES = {CENTRALITY_K_CORE: 2, CENTRALITY_DEGREE: 1}
+    # Largest radius and colour of the circles of each overlay
+    CENTRALITY_STYLES = {
+        CENTRALITY_K_CORE: (STATION_K_CORE_MAX_RADIUS, STATION_K_CORE_COLOUR),
+        CENTRALITY_DEGREE: (STATION_DEGREE_MAX_RADIUS, STATION_DEGREE_COLOUR),
+    }
+
+    def __init__(self, network, width):
+        """
+        :param network: network_model.NetworkModel to draw
+        :param width: width of the map at scale 1, the height follows the aspect ratio of the network
+        """
+        self.network = network
+
+        # We want to scale the longitude and lonitude to fit the image
+        # To do this we need the minimum and maximum of the longitude and latitude, which the network model already knows
+        self.min_lat, self.max_lat, self.min_lon, self.max_lon = network.bounds()
+
+        # aspect ratio as width over height, which is longitude over latitude
+        aspect_ratio = (self.max_lon - self.min_lon) / \
+                        (self.max_lat - self.min_lat)
+        self.new_width = width
+        self.new_height = self.new_width / aspect_ratio
+
+        self._project()
+
+    def transform(self, lon, lat):
+        """
+        Transfrom grid coordinates to map coordinates, for single values or whole NumPy arrays at once
+        """
+        return transform_coords(
+            lon, lat, self.min_lon, self.max_lon, self.min_lat, self.max_lat, self.new_width, self.new_height
+        )
+
+    def _project(self):
+        stations = self.network.stations
+
+        # All the stations are projected in one NumPy operation
+        lon, lat = self.transform(
+            np.array([station.lon for station in stations]), np.array([station.lat for station in stations])
+        )
+        self.projection = np.column_stack((lon, lat))
+
+        waypoints = np.array(SEINE_WAYPOINTS)
+        lon, lat = self.transform(waypoints[:, 1], waypoints[:, 0])
+        self.seine = np.column_stack((lon, lat))
+
+        # One tunnel per pair of stations and per line, whatever the direction of the routes. The lines that share a
+        # pair of stations are drawn side by side, centred on the straight line between both stations.
+        pair_lines = {}
+        for edge in self.network.edges:
+            lines = pair_lines.setdefault((min(edge.beginning, edge.end), max(edge.beginning, edge.end)), [])
+            if edge.line not in lines:
+                lines.append(edge.line)
+        beginnings = []
+        ends = []
+        offsets = []
+        self.segment_colours = []
+        for (beginning, end), lines in pair_lines.items():
+            for i, tube_line_name in enumerate(sorted(lines)):
+                beginnings.append(beginning)
+                ends.append(end)
+                offsets.append(i - (len(lines) - 1) / 2)
+                self.segment_colours.append(self.TUBE_LINE_COLOURS[tube_line_name])
+
+        # Parallel lines are shifted along the unit normal of the tunnel, (-dy, dx) / length: no gradient, so vertical
+        # and zero-length tunnels need no special case
+        starts = self.projection[np.array(beginnings, dtype=int)].reshape(-1, 2)
+        stops = self.projection[np.array(ends, dtype=int)].reshape(-1, 2)
+        delta = stops - starts
+        length = np.hypot(delta[:, 0], delta[:, 1])
+        normals = np.column_stack((-delta[:, 1], delta[:, 0])) / np.where(length > 0, length, 1)[:, None]
+        shift = normals * (np.array(offsets) * self.LINE_SPACING)[:, None]
+        # Tunnels as rows of x1, y1, x2, y2
+        self.segments = np.hstack((starts + shift, stops + shift))
+
+        # Stations, each name only once. Major stations are served by several lines and stay on the map when zoomed out.
+        self.station_points = []
+        self.station_coords = {}
+        for station in stations:
+            if station.name not in self.station_coords: # draw each station only once
+                self.station_coords[station.name] = tuple(self.projection[station.index].tolist())
+                self.station_points.append(station)
+        drawn = np.array([station.index for station in self.station_points], dtype=int)
+        self.station_xy = self.projection[drawn].reshape(-1, 2)
+        self.station_major = np.array([len(station.lines) > 1 for station in self.station_points], dtype=bool)
+
+    # ===== Level of detail =====
+
+    def visible_segments(self, left, top, right, bottom):
+        """
+        :return: indices of the tunnels that cross the given area, in map coordinates
+        """
+        segments = self.segments
+        return np.flatnonzero(
+            (np.maximum(segments[:, 0], segments[:, 2]) >= left) & (np.minimum(segments[:, 0], segments[:, 2]) <= right) &
+            (np.maximum(segments[:, 1], segments[:, 3]) >= top) & (np.minimum(segments[:, 1], segments[:, 3]) <= bottom)
+        )
+
+    def visible_stations(self, left, top, right, bottom, scale):
+        """
+        :return: indices in station_points of the stations drawn within the given area at this zoom scale
+        """
+        points = self.station_xy
+        inside = (points[:, 0] >= left) & (points[:, 0] <= right) & (points[:, 1] >= top) & (points[:, 1] <= bottom)
+        return np.flatnonzero(inside & (self.station_major | (scale >= self.MINOR_STATION_MIN_SCALE)))
+
+    def shows_labels(self, scale):
+        return scale >= self.LABEL_MIN_SCALE
+
+    # ===== Overlays =====
+
+    def path_points(self, stations):
+        """
+        :param stations: network_model.Station of a path, in order
+        :return: map coordinates of every station of the path
+        """
+        return [self.station_coords[station.name] for station in stations]
+
+    def centrality_circles(self, centrality_sets, upper_radius):
+        """
+        :param centrality_sets: score -> indices of the stations with that score, see centrality.CentralityCache
+        :param upper_radius: radius of the circles of the highest score, at scale 1
+        :return: list of x, y, radius of the circles of the overlay, in map coordinates
+        """
+        max_score = max(centrality_sets) if centrality_sets else 1
+        circles = []
+        for score, station_indices in centrality_sets.items():
+            radius = (score / max_score) * upper_radius
+            for station_index in station_indices:
+                name = self.network.stations[station_index].name
+                if name in self.station_coords:
+                    x, y = self.station_coords[name]
+                    circles.append((x, y, radius))
+        return circles
@@ -0,0 +1,1208 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from migration_marker import MEMORY_URI_PREFIX
+import itertools
+import math
+import re
+import threading
+
+try:
+    from grakn.exception.GraknError import GraknError as _ClientError
+except ImportError:
+    _ClientError = Exception
+
+# A uri starting with MEMORY_URI_PREFIX, ex: GRAKN_URI=memory:, selects this in-memory stand-in instead of a Grakn
+# server. Its keyspaces only live as long as the process, and are shared by every client of the same uri.
+
+
+class GraknError(_ClientError):
+    """
+    Error of a query or of a transaction. It is a grakn GraknError when the client is installed, so that the scripts
+    catch it the same way.
+    """
+
+
+#######################################################################################################################################
+#
+#                                                   ANSWERS AND CONCEPTS
+#
+#######################################################################################################################################
+
+class ConceptMap:
+    """
+    Answer of a match-get or an insert query, read like a grakn ConceptMap
+    """
+    __slots__ = ("_concept_map",)
+
+    def __init__(self, concept_map):
+        self._concept_map = concept_map
+
+    def get(self, var=None):
+        if var is None:
+            return self
+        if var not in self._concept_map:
+            raise GraknError("Variable " + var + " is not in the ConceptMap")
+        return self._concept_map[var]
+
+    def map(self):
+        return self._concept_map
+
+    def vars(self):
+        return set(self._concept_map)
+
+
+class Value:
+    """
+    Answer of a compute count / min / max ... query, or of an aggregate
+    """
+    __slots__ = ("_number",)
+
+    def __init__(self, number):
+        self._number = number
+
+    def number(self):
+        return self._number
+
+
+class ConceptList:
+    """
+    Answer of a compute path query: the ids of the concepts along the path
+    """
+    __slots__ = ("_concept_id_list",)
+
+    def __init__(self, concept_id_list):
+        self._concept_id_list = concept_id_list
+
+    def list(self):
+        return self._concept_id_list
+
+
+class ConceptSetMeasure:
+    """
+    Answer of a compute centrality query: the ids of the concepts with the same score
+    """
+    __slots__ = ("_concept_id_set", "_measurement")
+
+    def __init__(self, concept_id_set, measurement):
+        self._concept_id_set = concept_id_set
+        self._measurement = measurement
+
+    def set(self):
+        return self._concept_id_set
+
+    def measurement(self):
+        return self._measurement
+
+
+class Void:
+    """
+    Answer of a delete query
+    """
+    __slots__ = ("_message",)
+
+    def __init__(self, message):
+        self._message = message
+
+    def message(self):
+        return self._message
+
+
+class Concept:
+    """
+    Schema type or data instance of a keyspace, with the parts of the grakn Concept API the scripts read
+    """
+    __slots__ = ("id",)
+    KIND = None
+
+    def is_type(self):
+        return self.KIND == "type"
+
+    def is_schema_concept(self):
+        return self.KIND == "type"
+
+    def is_thing(self):
+        return self.KIND != "type"
+
+    def is_entity(self):
+        return self.KIND == "entity"
+
+    def is_relation(self):
+        return self.KIND == "relation"
+
+    def is_attribute(self):
+        return self.KIND == "attribute"
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + self.id + ")"
+
+
+class Type(Concept):
+    __slots__ = ("_label", "sup", "base", "datatype", "owns", "plays", "relates")
+    KIND = "type"
+
+    def __init__(self, concept_id, label, sup, base, datatype=None):
+        self.id = concept_id
+        self._label = label
+        self.sup = sup
+        # entity, relation, attribute, or thing for the root of the hierarchy
+        self.base = base
+        self.datatype = datatype
+        self.owns = set()
+        self.plays = set()
+        self.relates = set()
+
+    def label(self):
+        return self._label
+
+
+class Thing(Concept):
+    __slots__ = ("_type", "owned", "relations")
+
+    def __init__(self, concept_id, thing_type):
+        self.id = concept_id
+        self._type = thing_type
+        # Attribute type label -> attributes owned, and relation id -> relations the thing plays a role in
+        self.owned = {}
+        self.relations = {}
+
+    def type(self):
+        return self._type
+
+
+class Entity(Thing):
+    __slots__ = ()
+    KIND = "entity"
+
+
+class Relation(Thing):
+    __slots__ = ("role_players",)
+    KIND = "relation"
+
+    def __init__(self, concept_id, thing_type):
+        super().__init__(concept_id, thing_type)
+        # (role, player) pairs, in the order they were inserted
+        self.role_players = []
+
+
+class Attribute(Thing):
+    __slots__ = ("_value", "owners")
+    KIND = "attribute"
+
+    def __init__(self, concept_id, thing_type, value):
+        super().__init__(concept_id, thing_type)
+        self._value = value
+        # Owner id -> owner
+        self.owners = {}
+
+    def value(self):
+        return self._value
+
+
+def _core_numbers(neighbours):
+    """
+    Core number of every thing, peeling the graph one k at a time as Grakn does: for k = 1, 2, ... the things with
+    fewer than k neighbours left are removed until none is left, and those removed for k have a core number of k - 1.
+    Deliberately independent of centrality.k_core_centrality, which the benchmarks check it against.
+    :param neighbours: list of the set of the neighbour indexes of each thing
+    :return: for each thing index, its core number
+    """
+    degrees = [len(thing_neighbours) for thing_neighbours in neighbours]
+    alive = set(range(len(neighbours)))
+    cores = [0] * len(neighbours)
+    k = 0
+    while alive:
+        k += 1
+        peeled = [index for index in alive if degrees[index] < k]
+        while peeled:
+            index = peeled.pop()
+            if index not in alive:
+                continue
+            alive.remove(index)
+            cores[index] = k - 1
+            for neighbour in neighbours[index]:
+                if neighbour in alive:
+                    degrees[neighbour] -= 1
+                    if degrees[neighbour] < k:
+                        peeled.append(neighbour)
+    return cores
+
+
+#######################################################################################################################################
+#
+#                                                       GRAQL PARSER
+#
+#######################################################################################################################################
+
+# Only the subset of Graql the scripts send is understood: define, match-get (with limit, offset and aggregates),
+# insert, match-insert, match-delete, and compute count, min, max, sum, mean, median, std, path and centrality.
+_TOKEN = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|(\$[\w-]+)|(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)(?![\w.])|'
+                    r'([A-Za-z_][\w-]*)|([;,:()\[\]=]))')
+_KEYWORDS = {"get", "insert", "delete"}
+_AGGREGATES = {"count", "sum", "min", "max", "mean", "median", "std"}
+_NO_VALUE = object()
+
+
+def tokenize(query):
+    """
+    :return: list of (kind, value), where kind is string, var, number, ident or punct
+    """
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None:
+            raise GraknError("Unsupported Graql at '" + query[position:position + 20].strip() + "'")
+        string, var, number, ident, punct = match.groups()
+        if string is not None:
+            tokens.append(("string", re.sub(r"\\(.)", r"\1", string[1:-1])))
+        elif var is not None:
+            tokens.append(("var", var[1:]))
+        elif number is not None:
+            tokens.append(("number", float(number) if any(c in number for c in ".eE") else int(number)))
+        elif ident is not None:
+            tokens.append(("ident", ident))
+        else:
+            tokens.append(("punct", punct))
+        position = match.end()
+    return tokens
+
+
+class Statement:
+    """
+    One statement of a pattern: a variable and its properties
+    """
+    __slots__ = ("var", "isa", "sub", "concept_id", "value", "roles", "has")
+
+    def __init__(self, var):
+        self.var = var
+        self.isa = None
+        self.sub = None
+        self.concept_id = None
+        self.value = _NO_VALUE
+        # (role or None, variable) of every role player, and (attribute type, variable or None, literal) of every has
+        self.roles = []
+        self.has = []
+
+    def variables(self):
+        return {self.var} | {var for role, var in self.roles} | {var for attribute, var, literal in self.has if var}
+
+
+class Query:
+    __slots__ = ("kind", "match", "body", "get", "modifiers", "aggregate", "method", "clauses")
+
+    def __init__(self, kind):
+        # define, get, insert, delete or compute
+        self.kind = kind
+        self.match = []
+        self.body = []
+        self.get = None
+        self.modifiers = {}
+        self.aggregate = None
+        self.method = None
+        self.clauses = {}
+
+
+class _Parser:
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+        self._anonymous = itertools.count()
+
+    def peek(self, offset=0):
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise GraknError("Unexpected end of the query")
+        self.position += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token = self.next()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise GraknError("Expected " + (value or kind) + " but found '" + str(token[1]) + "'")
+        return token[1]
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def done(self):
+        return self.position >= len(self.tokens)
+
+    # ===== Queries =====
+
+    def query(self):
+        keyword = self.expect("ident")
+        if keyword == "define":
+            query = Query("define")
+            while not self.done():
+                query.body.append(self.definition())
+        elif keyword == "insert":
+            query = Query("insert")
+            query.body = self.statements()
+        elif keyword == "match":
+            match = self.statements()
+            keyword = self.expect("ident")
+            if keyword not in _KEYWORDS:
+                raise GraknError("Unsupported Graql '" + keyword + "' after match")
+            query = Query(keyword)
+            query.match = match
+            if keyword == "get":
+                self.get(query)
+            else:
+                query.body = self.statements()
+        elif keyword == "compute":
+            query = Query("compute")
+            self.compute(query)
+        else:
+            raise GraknError("Unsupported Graql query '" + keyword + "'")
+        if not self.done():
+            raise GraknError("Unexpected '" + str(self.peek()[1]) + "' in the query")
+        if not query.match and not query.body and query.kind in ("insert", "delete"):
+            raise GraknError("Empty " + query.kind + " query")
+        return query
+
+    def statements(self):
+        statements = []
+        while self.peek()[0] == "var" or self.peek() == ("punct", "("):
+            statements.append(self.statement())
+        if not statements:
+            raise GraknError("Expected a pattern but found '" + str(self.peek()[1]) + "'")
+        return statements
+
+    def statement(self):
+        if self.peek()[0] == "var":
+            statement = Statement(self.next()[1])
+        else:
+            statement = Statement("#" + str(next(self._anonymous)))
+        if self.accept("punct", "("):
+            while True:
+                role = None
+                if self.peek()[0] == "ident" and self.peek(1) == ("punct", ":"):
+                    role = self.next()[1]
+                    self.next()
+                statement.roles.append((role, self.expect("var")))
+                if not self.accept("punct", ","):
+                    break
+            self.expect("punct", ")")
+        while not self.accept("punct", ";"):
+            self.property(statement)
+            self.accept("punct", ",")
+        return statement
+
+    def property(self, statement):
+        kind, value = self.next()
+        if kind == "ident" and value == "isa":
+            statement.isa = self.expect("ident")
+        elif kind == "ident" and value == "sub":
+            statement.sub = self.expect("ident")
+        elif kind == "ident" and value == "id":
+            statement.concept_id = self.expect("ident")
+        elif kind == "ident" and value == "has":
+            attribute = self.expect("ident")
+            kind, value = self.next()
+            if kind == "var":
+                statement.has.append((attribute, value, None))
+            else:
+                statement.has.append((attribute, None, self.literal(kind, value)))
+        else:
+            statement.value = self.literal(kind, value)
+
+    @staticmethod
+    def literal(kind, value):
+        if kind in ("string", "number"):
+            return value
+        if kind == "ident" and value in ("true", "false"):
+            return value == "true"
+        raise GraknError("Unsupported Graql property '" + str(value) + "'")
+
+    def get(self, query):
+        query.get = []
+        while self.peek()[0] == "var":
+            query.get.append(self.next()[1])
+            self.accept("punct", ",")
+        self.expect("punct", ";")
+        while not self.done():
+            modifier = self.expect("ident")
+            if modifier in ("limit", "offset"):
+                query.modifiers[modifier] = self.expect("number")
+            elif modifier in _AGGREGATES:
+                query.aggregate = (modifier, self.expect("var") if modifier != "count" else None)
+            else:
+                raise GraknError("Unsupported Graql modifier '" + modifier + "'")
+            self.expect("punct", ";")
+
+    def definition(self):
+        label = self.expect("ident")
+        properties = []
+        while not self.accept("punct", ";"):
+            keyword = self.expect("ident")
+            properties.append((keyword, None if keyword == "abstract" else self.expect("ident")))
+            self.accept("punct", ",")
+        return label, properties
+
+    def compute(self, query):
+        query.method = self.expect("ident")
+        while not self.accept("punct", ";"):
+            clause = self.expect("ident")
+            if clause in ("in", "of"):
+                query.clauses[clause] = self.labels()
+            elif clause in ("from", "to", "using"):
+                query.clauses[clause] = self.expect("ident")
+            elif clause == "where":
+                bracketed = self.accept("punct", "[")
+                while True:
+                    argument = self.expect("ident")
+                    self.expect("punct", "=")
+                    query.clauses[argument] = self.expect("number")
+                    if not (bracketed and self.accept("punct", ",")):
+                        break
+                if bracketed:
+                    self.expect("punct", "]")
+            else:
+                raise GraknError("Unsupported compute condition '" + clause + "'")
+            self.accept("punct", ",")
+
+    def labels(self):
+        if not self.accept("punct", "["):
+            return [self.expect("ident")]
+        labels = [self.expect("ident")]
+        while self.accept("punct", ","):
+            labels.append(self.expect("ident"))
+        self.expect("punct", "]")
+        return labels
+
+
+def parse(query):
+    return _Parser(query).query()
+
+
+#######################################################################################################################################
+#
+#                                                       KEYSPACE
+#
+#######################################################################################################################################
+
+class Keyspace:
+    """
+    Schema and data of one keyspace, and the evaluation of the queries against them. Writes are applied as they are
+    run and journaled, a write transaction that is closed without a commit undoes its journal. Transactions are not
+    isolated from each other: a read transaction sees the writes of the other transactions as soon as they are run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.types = {}
+        self.concepts = {}
+        # Type label -> id -> thing of exactly that type, and (attribute type label, value) -> attribute
+        self.instances = {}
+        self.attributes = {}
+        self._subtypes = {}
+        self.types["thing"] = Type(self._new_id(), "thing", None, "thing")
+        for base in ("entity", "relation", "attribute"):
+            self.types[base] = Type(self._new_id(), base, self.types["thing"], base)
+        for schema_type in self.types.values():
+            self.concepts[schema_type.id] = schema_type
+
+    def _new_id(self):
+        return "V" + str(next(self._ids))
+
+    # ===== Schema =====
+
+    def schema_type(self, label, base=None):
+        schema_type = self.types.get(label)
+        if schema_type is None:
+            raise GraknError("Type '" + label + "' does not exist in the keyspace " + self.name)
+        if base is not None and schema_type.base != base:
+            raise GraknError("Type '" + label + "' is not " + ("an " if base[0] in "aeiou" else "a ") + base)
+        return schema_type
+
+    @staticmethod
+    def supertypes(schema_type):
+        while schema_type is not None:
+            yield schema_type
+            schema_type = schema_type.sup
+
+    def subtypes(self, label):
+        """
+        :return: the labels of the type and of all its subtypes
+        """
+        if label not in self._subtypes:
+            schema_type = self.schema_type(label)
+            self._subtypes[label] = frozenset(
+                sub.label() for sub in self.types.values() if any(sup is schema_type for sup in self.supertypes(sub))
+            )
+        return self._subtypes[label]
+
+    def _define(self, definitions):
+        for label, properties in definitions:
+            keywords = dict(properties)
+            schema_type = self.types.get(label)
+            if schema_type is None:
+                if "sub" not in keywords:
+                    raise GraknError("Type '" + label + "' is defined without sub")
+                sup = self.schema_type(keywords["sub"])
+                schema_type = Type(self._new_id(), label, sup, sup.base, sup.datatype)
+                self.types[label] = schema_type
+                self.concepts[schema_type.id] = schema_type
+                self._subtypes = {}
+            for keyword, value in properties:
+                if keyword == "datatype":
+                    if value not in ("string", "long", "double", "boolean"):
+                        raise GraknError("Unsupported datatype " + value)
+                    schema_type.datatype = value
+                elif keyword in ("has", "key"):
+                    schema_type.owns.add(value)
+                elif keyword == "plays":
+                    schema_type.plays.add(value)
+                elif keyword == "relates":
+                    schema_type.relates.add(value)
+                elif keyword not in ("sub", "abstract"):
+                    raise GraknError("Unsupported schema property '" + keyword + "'")
+            if schema_type.base == "attribute" and schema_type.datatype is None:
+                raise GraknError("Attribute type '" + label + "' has no datatype")
+
+    def _convert(self, attribute_type, literal):
+        """
+        :return: the literal as a value of the datatype of the attribute type
+        """
+        datatype = attribute_type.datatype
+        if datatype == "string" and isinstance(literal, str):
+            return literal
+        if datatype == "boolean" and isinstance(literal, bool):
+            return literal
+        if not isinstance(literal, (str, bool)):
+            if datatype == "double":
+                return float(literal)
+            if datatype == "long" and float(literal).is_integer():
+                return int(literal)
+        raise GraknError("Value " + repr(literal) + " is not a " + str(datatype) + " of " + attribute_type.label())
+
+    # ===== Journaled writes =====
+
+    def _put(self, concept, journal):
+        self.concepts[concept.id] = concept
+        self.instances.setdefault(concept.type().label(), {})[concept.id] = concept
+        if concept.is_attribute():
+            self.attributes[(concept.type().label(), concept.value())] = concept
+        journal.append((self._remove, (concept,)))
+
+    def _remove(self, concept, journal):
+        del self.concepts[concept.id]
+        del self.instances[concept.type().label()][concept.id]
+        if concept.is_attribute():
+            del self.attributes[(concept.type().label(), concept.value())]
+        journal.append((self._put, (concept,)))
+
+    def _own(self, owner, attribute, journal):
+        if owner.id in attribute.owners:
+            return
+        owner.owned.setdefault(attribute.type().label(), []).append(attribute)
+        attribute.owners[owner.id] = owner
+        journal.append((self._disown, (owner, attribute)))
+
+    def _disown(self, owner, attribute, journal):
+        if owner.id not in attribute.owners:
+            return
+        owner.owned[attribute.type().label()].remove(attribute)
+        del attribute.owners[owner.id]
+        journal.append((self._own, (owner, attribute)))
+
+    def _add_player(self, relation, role, player, journal):
+        relation.role_players.append((role, player))
+        player.relations[relation.id] = relation
+        journal.append((self._remove_player, (relation, role, player)))
+
+    def _remove_player(self, relation, role, player, journal):
+        relation.role_players.remove((role, player))
+        if not any(other is player for other_role, other in relation.role_players):
+            del player.relations[relation.id]
+        journal.append((self._add_player, (relation, role, player)))
+
+    def _put_attribute(self, attribute_type, literal, journal):
+        value = self._convert(attribute_type, literal)
+        attribute = self.attributes.get((attribute_type.label(), value))
+        if attribute is None:
+            attribute = Attribute(self._new_id(), attribute_type, value)
+            self._put(attribute, journal)
+        return attribute
+
+    def _delete(self, thing, journal):
+        if thing.id not in self.concepts:
+            return
+        if thing.is_relation():
+            for role, player in list(thing.role_players):
+                self._remove_player(thing, role, player, journal)
+        for relation in list(thing.relations.values()):
+            for role, player in list(relation.role_players):
+                if player is thing:
+                    self._remove_player(relation, role, player, journal)
+            # Like Grakn, a relation left without any role player is deleted too
+            if not relation.role_players:
+                self._delete(relation, journal)
+        for attributes in list(thing.owned.values()):
+            for attribute in list(attributes):
+                self._disown(thing, attribute, journal)
+        if thing.is_attribute():
+            for owner in list(thing.owners.values()):
+                self._disown(owner, thing, journal)
+        self._remove(thing, journal)
+
+    @staticmethod
+    def rollback(journal):
+        for function, arguments in reversed(journal):
+            function(*arguments, [])
+        del journal[:]
+
+    # ===== Match =====
+
+    def _instances(self, label):
+        instances = []
+        for sub in self.subtypes(label):
+            instances.extend(self.instances.get(sub, {}).values())
+        return instances
+
+    def _cost(self, statement, bound):
+        """
+        Rough cost of binding the statement first, the statements are evaluated cheapest first
+        """
+        if statement.var in bound or statement.concept_id is not None:
+            return (0, 0)
+        if any(literal is not None for attribute, var, literal in statement.has):
+            return (1, 0)
+        if any(var in bound for role, var in statement.roles):
+            return (2, 0)
+        if statement.isa is not None:
+            return (3, sum(len(self.instances.get(sub, ())) for sub in self.subtypes(statement.isa)))
+        return (4, 0)
+
+    def _plan(self, statements):
+        remaining = list(statements)
+        plan = []
+        bound = set()
+        while remaining:
+            statement = min(remaining, key=lambda statement: self._cost(statement, bound))
+            remaining.remove(statement)
+            plan.append(statement)
+            bound |= statement.variables()
+        return plan
+
+    def _candidates(self, statement, binding):
+        if statement.var in binding:
+            return [binding[statement.var]]
+        if statement.concept_id is not None:
+            concept = self.concepts.get(statement.concept_id)
+            return [] if concept is None else [concept]
+        for attribute_label, var, literal in statement.has:
+            if literal is not None:
+                owners = []
+                for sub in self.subtypes(attribute_label):
+                    attribute = self.attributes.get((sub, self._convert(self.types[sub], literal)))
+                    if attribute is not None:
+                        owners.extend(attribute.owners.values())
+                return owners
+        for role, var in statement.roles:
+            if var in binding:
+                return list(binding[var].relations.values())
+        if statement.isa is not None:
+            return self._instances(statement.isa)
+        if statement.sub is not None:
+            return list(self.types.values())
+        return list(self.concepts.values())
+
+    def _accepts(self, statement, concept):
+        if statement.isa is not None and not (concept.is_thing() and concept.type().label() in self.subtypes(statement.isa)):
+            return False
+        if statement.sub is not None and not (concept.is_type() and concept.label() in self.subtypes(statement.sub)):
+            return False
+        if statement.concept_id is not None and concept.id != statement.concept_id:
+            return False
+        if statement.value is not _NO_VALUE and not (concept.is_attribute() and
+                                                     self._equal(concept, statement.value)):
+            return False
+        if statement.roles and not concept.is_relation():
+            return False
+        for attribute_label, var, literal in statement.has:
+            if literal is not None and not (concept.is_thing() and any(
+                    self._equal(attribute, literal) for attribute in self._owned(concept, attribute_label))):
+                return False
+        return True
+
+    def _equal(self, attribute, literal):
+        try:
+            return attribute.value() == self._convert(attribute.type(), literal)
+        except GraknError:
+            return False
+
+    def _owned(self, thing, attribute_label):
+        owned = []
+        for sub in self.subtypes(attribute_label):
+            owned.extend(thing.owned.get(sub, ()))
+        return owned
+
+    def _extend(self, statement, binding):
+        """
+        :return: generator of the bindings extended with every way of matching the statement
+        """
+        for concept in self._candidates(statement, binding):
+            if not self._accepts(statement, concept):
+                continue
+            extended = dict(binding)
+            extended[statement.var] = concept
+            yield from self._bind_roles(statement, concept, extended, 0, ())
+
+    def _bind_roles(self, statement, relation, binding, i, used):
+        if i == len(statement.roles):
+            yield from self._bind_has(statement, relation, binding, 0)
+            return
+        role, var = statement.roles[i]
+        for index, (player_role, player) in enumerate(relation.role_players):
+            if index in used or (role is not None and player_role != role):
+                continue
+            if var in binding:
+                if binding[var] is not player:
+                    continue
+                extended = binding
+            else:
+                extended = dict(binding)
+                extended[var] = player
+            yield from self._bind_roles(statement, relation, extended, i + 1, used + (index,))
+
+    def _bind_has(self, statement, thing, binding, i):
+        if i == len(statement.has):
+            yield binding
+            return
+        attribute_label, var, literal = statement.has[i]
+        if var is None:
+            yield from self._bind_has(statement, thing, binding, i + 1)
+            return
+        for attribute in self._owned(thing, attribute_label):
+            if var in binding:
+                if binding[var] is not attribute:
+                    continue
+                extended = binding
+            else:
+                extended = dict(binding)
+                extended[var] = attribute
+            yield from self._bind_has(statement, thing, extended, i + 1)
+
+    def match(self, statements):
+        """
+        :return: generator of the answers of the pattern, as dictionaries of variable -> concept
+        """
+        plan = self._plan(statements)
+
+        def solve(i, binding):
+            if i == len(plan):
+                yield binding
+                return
+            for extended in self._extend(plan[i], binding):
+                yield from solve(i + 1, extended)
+        return solve(0, {})
+
+    # ===== Queries =====
+
+    def execute(self, query, write, journal):
+        """
+        :param query: Graql query text
+        :param write: False for a read transaction, where the queries that write are refused
+        :param journal: journal of the writes of the transaction
+        :return: list of answers
+        """
+        parsed = parse(query)
+        if not write and parsed.kind in ("define", "insert", "delete"):
+            raise GraknError("Cannot run " + parsed.kind + " queries in a read transaction")
+        with self.lock:
+            if parsed.kind == "define":
+                self._define(parsed.body)
+                return []
+            if parsed.kind == "get":
+                return self._get(parsed)
+            if parsed.kind == "insert":
+                answers = list(self.match(parsed.match)) if parsed.match else [{}]
+                return [ConceptMap(self._insert(parsed.body, binding, journal)) for binding in answers]
+            if parsed.kind == "delete":
+                answers = list(self.match(parsed.match))
+                for binding in answers:
+                    self._delete_statements(parsed.body, binding, journal)
+                return [Void("Deleted facts from " + str(len(answers)) + " matched answers.")]
+            return self._compute(parsed)
+
+    def _get(self, query):
+        named = [var for statement in query.match for var in sorted(statement.variables()) if not var.startswith("#")]
+        variables = query.get or list(dict.fromkeys(named))
+        for var in variables:
+            if var not in named:
+                raise GraknError("Variable " + var + " of get is not in the match pattern")
+        answers = []
+        seen = set()
+        for binding in self.match(query.match):
+            key = tuple(binding[var].id for var in variables)
+            if key not in seen:
+                seen.add(key)
+                answers.append(ConceptMap({var: binding[var] for var in variables}))
+        offset = query.modifiers.get("offset", 0)
+        answers = answers[offset:]
+        if "limit" in query.modifiers:
+            answers = answers[:query.modifiers["limit"]]
+
+        if query.aggregate is None:
+            return answers
+        method, var = query.aggregate
+        if method == "count":
+            return [Value(len(answers))]
+        values = [answer.get(var).value() for answer in answers if answer.get(var).is_attribute()]
+        return self._statistic(method, values)
+
+    def _insert(self, statements, binding, journal):
+        binding = dict(binding)
+        for statement in statements:
+            concept = binding.get(statement.var)
+            if concept is None and statement.concept_id is not None:
+                concept = self.concepts.get(statement.concept_id)
+                if concept is None:
+                    raise GraknError("There is no concept with id " + statement.concept_id)
+            if concept is None:
+                if statement.isa is None:
+                    raise GraknError("Variable " + statement.var + " is inserted without isa")
+                schema_type = self.schema_type(statement.isa)
+                if schema_type.base == "entity":
+                    concept = Entity(self._new_id(), schema_type)
+                    self._put(concept, journal)
+                elif schema_type.base == "relation":
+                    if not statement.roles:
+                        raise GraknError("Relation " + statement.var + " is inserted without role players")
+                    concept = Relation(self._new_id(), schema_type)
+                    self._put(concept, journal)
+                elif schema_type.base == "attribute" and statement.value is not _NO_VALUE:
+                    concept = self._put_attribute(schema_type, statement.value, journal)
+                else:
+                    raise GraknError("Cannot insert an instance of " + statement.isa)
+            elif statement.isa is not None and concept.type().label() not in self.subtypes(statement.isa):
+                raise GraknError("Variable " + statement.var + " is not a " + statement.isa)
+            binding[statement.var] = concept
+
+            for role, var in statement.roles:
+                if not concept.is_relation():
+                    raise GraknError("Variable " + statement.var + " is not a relation")
+                if role is None or not any(role in sup.relates for sup in self.supertypes(concept.type())):
+                    raise GraknError("Relation type " + concept.type().label() + " does not relate " + str(role))
+                if var not in binding:
+                    raise GraknError("Role player " + var + " is not bound")
+                player = binding[var]
+                if not any(role in sup.plays for sup in self.supertypes(player.type())):
+                    raise GraknError("Type " + player.type().label() + " does not play the role " + role)
+                self._add_player(concept, role, player, journal)
+
+            for attribute_label, var, literal in statement.has:
+                if not any(attribute_label in sup.owns for sup in self.supertypes(concept.type())):
+                    raise GraknError("Type " + concept.type().label() + " cannot have the attribute " + attribute_label)
+                if var is None:
+                    attribute = self._put_attribute(self.schema_type(attribute_label, "attribute"), literal, journal)
+                elif var in binding and binding[var].is_attribute():
+                    attribute = binding[var]
+                else:
+                    raise GraknError("Attribute " + var + " is not bound")
+                self._own(concept, attribute, journal)
+        return binding
+
+    def _delete_statements(self, statements, binding, journal):
+        for statement in statements:
+            if statement.var not in binding:
+                raise GraknError("Variable " + statement.var + " of delete is not in the match pattern")
+            concept = binding[statement.var]
+            if statement.has:
+                for attribute_label, var, literal in statement.has:
+                    if var is None or var not in binding:
+                        raise GraknError("Attributes are deleted through a variable of the match pattern")
+                    self._disown(concept, binding[var], journal)
+            elif statement.roles:
+                for role, var in statement.roles:
+                    if (role, binding.get(var)) in concept.role_players:
+                        self._remove_player(concept, role, binding[var], journal)
+            else:
+                if statement.isa is not None and concept.type().label() not in self.subtypes(statement.isa):
+                    raise GraknError("Variable " + statement.var + " is not a " + statement.isa)
+                self._delete(concept, journal)
+
+    # ===== Compute =====
+
+    def _scope(self, labels, default_bases):
+        if labels is None:
+            return [thing for thing in self.concepts.values() if thing.is_thing() and thing.KIND in default_bases]
+        things = []
+        for label in labels:
+            things.extend(self._instances(label))
+        return things
+
+    def _compute(self, query):
+        method = query.method
+        clauses = query.clauses
+        if method == "count":
+            return [Value(len(self._scope(clauses.get("in"), ("entity", "relation", "attribute"))))]
+        if method in _AGGREGATES:
+            if "of" not in clauses:
+                raise GraknError("compute " + method + " needs the attributes to compute it of")
+            for label in clauses["of"]:
+                if self.schema_type(label, "attribute").datatype not in ("long", "double"):
+                    raise GraknError("compute " + method + " needs a numeric attribute, " + label + " is not one")
+            values = []
+            for thing in self._scope(clauses.get("in"), ("entity", "relation")):
+                for label in clauses["of"]:
+                    values.extend(attribute.value() for attribute in self._owned(thing, label))
+            return self._statistic(method, values)
+        if method == "path":
+            return self._path(clauses)
+        if method == "centrality":
+            return self._centrality(clauses)
+        raise GraknError("Unsupported compute method '" + method + "'")
+
+    @staticmethod
+    def _statistic(method, values):
+        if not values:
+            return []
+        if method == "min":
+            return [Value(min(values))]
+        if method == "max":
+            return [Value(max(values))]
+        if method == "sum":
+            return [Value(sum(values))]
+        if method == "mean":
+            return [Value(sum(values) / len(values))]
+        values = sorted(values)
+        middle = len(values) // 2
+        if method == "median":
+            return [Value(values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2)]
+        mean = sum(values) / len(values)
+        return [Value(math.sqrt(sum((value - mean) ** 2 for value in values) / len(values)))]
+
+    def _path(self, clauses):
+        """
+        One of the shortest paths, in number of concepts, from one concept to another through the relations of the
+        scope. Grakn returns every shortest path, the scripts only ever read the first one.
+        """
+        if "from" not in clauses or "to" not in clauses:
+            raise GraknError("compute path needs from and to")
+        origin = self.concepts.get(clauses["from"])
+        destination = self.concepts.get(clauses["to"])
+        if origin is None or destination is None:
+            raise GraknError("compute path from an unknown concept id")
+        scope = set(thing.id for thing in self._scope(clauses.get("in"), ("entity", "relation")))
+
+        previous = {origin.id: None}
+        queue = deque([origin])
+        while queue:
+            concept = queue.popleft()
+            if concept is destination:
+                path = []
+                concept_id = destination.id
+                while concept_id is not None:
+                    path.append(concept_id)
+                    concept_id = previous[concept_id]
+                return [ConceptList(path[::-1])]
+            if concept.is_relation():
+                neighbours = [player for role, player in concept.role_players]
+            else:
+                neighbours = list(concept.relations.values())
+            for neighbour in neighbours:
+                if neighbour.id in scope and neighbour.id not in previous:
+                    previous[neighbour.id] = concept.id
+                    queue.append(neighbour)
+        return []
+
+    def _centrality(self, clauses):
+        """
+        Degree: number of relations of the scope each thing plays a role in. k-core: core number of each thing in the
+        graph of the things linked by a relation of the scope, only for the cores of at least min-k.
+        """
+        using = clauses.get("using", "degree")
+        things = [thing for thing in self._scope(clauses.get("in"), ("entity", "relation")) if not thing.is_relation()]
+        relations = [thing for thing in self._scope(clauses.get("in"), ("relation",)) if thing.is_relation()]
+        if "of" in clauses:
+            of = set().union(*(self.subtypes(label) for label in clauses["of"]))
+            targets = [thing for thing in things if thing.type().label() in of]
+        else:
+            targets = things
+
+        scores = {}
+        if using == "degree":
+            relation_ids = set(relation.id for relation in relations)
+            for thing in targets:
+                degree = sum(1 for relation_id in thing.relations if relation_id in relation_ids)
+                if degree:
+                    scores.setdefault(degree, set()).add(thing.id)
+        elif using == "k-core":
+            min_k = clauses.get("min-k", 2)
+            if min_k < 2:
+                raise GraknError("min-k of compute centrality using k-core must be at least 2")
+            index = { thing.id: i for i, thing in enumerate(things) }
+            neighbours = [set() for thing in things]
+            for relation in relations:
+                players = [index[player.id] for role, player in relation.role_players if player.id in index]
+                for a, b in itertools.combinations(players, 2):
+                    if a != b:
+                        neighbours[a].add(b)
+                        neighbours[b].add(a)
+            cores = _core_numbers(neighbours)
+            target_ids = set(thing.id for thing in targets)
+            for thing, core in zip(things, cores):
+                if core >= min_k and thing.id in target_ids:
+                    scores.setdefault(core, set()).add(thing.id)
+        else:
+            raise GraknError("Unsupported centrality '" + using + "'")
+        return [ConceptSetMeasure(scores[score], score) for score in sorted(scores)]
+
+
+#######################################################################################################################################
+#
+#                                                   CLIENT API
+#
+#######################################################################################################################################
+
+# uri -> keyspace name -> Keyspace
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+class GraknClient:
+    """
+    Stand-in for grakn.client.GraknClient, for the benchmarks and for running the scripts without a Grakn server
+    """
+
+    def __init__(self, uri=MEMORY_URI_PREFIX, credentials=None):
+        self.uri = uri
+        with _servers_lock:
+            self._keyspaces = _servers.setdefault(uri, {})
+
+    def session(self, keyspace):
+        # Like Grakn, the keyspace is created by the first session opened on it
+        with _servers_lock:
+            if keyspace not in self._keyspaces:
+                self._keyspaces[keyspace] = Keyspace(keyspace)
+            return Session(self._keyspaces[keyspace])
+
+    def keyspaces(self):
+        return KeyspaceManager(self._keyspaces)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+
+class KeyspaceManager:
+
+    def __init__(self, keyspaces):
+        self._keyspaces = keyspaces
+
+    def retrieve(self):
+        with _servers_lock:
+            return list(self._keyspaces)
+
+    def delete(self, keyspace):
+        with _servers_lock:
+            if keyspace not in self._keyspaces:
+                raise GraknError("Keyspace " + keyspace + " does not exist")
+            del self._keyspaces[keyspace]
+
+
+class Session:
+
+    def __init__(self, keyspace):
+        self._keyspace = keyspace
+        self._open = True
+
+    def transaction(self):
+        if not self._open:
+            raise GraknError("The session is closed")
+        return TransactionBuilder(self._keyspace)
+
+    def close(self):
+        self._open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+
+class TransactionBuilder:
+
+    def __init__(self, keyspace):
+        self._keyspace = keyspace
+
+    def read(self):
+        return Transaction(self._keyspace, write=False)
+
+    def write(self):
+        return Transaction(self._keyspace, write=True)
+
+
+class Transaction:
+    """
+    The answers are computed when the query is run, and returned as an iterator like the streamed answers of Grakn.
+    The writes of a transaction closed without a commit are undone.
+    """
+
+    def __init__(self, keyspace, write):
+        self._keyspace = keyspace
+        self._write = write
+        self._journal = []
+        self._open = True
+
+    def query(self, query, infer=True):
+        if not self._open:
+            raise GraknError("The transaction is closed")
+        return iter(self._keyspace.execute(query, self._write, self._journal))
+
+    def commit(self):
+        if not self._open:
+            raise GraknError("The transaction is closed")
+        if not self._write:
+            raise GraknError("A read transaction cannot be committed")
+        self._journal = []
+        self._open = False
+
+    def close(self):
+        if self._open and self._journal:
+            with self._keyspace.lock:
+                self._keyspace.rollback(self._journal)
+        self._open = False
+
+    def is_open(self):
+        return self._open
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
@@ -0,0 +1,56 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+# The server and keyspace can be overridden without touching the code, ex: GRAKN_URI=grakn-host:48555, or
+# GRAKN_URI=memory: for the in-memory stand-in. Defined here so that the caches can be checked without importing the
+# Grakn client.
+GRAKN_URI = os.environ.get("GRAKN_URI", "localhost:48555")
+KEYSPACE = os.environ.get("GRAKN_KEYSPACE", "paris_subway")
+# Uris selecting the in-memory stand-in of memory_grakn.py, which is only imported for them
+MEMORY_URI_PREFIX = "memory:"
+
+# Written by data/migration_subway.py after every successful load, with the fingerprints of the loaded csv files, and by
+# data/snapshot.py after a restore. It holds the id of the last load of every keyspace: reloading a keyspace, even from
+# the same csv files, gives new concept ids, so anything keeping concept ids on disk must be checked against the load id
+# of its keyspace.
+MIGRATION_STATE_FILE = "./data/migration_state.json"
+
+
+def database_key(uri, keyspace):
+    """
+    Key of a keyspace of a server, the same as data/migration_state.database_key
+    """
+    return uri + "/" + keyspace
+
+
+def migration_loads(state_path=MIGRATION_STATE_FILE):
+    """
+    :return: dictionary database key -> id of the last load of that keyspace, empty if there is no record of any
+    """
+    try:
+        with open(state_path) as state_file:
+            loads = json.load(state_file).get("loads", {})
+        return loads if isinstance(loads, dict) else {}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def load_marker(uri, keyspace, state_path=MIGRATION_STATE_FILE):
+    """
+    :return: the id of the last recorded load of the keyspace, or None if it was never recorded
+    """
+    return migration_loads(state_path).get(database_key(uri, keyspace))
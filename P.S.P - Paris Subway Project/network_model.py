@@ -0,0 +1,278 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from migration_marker import GRAKN_URI, KEYSPACE, MIGRATION_STATE_FILE, database_key, load_marker
+from query_profiler import execute_and_log
+import hashlib
+import json
+import os
+
+# Local copy of the network, reused as long as its keyspace has not been loaded again
+NETWORK_CACHE_FILE = "./network_cache.json"
+
+
+class Station:
+    """
+    A station of the network, as loaded from Grakn
+    """
+    __slots__ = ("index", "concept_id", "station_id", "name", "lat", "lon", "lines")
+
+    def __init__(self, index, concept_id, station_id, name, lat, lon):
+        self.index = index
+        self.concept_id = concept_id
+        self.station_id = station_id
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        # Names of the lines serving the station, filled from the routes
+        self.lines = []
+
+    def __repr__(self):
+        return "Station(" + self.name + ", " + self.concept_id + ")"
+
+
+class Edge:
+    """
+    A route from one station to another, on a given line. Stations are referenced by their index in the model
+    """
+    __slots__ = ("index", "beginning", "end", "line", "distance")
+
+    def __init__(self, index, beginning, end, line, distance=None):
+        self.index = index
+        self.beginning = beginning
+        self.end = end
+        self.line = line
+        self.distance = distance
+
+    def __repr__(self):
+        return "Edge(" + str(self.beginning) + " -> " + str(self.end) + ", " + self.line + ")"
+
+
+class NetworkModel:
+    """
+    The whole tube network, loaded once from Grakn with a handful of bulk queries. Grakn stays the source of truth, but
+    every lookup by name, concept id or line is then answered in memory.
+    """
+
+    STATIONS_QUERY = 'match $sta isa station, has name $name, has station_id $station_id, has lat $lat, has lon $lon; get $sta, $name, $station_id, $lat, $lon;'
+    ROUTES_QUERY = 'match $route (beginning : $sta1, end : $sta2) isa route, has station_ligne $ligne; get $route, $sta1, $sta2, $ligne;'
+    DISTANCES_QUERY = 'match $route isa route, has distance $distance; get $route, $distance;'
+
+    def __init__(self, stations, edges):
+        """
+        :param stations: list of Station, where station.index is the position in the list
+        :param edges: list of Edge, where edge.index is the position in the list
+        """
+        self.stations = stations
+        self.edges = edges
+        self._version = None
+
+        self.by_concept_id = {}
+        self.by_name = {}
+        for station in stations:
+            self.by_concept_id[station.concept_id] = station.index
+            self.by_name[station.name] = station.index
+
+        # Outgoing edges of every station, and stations served by every line
+        self.adjacency = [[] for station in stations]
+        self.by_line = {}
+        for edge in edges:
+            self.adjacency[edge.beginning].append(edge.index)
+            for station_index in (edge.beginning, edge.end):
+                station = stations[station_index]
+                if edge.line not in station.lines:
+                    station.lines.append(edge.line)
+                    self.by_line.setdefault(edge.line, []).append(station_index)
+
+    @classmethod
+    def load(cls, connection):
+        """
+        Load the network through a short-lived read transaction of the given grakn_connection.GraknConnection
+        """
+        with connection.read() as transaction:
+            return cls.from_transaction(transaction)
+
+    @classmethod
+    def from_transaction(cls, transaction):
+        """
+        Load the network with three queries: every station, every route, and the distance of the routes that have one
+        """
+        stations = []
+        by_concept_id = {}
+        for answer in execute_and_log(cls.STATIONS_QUERY, transaction):
+            concept_id = answer.get('sta').id
+            by_concept_id[concept_id] = len(stations)
+            stations.append(Station(
+                len(stations),
+                concept_id,
+                answer.get('station_id').value(),
+                answer.get('name').value(),
+                float(answer.get('lat').value()),
+                float(answer.get('lon').value())
+            ))
+
+        distances = {}
+        for answer in execute_and_log(cls.DISTANCES_QUERY, transaction):
+            distances[answer.get('route').id] = float(answer.get('distance').value())
+
+        edges = []
+        for answer in execute_and_log(cls.ROUTES_QUERY, transaction):
+            beginning = by_concept_id.get(answer.get('sta1').id)
+            end = by_concept_id.get(answer.get('sta2').id)
+            if beginning is None or end is None:
+                continue
+            edges.append(Edge(len(edges), beginning, end, answer.get('ligne').value(), distances.get(answer.get('route').id)))
+
+        print("Network loaded: " + str(len(stations)) + " stations, " + str(len(edges)) + " routes")
+        return cls(stations, edges)
+
+    @classmethod
+    def load_cached(cls, connect, uri=GRAKN_URI, keyspace=KEYSPACE, path=NETWORK_CACHE_FILE,
+                    state_path=MIGRATION_STATE_FILE):
+        """
+        Load the network from the local cache if it was saved from the same keyspace since its last load, otherwise
+        from Grakn, and save it for the next start. The concept ids change with every load, even from the same csv
+        files: without a load recorded by the migration or a restore the cache cannot be checked, and the network
+        always comes from Grakn.
+        :param connect: function returning a grakn_connection.GraknConnection to uri and keyspace, only called when the
+        cache is not used
+        """
+        database = database_key(uri, keyspace)
+        marker = load_marker(uri, keyspace, state_path)
+        if marker is not None:
+            network = cls._read_cache(path, database, marker)
+            if network is not None:
+                print("Network loaded from " + path + ": " + str(len(network.stations)) + " stations, " +
+                      str(len(network.edges)) + " routes")
+                return network
+
+        network = cls.load(connect())
+        if marker is not None:
+            network._write_cache(path, database, marker)
+        return network
+
+    @classmethod
+    def _read_cache(cls, path, database, marker):
+        """
+        :return: the cached network, or None if it is missing, unreadable or saved from another keyspace or load
+        """
+        try:
+            with open(path) as cache_file:
+                cached = json.load(cache_file)
+            if cached["database"] != database or cached["load"] != marker:
+                return None
+            stations = [
+                Station(index, concept_id, station_id, name, lat, lon)
+                for index, (concept_id, station_id, name, lat, lon) in enumerate(cached["stations"])
+            ]
+            edges = [
+                Edge(index, beginning, end, line, distance)
+                for index, (beginning, end, line, distance) in enumerate(cached["routes"])
+            ]
+            network = cls(stations, edges)
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            return None
+        # A cache that was modified or only partly written does not hash to the version it was saved with
+        return network if network.version() == cached["network_version"] else None
+
+    def _write_cache(self, path, database, marker):
+        cached = {
+            "database": database,
+            "load": marker,
+            "network_version": self.version(),
+            "stations": [
+                [station.concept_id, station.station_id, station.name, station.lat, station.lon] for station in self.stations
+            ],
+            "routes": [[edge.beginning, edge.end, edge.line, edge.distance] for edge in self.edges],
+        }
+        try:
+            with open(path + ".tmp", "w") as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            print("Could not save the network cache: " + str(error))
+
+    def version(self):
+        """
+        Hash of the content of the network, independent of the Grakn ids and of the order of the answers, so that
+        anything computed from the network can be cached on disk and checked against the data it was computed from
+        :return: hexadecimal string
+        """
+        if self._version is None:
+            digest = hashlib.sha1()
+            for station in sorted(self.stations, key=lambda station: (station.name, station.station_id)):
+                digest.update((station.name + "|" + station.station_id + "|" + repr(station.lat) + "|" + repr(station.lon) + "\n").encode("utf-8"))
+            routes = sorted(
+                (self.stations[edge.beginning].name, self.stations[edge.end].name, edge.line, repr(edge.distance)) for edge in self.edges
+            )
+            for route in routes:
+                digest.update(("|".join(route) + "\n").encode("utf-8"))
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def station(self, concept_id):
+        """
+        :return: the Station with the given Grakn concept id, or None
+        """
+        index = self.by_concept_id.get(concept_id)
+        return None if index is None else self.stations[index]
+
+    def station_named(self, name):
+        """
+        :return: the Station with the given name, or None
+        """
+        index = self.by_name.get(name)
+        return None if index is None else self.stations[index]
+
+    def names(self):
+        return [station.name for station in self.stations]
+
+    def lines_between(self, beginning, end):
+        """
+        :param beginning: index of the first station
+        :param end: index of the second station
+        :return: the lines of the routes going directly from beginning to end
+        """
+        return [self.edges[edge].line for edge in self.adjacency[beginning] if self.edges[edge].end == end]
+
+    def bounds(self):
+        """
+        :return: min_lat, max_lat, min_lon, max_lon of all the stations
+        """
+        lats = [station.lat for station in self.stations]
+        lons = [station.lon for station in self.stations]
+        return min(lats), max(lats), min(lons), max(lons)
+
+    def visualisation_data(self):
+        """
+        The routes in the format used by TubeGui to draw the map
+        :return: dict of route number -> line and coordinates of both ends
+        """
+        coordinates = {}
+        for edge in self.edges:
+            coordinates[edge.index + 1] = {
+                "station_ligne": [edge.line],
+                "from": self._station_details(self.stations[edge.beginning]),
+                "to": self._station_details(self.stations[edge.end])
+            }
+        return coordinates
+
+    @staticmethod
+    def _station_details(station):
+        return {
+            "lon": station.lon,
+            "lat": station.lat,
+            "station_name": station.name,
+            "station_id": station.station_id
+        }
@@ -0,0 +1,181 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from network_model import NetworkModel
+from routing import Path, WEIGHTS, route_lengths
+import argparse
+import json
+import numpy as np
+import time
+
+# The tables of a weight are written to PATH_TABLES_PREFIX + "_" + weight + ".distances.npy" / ".next.npy" / ".json"
+PATH_TABLES_PREFIX = "./path_tables"
+
+NO_HOP = -1
+
+
+class PathTables:
+    """
+    All-pairs shortest paths of the network as two NumPy matrices: the cost between every pair of stations, and the
+    next station to go to from the first station of the pair to reach the second one. Any path is then a walk through
+    the next-hop matrix, in O(path length).
+    Rows and columns follow the order of `names`, which may differ from the order of the stations in the network model.
+    """
+
+    def __init__(self, network, weight, names, distances, next_hops):
+        """
+        :param names: station name of every row of the matrices
+        :param distances: n x n matrix of the cost of the shortest paths, inf when there is no path
+        :param next_hops: n x n matrix of the row of the next station, NO_HOP when there is no path
+        """
+        self._network = network
+        self.weight = weight
+        self.names = names
+        self.distances = distances
+        self.next_hops = next_hops
+        self._row = { network.by_name[name]: row for row, name in enumerate(names) }
+        self._station = [network.by_name[name] for name in names]
+
+        # Line of the cheapest route between two adjacent stations, to give the line of every hop of a walk
+        lengths = route_lengths(network)
+        self._lines = {}
+        best = {}
+        for edge in network.edges:
+            cost = lengths[edge.index] if weight == "distance" else 1
+            key = (edge.beginning, edge.end)
+            if key not in best or cost < best[key]:
+                best[key] = cost
+                self._lines[key] = edge.line
+
+    @classmethod
+    def build(cls, network, weight="distance"):
+        """
+        Vectorized Floyd-Warshall: for every intermediate station k, every pair (i, j) is relaxed through k in a
+        single NumPy operation
+        """
+        if weight not in WEIGHTS:
+            raise ValueError("Unknown weight " + str(weight) + ", expected one of " + ", ".join(WEIGHTS))
+        n = len(network.stations)
+        lengths = route_lengths(network)
+
+        distances = np.full((n, n), np.inf)
+        np.fill_diagonal(distances, 0)
+        next_hops = np.full((n, n), NO_HOP, dtype=np.int32)
+        next_hops[np.arange(n), np.arange(n)] = np.arange(n)
+        for edge in network.edges:
+            cost = lengths[edge.index] if weight == "distance" else 1
+            if cost < distances[edge.beginning, edge.end]:
+                distances[edge.beginning, edge.end] = cost
+                next_hops[edge.beginning, edge.end] = edge.end
+
+        for k in range(n):
+            through_k = distances[:, k, None] + distances[None, k, :]
+            shorter = through_k < distances
+            distances = np.where(shorter, through_k, distances)
+            next_hops = np.where(shorter, next_hops[:, k, None], next_hops)
+
+        return cls(network, weight, [station.name for station in network.stations], distances, next_hops)
+
+    def save(self, prefix=PATH_TABLES_PREFIX):
+        prefix = prefix + "_" + self.weight
+        np.save(prefix + ".distances.npy", self.distances)
+        np.save(prefix + ".next.npy", self.next_hops)
+        # The metadata is written last, tables without it are never loaded
+        with open(prefix + ".json", "w") as meta_file:
+            json.dump({"dataset_version": self._network.version(), "weight": self.weight, "names": self.names}, meta_file)
+
+    @classmethod
+    def load(cls, network, weight="distance", prefix=PATH_TABLES_PREFIX):
+        """
+        Memory-map the tables written by save
+        :return: the tables, or None if they are missing or were computed from another version of the network
+        """
+        prefix = prefix + "_" + weight
+        try:
+            with open(prefix + ".json") as meta_file:
+                meta = json.load(meta_file)
+            if meta["dataset_version"] != network.version() or sorted(meta["names"]) != sorted(network.by_name):
+                return None
+            distances = np.load(prefix + ".distances.npy", mmap_mode="r")
+            next_hops = np.load(prefix + ".next.npy", mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(network, weight, meta["names"], distances, next_hops)
+
+    @classmethod
+    def load_or_build(cls, network, weight="distance", prefix=PATH_TABLES_PREFIX):
+        """
+        Load the tables of the network, or rebuild and save them when they are missing or stale
+        """
+        tables = cls.load(network, weight, prefix)
+        if tables is None:
+            start = time.perf_counter()
+            tables = cls.build(network, weight)
+            print("Path tables (" + weight + ") rebuilt for dataset " + network.version() + " in " +
+                  "%.2f" % (time.perf_counter() - start) + " s")
+            try:
+                tables.save(prefix)
+            except OSError as error:
+                print("Could not save the path tables: " + str(error))
+        return tables
+
+    def cost(self, origin, destination):
+        """
+        :param origin: index of the origin station in the network model
+        :param destination: index of the destination station
+        :return: the cost of the shortest path, inf if there is none
+        """
+        return float(self.distances[self._row[origin], self._row[destination]])
+
+    def path(self, origin, destination):
+        """
+        Walk the next-hop matrix from origin to destination
+        :return: a routing.Path, or None if the destination cannot be reached
+        """
+        row = self._row[origin]
+        target = self._row[destination]
+        if self.next_hops[row, target] == NO_HOP:
+            return None
+
+        stations = [origin]
+        lines = []
+        while row != target:
+            row = int(self.next_hops[row, target])
+            station_index = self._station[row]
+            lines.append(self._lines[(stations[-1], station_index)])
+            stations.append(station_index)
+        return Path([self._network.stations[index] for index in stations], lines, self.cost(origin, destination))
+
+
+if __name__ == "__main__":
+
+    from grakn_connection import GraknConnection
+
+    parser = argparse.ArgumentParser(description="Precompute the all-pairs shortest path tables of the network")
+    parser.add_argument("--keyspace", default="paris_subway")
+    parser.add_argument("--weight", choices=WEIGHTS, action="append", help="weight of the tables, all by default")
+    parser.add_argument("--prefix", default=PATH_TABLES_PREFIX, help="path prefix of the files to write")
+    args = parser.parse_args()
+
+    with GraknConnection(keyspace = args.keyspace) as connection:
+        network = NetworkModel.load(connection)
+
+    for weight in (args.weight or WEIGHTS):
+        start = time.perf_counter()
+        tables = PathTables.build(network, weight)
+        tables.save(args.prefix)
+        reachable = int(np.count_nonzero(np.isfinite(tables.distances)))
+        print("Path tables (" + weight + ") : " + str(len(tables.names)) + " stations, " + str(reachable) +
+              " reachable pairs, built in " + "%.2f" % (time.perf_counter() - start) + " s, written to " +
+              args.prefix + "_" + weight + ".*")
@@ -0,0 +1,356 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from migration_marker import MIGRATION_STATE_FILE, database_key, migration_loads
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import weakref
+
+# QUERY_CACHE=0 turns the cache off, every query then goes to Grakn
+CACHING = os.environ.get("QUERY_CACHE", "1") != "0"
+# Answers are also kept on disk, under QUERY_CACHE_DIR/<server and keyspace>/<load id>/, so that the next runs reuse
+# them. Only the directory of the last load of a keyspace is kept. An empty QUERY_CACHE_DIR keeps them in memory only.
+QUERY_CACHE_DIR = os.environ.get("QUERY_CACHE_DIR", "./query_cache")
+# Bounds of the in-memory layer: number of queries, and size of their answers as JSON
+MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_ENTRIES", "1024"))
+MAX_BYTES = int(os.environ.get("QUERY_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# The migration record is checked again at most this often, in seconds
+VERSION_CHECK_INTERVAL = 1.0
+
+_READ_QUERY = re.compile(r"^(match\b.*\bget\b|compute\b)")
+_WRITE_QUERY = re.compile(r"\b(insert|delete|define|undefine)\b")
+
+
+# Server and keyspace of the transactions opened by grakn_connection.py. The answers of the other transactions are not
+# cached, as there is no telling which keyspace they come from.
+_transaction_databases = weakref.WeakKeyDictionary()
+
+
+def bind_transaction(transaction, uri, keyspace):
+    """
+    Record which keyspace of which server the transaction reads, so that its read queries can be cached
+    """
+    try:
+        _transaction_databases[transaction] = database_key(uri, keyspace)
+    except TypeError:
+        pass
+
+
+def transaction_database(transaction):
+    """
+    :return: the database key of the transaction, or None if it was not opened through grakn_connection.py
+    """
+    try:
+        return _transaction_databases.get(transaction)
+    except TypeError:
+        return None
+
+
+def normalize_query(query):
+    """
+    :return: the query with its whitespace collapsed, the key of its answers in the cache
+    """
+    return " ".join(query.split())
+
+
+def is_read_query(normalized_query):
+    return bool(_READ_QUERY.match(normalized_query)) and not _WRITE_QUERY.search(normalized_query)
+
+
+class CachedConcept:
+    """
+    The parts of a Grakn concept read by the scripts: its id, and its value for an attribute
+    """
+    __slots__ = ("id", "_value", "_attribute")
+
+    def __init__(self, concept_id, value=None, attribute=False):
+        self.id = concept_id
+        self._value = value
+        self._attribute = attribute
+
+    def value(self):
+        return self._value
+
+    def is_attribute(self):
+        return self._attribute
+
+
+class CachedConceptMap:
+    """
+    Answer of a match-get query, read like a grakn ConceptMap
+    """
+    __slots__ = ("_concept_map",)
+
+    def __init__(self, concept_map):
+        self._concept_map = concept_map
+
+    def get(self, var=None):
+        return self if var is None else self._concept_map[var]
+
+    def map(self):
+        return self._concept_map
+
+
+class CachedValue:
+    """
+    Answer of a compute count / min / max ... query, read like a grakn Value
+    """
+    __slots__ = ("_number",)
+
+    def __init__(self, number):
+        self._number = number
+
+    def number(self):
+        return self._number
+
+
+def answer_to_json(answer):
+    """
+    :return: the answer as JSON-compatible lists, or None if it is of a kind the cache does not keep
+    """
+    if hasattr(answer, "number"):
+        return ["value", answer.number()]
+    if hasattr(answer, "map"):
+        concepts = {}
+        for var, concept in answer.map().items():
+            attribute = concept.is_attribute()
+            value = concept.value() if attribute else None
+            if not (value is None or isinstance(value, (str, int, float, bool))):
+                # Dates and other values that do not survive JSON
+                return None
+            concepts[var] = [concept.id, value, attribute]
+        return ["map", concepts]
+    return None
+
+
+def answer_from_json(cached):
+    kind, content = cached
+    if kind == "value":
+        return CachedValue(content)
+    return CachedConceptMap({
+        var: CachedConcept(concept_id, value, attribute) for var, (concept_id, value, attribute) in content.items()
+    })
+
+
+class QueryCache:
+    """
+    Read-through cache of the answers of the read queries, keyed by the server and keyspace, the id of the last load
+    of that keyspace, and the normalized query text. An in-memory LRU layer, bounded in entries and in bytes, sits in
+    front of an optional on-disk layer. The load ids are recorded in the migration state by every migration and restore:
+    a reload gives new concept ids even from the same csv files, so the answers of a keyspace are dropped as soon as its
+    load id changes. A keyspace without a recorded load is not cached, as there would be no way to tell when its
+    answers become stale.
+    """
+
+    def __init__(self, directory=QUERY_CACHE_DIR, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 state_path=MIGRATION_STATE_FILE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._state_path = state_path
+        self._lock = threading.Lock()
+        # (database key, load id, normalized query) -> (answers as JSON lists, size of their JSON text), least recently
+        # used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Size of the answers on disk, counted when the load ids are read and as answers are written
+        self._disk_bytes = 0
+        # Database key -> id of its last load
+        self._loads = {}
+        self._state_mtime = None
+        self._checked_at = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ===== Load ids =====
+
+    def marker(self, database):
+        """
+        :param database: database key of the transaction, see transaction_database
+        :return: the id of the last load of the keyspace the cached answers belong to, None if it cannot be cached
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= VERSION_CHECK_INTERVAL:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self._state_path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._state_mtime:
+                self._state_mtime = mtime
+                loads = migration_loads(self._state_path)
+                reloaded = set(database for database, load_id in self._loads.items() if loads.get(database) != load_id)
+                disk_bytes = self._prune_disk(loads)
+                with self._lock:
+                    self._disk_bytes = disk_bytes
+                    stale = [key for key in self._entries if key[0] in reloaded]
+                    if stale:
+                        self.invalidations += 1
+                    for key in stale:
+                        self._bytes -= self._entries.pop(key)[1]
+                    self._loads = loads
+        return self._loads.get(database)
+
+    def _database_directory(self, database):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]+", "_", database))
+
+    def _disk_path(self, database, marker, key):
+        return os.path.join(self._database_directory(database), marker, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _prune_disk(self, loads):
+        """
+        Delete the answers kept on disk for the earlier loads of the keyspaces, they can never be served again
+        :param loads: database key -> id of its last load
+        :return: the size of the answers left on disk, in bytes
+        """
+        if not self.directory:
+            return 0
+        for database, marker in loads.items():
+            directory = self._database_directory(database)
+            try:
+                load_directories = os.listdir(directory)
+            except OSError:
+                continue
+            for load_directory in load_directories:
+                if load_directory != marker:
+                    shutil.rmtree(os.path.join(directory, load_directory), ignore_errors=True)
+
+        disk_bytes = 0
+        for parent, directories, files in os.walk(self.directory):
+            for file_name in files:
+                try:
+                    disk_bytes += os.path.getsize(os.path.join(parent, file_name))
+                except OSError:
+                    pass
+        return disk_bytes
+
+    # ===== Lookups =====
+
+    def get(self, database, marker, key):
+        """
+        :param database: database key of the transaction
+        :param marker: load id of the keyspace, returned by marker(database)
+        :param key: normalized query
+        :return: the cached answers, or None
+        """
+        entry_key = (database, marker, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return [answer_from_json(cached) for cached in entry[0]]
+
+        if self.directory:
+            try:
+                with open(self._disk_path(database, marker, key)) as cache_file:
+                    stored = json.load(cache_file)
+                if stored["database"] == database and stored["query"] == key:
+                    self._remember(entry_key, stored["answers"])
+                    with self._lock:
+                        self.disk_hits += 1
+                    return [answer_from_json(cached) for cached in stored["answers"]]
+            except (OSError, ValueError, KeyError):
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, database, marker, key, answers):
+        """
+        Keep the answers of a query, if they can all be cached and the keyspace was not reloaded meanwhile
+        :param answers: list of the grakn answers
+        """
+        if marker is None or self.marker(database) != marker:
+            return
+        cached = []
+        for answer in answers:
+            as_json = answer_to_json(answer)
+            if as_json is None:
+                return
+            cached.append(as_json)
+        self._remember((database, marker, key), cached)
+
+        if self.directory:
+            path = self._disk_path(database, marker, key)
+            try:
+                data = json.dumps({"database": database, "query": key, "answers": cached})
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "w") as cache_file:
+                    cache_file.write(data)
+                os.replace(path + ".tmp", path)
+                with self._lock:
+                    self._disk_bytes += len(data.encode("utf-8"))
+            except OSError as error:
+                print("Could not save the query cache: " + str(error))
+
+    def _remember(self, key, cached):
+        size = len(json.dumps(cached))
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (cached, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ===== Sizing =====
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "loads": dict(self._loads),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def report(self):
+        stats = self.stats()
+        return ("Query cache : " + "%.0f" % (stats["hit_rate"] * 100) + " % hits (" + str(stats["hits"]) +
+                " in memory, " + str(stats["disk_hits"]) + " on disk, " + str(stats["misses"]) + " misses), " +
+                str(stats["entries"]) + " / " + str(stats["max_entries"]) + " entries, " +
+                "%.1f" % (stats["bytes"] / 1024) + " / " + "%.0f" % (stats["max_bytes"] / 1024) + " KB, " +
+                "%.1f" % (stats["disk_bytes"] / 1024) + " KB on disk, " +
+                str(stats["evictions"]) + " evictions, " + str(len(stats["loads"])) + " loaded keyspaces")
+
+
+QUERY_CACHE = QueryCache() if CACHING else None
@@ -0,0 +1,279 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import Counter, deque
+from query_cache import QUERY_CACHE, is_read_query, normalize_query, transaction_database
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# QUERY_PROFILE=0 turns the profiler off, execute_and_log then only runs the query
+PROFILING = os.environ.get("QUERY_PROFILE", "1") != "0"
+# Queries slower than this are kept in the slow query log and printed as they happen
+SLOW_QUERY_MS = float(os.environ.get("QUERY_SLOW_MS", "100"))
+# Written at exit, with the report printed on the console, when at least one query was run
+QUERY_PROFILE_FILE = os.environ.get("QUERY_PROFILE_FILE", "./query_profile.json")
+
+# A template run at least this many times is flagged in the report: the same query in a loop is usually an N+1
+REPEATED_QUERY_COUNT = 20
+# Latest durations kept per template for the percentiles, and latest slow queries kept
+LATENCY_SAMPLES = 10000
+SLOW_LOG_SIZE = 100
+
+# Literals replaced by ? in the templates: strings, concept ids and numbers
+_LITERALS = [
+    (re.compile(r'"(?:[^"\\]|\\.)*"'), '"?"'),
+    (re.compile(r"\bid\s+[A-Za-z0-9_-]+"), "id ?"),
+    (re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def query_template(query):
+    """
+    :return: the query with its literals stripped, so that the same query run for different stations is counted once
+    """
+    for pattern, replacement in _LITERALS:
+        query = pattern.sub(replacement, query)
+    return query.strip()
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class TemplateStats:
+    """
+    Every run of one query template
+    """
+    __slots__ = ("template", "count", "total", "answers", "durations", "callers")
+
+    def __init__(self, template):
+        self.template = template
+        self.count = 0
+        self.total = 0.0
+        self.answers = 0
+        self.durations = deque(maxlen=LATENCY_SAMPLES)
+        self.callers = Counter()
+
+    def summary(self):
+        durations = sorted(self.durations)
+        return {
+            "template": self.template,
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "p50_ms": percentile(durations, 0.50) * 1000,
+            "p95_ms": percentile(durations, 0.95) * 1000,
+            "p99_ms": percentile(durations, 0.99) * 1000,
+            "answers": self.answers,
+            "callers": dict(self.callers.most_common()),
+        }
+
+
+class QueryProfiler:
+    """
+    Time, answer count and caller of every Graql query run through execute_and_log, aggregated per query template
+    """
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+        # Number of queries covered by the last report
+        self.reported = 0
+
+    def record(self, query, seconds, answers, caller):
+        template = query_template(query)
+        with self._lock:
+            stats = self._templates.get(template)
+            if stats is None:
+                stats = self._templates[template] = TemplateStats(template)
+            stats.count += 1
+            stats.total += seconds
+            stats.answers += answers
+            stats.durations.append(seconds)
+            stats.callers[caller] += 1
+            slow = seconds * 1000 >= self.slow_query_ms
+            if slow:
+                self._slow_queries.append({
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "ms": seconds * 1000,
+                    "answers": answers,
+                    "caller": caller,
+                    "query": query,
+                })
+        if slow:
+            print("Slow query (" + "%.1f" % (seconds * 1000) + " ms, " + str(answers) + " answers) from " + caller +
+                  " : " + template)
+
+    def reset(self):
+        with self._lock:
+            self._templates = {}
+            self._slow_queries.clear()
+            self.reported = 0
+
+    def query_count(self):
+        with self._lock:
+            return sum(stats.count for stats in self._templates.values())
+
+    def summaries(self):
+        """
+        :return: the statistics of every template, the most expensive in total first
+        """
+        with self._lock:
+            templates = list(self._templates.values())
+            return sorted((stats.summary() for stats in templates), key=lambda summary: -summary["total_ms"])
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow_queries)
+
+    def report(self):
+        """
+        :return: the report as text, one block per template
+        """
+        summaries = self.summaries()
+        lines = ["===== Graql queries : " + str(sum(summary["count"] for summary in summaries)) + " runs of " +
+                 str(len(summaries)) + " templates ====="]
+        for summary in summaries:
+            caller, calls = next(iter(summary["callers"].items()))
+            lines.append(
+                "%6d x %9.1f ms   p50 %7.1f   p95 %7.1f   p99 %7.1f ms   %8d answers   %s (%d)" % (
+                    summary["count"], summary["total_ms"], summary["p50_ms"], summary["p95_ms"], summary["p99_ms"],
+                    summary["answers"], caller, calls
+                ) + ("   <- repeated, N+1 ?" if summary["count"] >= REPEATED_QUERY_COUNT else "")
+            )
+            lines.append("         " + summary["template"])
+        slow_queries = self.slow_queries()
+        if slow_queries:
+            lines.append("===== " + str(len(slow_queries)) + " queries slower than " + "%g" % self.slow_query_ms + " ms =====")
+            for slow in slow_queries:
+                lines.append(slow["time"] + "  " + "%9.1f ms" % slow["ms"] + "  " + slow["caller"] + "  " +
+                             query_template(slow["query"]))
+        if QUERY_CACHE is not None:
+            lines.append(QUERY_CACHE.report())
+        return "\n".join(lines)
+
+    def dump(self, path=QUERY_PROFILE_FILE):
+        """
+        Print the report, and write it to path as JSON
+        """
+        self.reported = self.query_count()
+        print(self.report())
+        if path:
+            try:
+                with open(path + ".tmp", "w") as profile_file:
+                    json.dump({"templates": self.summaries(), "slow_queries": self.slow_queries(),
+                               "slow_query_ms": self.slow_query_ms,
+                               "cache": QUERY_CACHE.stats() if QUERY_CACHE is not None else None}, profile_file, indent=1)
+                os.replace(path + ".tmp", path)
+                print("Query profile written to " + path)
+            except OSError as error:
+                print("Could not write the query profile: " + str(error))
+
+
+class ProfiledAnswers:
+    """
+    The answers of a query, timed as they are read: Grakn streams them, so the query is only done once they have all
+    been read. The time spent by the caller between two answers is not counted.
+    """
+
+    def __init__(self, profiler, query, caller, answers, elapsed):
+        self._profiler = profiler
+        self._query = query
+        self._caller = caller
+        self._answers = answers
+        self._elapsed = elapsed
+        self._count = 0
+        self._recorded = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            answer = next(self._answers)
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._record()
+            raise
+        self._elapsed += time.perf_counter() - start
+        self._count += 1
+        return answer
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            self._profiler.record(self._query, self._elapsed, self._count, self._caller)
+
+    def __del__(self):
+        # Answers that were not all read are still counted, with what was read
+        self._record()
+
+
+PROFILER = QueryProfiler()
+
+
+def _caller(depth):
+    frame = sys._getframe(depth + 1)
+    return os.path.basename(frame.f_code.co_filename) + ":" + frame.f_code.co_name + ":" + str(frame.f_lineno)
+
+
+def _run(query, transaction, depth):
+    if not PROFILING:
+        return transaction.query(query)
+    start = time.perf_counter()
+    answers = iter(transaction.query(query))
+    return ProfiledAnswers(PROFILER, query, _caller(depth + 1), answers, time.perf_counter() - start)
+
+
+def execute_and_log(query, transaction):
+    """
+    Run a Graql query, the single entry point of the scripts' queries, so that all of them are profiled. The answers of
+    read queries come from the query cache when it has them, and only the queries sent to Grakn are profiled.
+    :param transaction: only the transactions opened by grakn_connection.py are cached, as the cache must know their
+    keyspace
+    :return: the answers, to be iterated once
+    """
+    key = normalize_query(query)
+    database = transaction_database(transaction) if QUERY_CACHE is not None else None
+    marker = QUERY_CACHE.marker(database) if database is not None and is_read_query(key) else None
+    if marker is None:
+        return _run(query, transaction, 1)
+
+    answers = QUERY_CACHE.get(database, marker, key)
+    if answers is None:
+        # Every answer is read to fill the cache, they are then given to the caller as Grakn returned them
+        answers = list(_run(query, transaction, 1))
+        QUERY_CACHE.put(database, marker, key, answers)
+    return iter(answers)
+
+
+@atexit.register
+def _dump_at_exit():
+    # Only if queries were run since the last report, ex: from the hotkey of the map
+    if PROFILING and PROFILER.query_count() > PROFILER.reported:
+        PROFILER.dump()
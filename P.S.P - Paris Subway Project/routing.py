@@ -0,0 +1,315 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import math
+
+# Mean radius of the Earth, the same as data/route_distances.py
+EARTH_RADIUS_KM = 6371.009
+
+WEIGHTS = ["distance", "hops"]
+ALGORITHMS = ["astar", "dijkstra"]
+
+# Objectives of the transfer-aware routing: the cost of the rides plus a penalty per change of line, or the fewest
+# changes of line first and then the cheapest rides
+OBJECTIVES = ["penalty", "fewest_transfers"]
+# Default cost of a change of line, in the unit of the weight: a few minutes of walking and waiting are worth about
+# 2 km of riding, or 3 stops
+TRANSFER_PENALTIES = {"distance": 2.0, "hops": 3}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between two points given in degrees
+    :return: distance in kilometres
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def route_lengths(network):
+    """
+    Length of every route of the network in km: the distance loaded from Grakn, or the great-circle distance between
+    both ends when the route has none
+    :return: list indexed like network.edges
+    """
+    lengths = []
+    for edge in network.edges:
+        if edge.distance is not None:
+            lengths.append(edge.distance)
+        else:
+            beginning = network.stations[edge.beginning]
+            end = network.stations[edge.end]
+            lengths.append(haversine_km(beginning.lat, beginning.lon, end.lat, end.lon))
+    return lengths
+
+
+class Path:
+    """
+    A path through the network: the stations in order, the line taken for each hop and the total cost
+    """
+    __slots__ = ("stations", "lines", "cost")
+
+    def __init__(self, stations, lines, cost):
+        self.stations = stations
+        self.lines = lines
+        self.cost = cost
+
+    def concept_ids(self):
+        return [station.concept_id for station in self.stations]
+
+    def __len__(self):
+        return len(self.stations)
+
+
+class Leg:
+    """
+    Part of an itinerary ridden on a single line, from the station where the line is boarded to the one where it is left
+    """
+    __slots__ = ("line", "stations")
+
+    def __init__(self, line, stations):
+        self.line = line
+        self.stations = stations
+
+    def __repr__(self):
+        return "Leg(" + self.line + ", " + self.stations[0].name + " -> " + self.stations[-1].name + ")"
+
+
+class Itinerary:
+    """
+    A path through the network split into legs, one per line ridden
+    """
+    __slots__ = ("legs", "cost", "transfers")
+
+    def __init__(self, legs, cost, transfers):
+        self.legs = legs
+        self.cost = cost
+        self.transfers = transfers
+
+    def path(self):
+        """
+        :return: the same itinerary as a Path, with each station once
+        """
+        stations = [self.legs[0].stations[0]]
+        lines = []
+        for leg in self.legs:
+            stations.extend(leg.stations[1:])
+            lines.extend([leg.line] * (len(leg.stations) - 1))
+        return Path(stations, lines, self.cost)
+
+    def describe(self):
+        """
+        :return: one instruction per leg, ex: "Board M1 at La Defense, ride 5 stops to Charles De Gaulle Etoile"
+        """
+        instructions = []
+        for i, leg in enumerate(self.legs):
+            stops = len(leg.stations) - 1
+            instructions.append(
+                ("Board " if i == 0 else "Change to ") + leg.line + " at " + leg.stations[0].name + ", ride " +
+                str(stops) + (" stop" if stops == 1 else " stops") + " to " + leg.stations[-1].name
+            )
+        return instructions
+
+
+class Router:
+    """
+    Shortest paths computed locally over the routes of a NetworkModel, without any query to Grakn.
+    The weighted adjacency lists are built once per weight and reused by every search.
+    """
+
+    def __init__(self, network):
+        self._network = network
+        self._graphs = {}
+        self._expanded_graphs = {}
+        self._lengths = route_lengths(network)
+        self._longest_route_km = max(self._lengths) if self._lengths else 0
+
+    def graph(self, weight):
+        """
+        :param weight: "distance" (km) or "hops" (1 per route)
+        :return: for each station index, the list of (neighbour index, cost, line)
+        """
+        if weight not in WEIGHTS:
+            raise ValueError("Unknown weight " + str(weight) + ", expected one of " + ", ".join(WEIGHTS))
+        if weight not in self._graphs:
+            graph = [[] for station in self._network.stations]
+            for edge in self._network.edges:
+                cost = self._lengths[edge.index] if weight == "distance" else 1
+                graph[edge.beginning].append((edge.end, cost, edge.line))
+            self._graphs[weight] = graph
+        return self._graphs[weight]
+
+    def _heuristic(self, weight, destination):
+        """
+        Admissible estimate of the remaining cost: the straight line to the destination, counted in km for the
+        distance weight, or in number of the longest routes of the network for the hops weight
+        """
+        target = self._network.stations[destination]
+        scale = 1
+        if weight == "hops":
+            if not self._longest_route_km:
+                return lambda index: 0
+            scale = 1 / self._longest_route_km
+
+        def estimate(index):
+            station = self._network.stations[index]
+            return haversine_km(station.lat, station.lon, target.lat, target.lon) * scale
+        return estimate
+
+    def shortest_path(self, origin, destination, weight="distance", algorithm="astar"):
+        """
+        :param origin: index of the origin station in the network model
+        :param destination: index of the destination station
+        :param weight: "distance" or "hops"
+        :param algorithm: "astar" or "dijkstra", both return a path of the same cost
+        :return: a Path, or None if the destination cannot be reached
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError("Unknown algorithm " + str(algorithm) + ", expected one of " + ", ".join(ALGORITHMS))
+        graph = self.graph(weight)
+        estimate = self._heuristic(weight, destination) if algorithm == "astar" else (lambda index: 0)
+
+        costs = {origin: 0}
+        previous = {}
+        queue = [(estimate(origin), 0, origin)]
+        visited = set()
+        while queue:
+            priority, cost, index = heapq.heappop(queue)
+            if index == destination:
+                break
+            if index in visited:
+                continue
+            visited.add(index)
+            for neighbour, edge_cost, line in graph[index]:
+                new_cost = cost + edge_cost
+                if neighbour not in costs or new_cost < costs[neighbour]:
+                    costs[neighbour] = new_cost
+                    previous[neighbour] = (index, line)
+                    heapq.heappush(queue, (new_cost + estimate(neighbour), new_cost, neighbour))
+        else:
+            if destination not in costs:
+                return None
+
+        stations = [destination]
+        lines = []
+        while stations[-1] != origin:
+            index, line = previous[stations[-1]]
+            stations.append(index)
+            lines.append(line)
+        stations.reverse()
+        lines.reverse()
+        return Path([self._network.stations[index] for index in stations], lines, costs[destination])
+
+    def expanded_graph(self, weight):
+        """
+        The network where every node is a (station, line) pair, so that changing line at a station is an edge of its own.
+        It is built once per weight, the transfer penalty is only applied during the search.
+        :param weight: "distance" or "hops"
+        :return: the list of (station index, line) nodes, the rides out of every node as (node, cost), and the nodes
+                 of every station
+        """
+        if weight not in WEIGHTS:
+            raise ValueError("Unknown weight " + str(weight) + ", expected one of " + ", ".join(WEIGHTS))
+        if weight not in self._expanded_graphs:
+            nodes = []
+            node_index = {}
+            station_nodes = [[] for station in self._network.stations]
+            for edge in self._network.edges:
+                for station_index in (edge.beginning, edge.end):
+                    if (station_index, edge.line) not in node_index:
+                        node_index[(station_index, edge.line)] = len(nodes)
+                        station_nodes[station_index].append(len(nodes))
+                        nodes.append((station_index, edge.line))
+
+            rides = [[] for node in nodes]
+            for edge in self._network.edges:
+                cost = self._lengths[edge.index] if weight == "distance" else 1
+                rides[node_index[(edge.beginning, edge.line)]].append((node_index[(edge.end, edge.line)], cost))
+            self._expanded_graphs[weight] = (nodes, rides, station_nodes)
+        return self._expanded_graphs[weight]
+
+    def itinerary(self, origin, destination, weight="distance", objective="penalty", transfer_penalty=None):
+        """
+        Transfer-aware routing over the (station, line) graph
+        :param origin: index of the origin station in the network model
+        :param destination: index of the destination station
+        :param weight: "distance" or "hops", the cost of the rides
+        :param objective: "penalty" minimises the rides plus transfer_penalty per change of line, "fewest_transfers"
+                          minimises the number of changes first, then the rides
+        :param transfer_penalty: cost of a change of line in the unit of the weight, TRANSFER_PENALTIES by default
+        :return: an Itinerary, or None if the destination cannot be reached
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError("Unknown objective " + str(objective) + ", expected one of " + ", ".join(OBJECTIVES))
+        if transfer_penalty is None:
+            transfer_penalty = TRANSFER_PENALTIES[weight]
+        nodes, rides, station_nodes = self.expanded_graph(weight)
+
+        def priority(cost, transfers):
+            if objective == "fewest_transfers":
+                return (transfers, cost)
+            return (cost + transfer_penalty * transfers, transfers)
+
+        # Every line of the origin can be boarded for free
+        best = {}
+        previous = {}
+        queue = []
+        for node in station_nodes[origin]:
+            best[node] = priority(0, 0)
+            heapq.heappush(queue, (best[node], 0, 0, node))
+
+        visited = set()
+        arrival = None
+        while queue:
+            key, cost, transfers, node = heapq.heappop(queue)
+            if node in visited:
+                continue
+            visited.add(node)
+            station_index, line = nodes[node]
+            if station_index == destination:
+                arrival = (node, cost, transfers)
+                break
+
+            steps = [(neighbour, cost + ride_cost, transfers) for neighbour, ride_cost in rides[node]]
+            steps += [(other, cost, transfers + 1) for other in station_nodes[station_index] if other != node]
+            for neighbour, new_cost, new_transfers in steps:
+                new_key = priority(new_cost, new_transfers)
+                if neighbour not in best or new_key < best[neighbour]:
+                    best[neighbour] = new_key
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (new_key, new_cost, new_transfers, neighbour))
+
+        if arrival is None:
+            return None
+
+        node, cost, transfers = arrival
+        path = [node]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+
+        # A change of line is a step between two nodes of the same station: it closes the current leg and opens a new
+        # one. A leg that is closed before reaching another station was never ridden and is dropped.
+        legs = []
+        for node in path:
+            station_index, line = nodes[node]
+            station = self._network.stations[station_index]
+            if legs and legs[-1].line == line:
+                legs[-1].stations.append(station)
+            else:
+                legs.append(Leg(line, [station]))
+        ridden = [leg for leg in legs if len(leg.stations) > 1] or legs[:1]
+        return Itinerary(ridden, cost, len(ridden) - 1)
@@ -0,0 +1,56 @@
+# Copyright 2020 Grakn Labs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+
+class GridIndex:
+    """
+    Uniform grid over a set of points: every point is stored in the square cell that contains it, so that the points
+    near a position are found by looking at a handful of cells instead of at every point.
+    """
+
+    def __init__(self, points, cell_size):
+        """
+        :param points: list of (x, y), the position of a point in the list is the value returned by nearest
+        :param cell_size: side of a cell, in the unit of the coordinates
+        """
+        self.cell_size = cell_size
+        self._points = points
+        self._cells = {}
+        for index, (x, y) in enumerate(points):
+            self._cells.setdefault(self._cell(x, y), []).append(index)
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def nearest(self, x, y, radius, accept=None):
+        """
+        :param radius: largest distance to the point, in the unit of the coordinates
+        :param accept: optional function of a point index, points for which it returns False are skipped
+        :return: index of the nearest point within radius of (x, y), or None
+        """
+        column, row = self._cell(x, y)
+        reach = int(math.ceil(radius / self.cell_size))
+        best = None
+        best_distance = radius * radius
+        for i in range(column - reach, column + reach + 1):
+            for j in range(row - reach, row + reach + 1):
+                for index in self._cells.get((i, j), ()):
+                    point_x, point_y = self._points[index]
+                    distance = (point_x - x) ** 2 + (point_y - y) ** 2
+                    if distance <= best_distance and (accept is None or accept(index)):
+                        best = index
+                        best_distance = distance
+        return best
@@ -12,13 +12,44 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from grakn.client import GraknClient
+from grakn_connection import get_connection
+from network_model import NetworkModel
+from path_tables import PathTables
+from query_profiler import execute_and_log
+from routing import Router
 import sys
 from fuzzywuzzy import fuzz
 from fuzzywuzzy import process
 import time  
 
 
+# The network is loaded once from Grakn, the questions then look stations up and find paths in memory
+network = None
+router = None
+path_tables = None
+
+
+def get_network(transaction):
+    global network
+    if network is None:
+        network = NetworkModel.from_transaction(transaction)
+    return network
+
+
+def get_path_tables(transaction):
+    global path_tables
+    if path_tables is None:
+        path_tables = PathTables.load_or_build(get_network(transaction), "distance")
+    return path_tables
+
+
+def get_router(transaction):
+    global router
+    if router is None:
+        router = Router(get_network(transaction))
+    return router
+
+
 def print_to_log(title, content):
   print(title)
   print("")
@@ -34,7 +65,7 @@ def query_station_count(question, transaction):
 
     print_to_log("Query:", query)
 
-    answer = list(transaction.query(query))[0]
+    answer = list(execute_and_log(query, transaction))[0]
     number_of_stations = answer.number()
 
     print("Number of stations: " + str(number_of_stations))
@@ -42,18 +73,9 @@ def query_station_count(question, transaction):
     return number_of_stations
 
 
-def correspondance(mot_a_comparer) :
-    liste_station = []
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace="paris_subway") as session:
-            with session.transaction().read() as transaction:
-                
-                query = 'match $sta isa station, has name $name;get $name;'
-                origin_iterator = execute_and_log(query,transaction)
-                for i in origin_iterator : 
-                    name = i.get("name").value()
-                    liste_station.append(name)
-    
+def correspondance(mot_a_comparer, network) :
+    liste_station = network.names()
+
     correspondance = process.extract(mot_a_comparer,liste_station)
     corres = correspondance[0]
     corres = corres[0]
@@ -69,7 +91,7 @@ def query_northernmost_station(question, transaction):
 
     print_to_log("Query:", query)
 
-    answer = list(transaction.query(query))[0]
+    answer = list(execute_and_log(query, transaction))[0]
     lat = answer.number()
 
     query = [
@@ -82,7 +104,7 @@ def query_northernmost_station(question, transaction):
     print_to_log("Query:", "\n".join(query))
     query = "".join(query)
 
-    answers = [ans.get("nam") for ans in transaction.query(query)]
+    answers = [ans.get("nam") for ans in execute_and_log(query, transaction)]
     result = [answer.value() for answer in answers]
 
     print_to_log("Northmost stations with " + str(lat) + " are: ", result)
@@ -90,77 +112,79 @@ def query_northernmost_station(question, transaction):
     return [lat, result]
 
 
-def execute_and_log(query, transaction):
-    response = transaction.query(query)
-    return response
-
-# Give the shortest path between two stations
-def query_path_between_stations(question, transaction) : 
-
-
+def ask_stations(network):
     name11 = input("Rentrez le nom de la station d'origine : ")
     name22 = input("Rentrez le nom de la station d'arrivée : ")
-    name1 = correspondance(name11)
-    name2 = correspondance(name22)
+    name1 = correspondance(name11, network)
+    name2 = correspondance(name22, network)
     print("Correspondance dans la db : " + name11 + " -> " + name1)
     print("Correspondance dans la db : " + name22 + " -> " + name2)
 
-    query = ' match $sta isa station, has name "' + name1 + '";get $sta;'
-    origin_iterator = execute_and_log(query,transaction)
-    for i in origin_iterator : 
-        id1 = i.get("sta")
-        id1 = id1.id
-        print("ID de la station d'origine : " + id1)
+    origin = network.station_named(name1)
+    print("ID de la station d'origine : " + origin.concept_id)
+    destination = network.station_named(name2)
+    print("ID de la station de destination : " + destination.concept_id)
+    return origin, destination
+
+
+# Give the shortest path between two stations
+def query_path_between_stations(question, transaction) : 
+
 
-    query = ' match $sta isa station, has name "' + name2 + '";get $sta;'
-    origin_iterator = execute_and_log(query,transaction)
-    for i in origin_iterator : 
-        id2 = i.get("sta")
-        id2 = id2.id
-        print("ID de la station de destination : " + id2)
+    network = get_network(transaction)
+    origin, destination = ask_stations(network)
 
-    tmps1=time.clock()
+    tmps1=time.perf_counter()
 
     print("Patientez pendant que je recherche un itinéraire...")
-    shortest_path_ids = []
-    query = 'compute path from ' + id1 + ', to ' + id2 + ';'
-    shortest_path_concept_list = list(execute_and_log(query, transaction))[0]
-    for shortest_path_node_id in shortest_path_concept_list.list():
-                    concepts_list= list(transaction.query("match $sta id " + shortest_path_node_id + "; $sta has name $nam; get;"))
-                    if len(concepts_list) > 0:
-                        concept = concepts_list[0]
-                        if concept.map().get("sta").type().label() == 'station':
-                            shortest_path_ids.append(shortest_path_node_id)
-    
-    liste_name = []
-    liste_ligne = []
-    print("Nomnbre de stations à parcourir : " + f"{len(shortest_path_ids)}")
-    for i in range(0,len(shortest_path_ids)) :
-        query = 'match $sta id ' + shortest_path_ids[i] + ', has name $name;get $name;'
-        if i+1 < len(shortest_path_ids) :
-            id1 = shortest_path_ids[i]
-            id2 = shortest_path_ids[i+1]
-            query2 = ' match $sta1 id '+ id1 +'; $sta2 id '+id2+';  $route ($sta1 , $sta2 ) isa route, has station_ligne $ligne; get $ligne ;'
-            iterator = execute_and_log(query2,transaction)
-            for y in iterator :
-                ligne = y.get('ligne').value()
-                liste_ligne.append(ligne)
-                
+    # Le chemin est lu dans les tables des plus courts chemins précalculées, avec la ligne empruntée à chaque station
+    path = get_path_tables(transaction).path(origin.index, destination.index)
+    if path is None:
+        print("CHEMIN NON TROUVÉ / NON DISPONIBLE")
+        return
+
+    print("Nomnbre de stations à parcourir : " + f"{len(path)}")
+    print("Longueur du trajet : " + "%.2f" % path.cost + " km")
+    ligne = ""
+    for i, station in enumerate(path.stations) :
+        # La ligne affichée est celle empruntée pour rejoindre la station suivante
+        if i < len(path.lines) :
+            ligne = path.lines[i]
+        print(station.name)
+        sys.stdout.write('  |')
+        print("    "+ligne)
+    tmps2=time.perf_counter()
+    print (f"Temps d'execution = {(tmps2-tmps1)} s")
+
+    print("DESTINATION ATTEINTE")
+
+
+# Give an itinerary between two stations, with the changes of line
+def query_itinerary_between_stations(question, transaction, objective="penalty") :
 
-        origin_iterator = execute_and_log(query,transaction)
-        for j in origin_iterator :
-            name = j.get('name').value()
-            print(name)
-            sys.stdout.write('  |')
-            total = len(liste_ligne)
-            print("    "+liste_ligne[total-1])
-            liste_name.append(name)
-    tmps2=time.clock()
+    network = get_network(transaction)
+    origin, destination = ask_stations(network)
+
+    tmps1=time.perf_counter()
+    # Chaque changement de ligne coûte TRANSFER_PENALTIES["distance"] km, ou passe avant tout avec "fewest_transfers"
+    itinerary = get_router(transaction).itinerary(origin.index, destination.index, objective=objective)
+    tmps2=time.perf_counter()
+    if itinerary is None:
+        print("CHEMIN NON TROUVÉ / NON DISPONIBLE")
+        return
+
+    print("Longueur du trajet : " + "%.2f" % itinerary.cost + " km, " + str(itinerary.transfers) + " changement(s)")
+    for instruction in itinerary.describe():
+        print("  " + instruction)
     print (f"Temps d'execution = {(tmps2-tmps1)} s")
 
     print("DESTINATION ATTEINTE")
 
 
+def query_fewest_transfers_between_stations(question, transaction) :
+    query_itinerary_between_stations(question, transaction, objective="fewest_transfers")
+
+
 
 
 
@@ -184,28 +208,35 @@ query_examples = [
     {
         "question": "Get a path between two stations",
         "query_function" : query_path_between_stations
+    },
+    {
+        "question": "Get an itinerary between two stations, avoiding changes of line",
+        "query_function" : query_itinerary_between_stations
+    },
+    {
+        "question": "Get the itinerary with the fewest changes of line between two stations",
+        "query_function" : query_fewest_transfers_between_stations
     }
 ]
 
 def init(qs_number):
     # create a transaction to talk to the keyspace
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace="paris_subway") as session:
-            with session.transaction().read() as transaction:
-                # execute the query for the selected question
-                if qs_number == 0:
-                    execute_query_all(transaction)
-                else:
-                    question = query_examples[qs_number - 1]["question"]
-                    query_function = query_examples[qs_number - 1]["query_function"]
-                    query_function(question, transaction)
+    with get_connection() as connection:
+        with connection.read() as transaction:
+            # execute the query for the selected question
+            if qs_number == 0:
+                execute_query_all(transaction)
+            else:
+                question = query_examples[qs_number - 1]["question"]
+                query_function = query_examples[qs_number - 1]["query_function"]
+                query_function(question, transaction)
 
 if __name__ == "__main__":
 
     """
         The code below:
         - gets user's selection wrt the queries to be executed
-        - creates a Grakn client > session > transaction connected to the keyspace
+        - opens a read transaction on the keyspace through the shared connection of grakn_connection.py
         - runs the right function based on the user's selection
         - closes the session and transaction
     """